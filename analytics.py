@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 预估精度分析模块
+按列加载任务记录，用 NumPy / pandas 向量化计算超时分布、分位误差、分组统计和连续打卡
+"""
+
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# 超时比例（实际 / 计划）分布的分箱边界
+RATIO_BINS = [0, 0.5, 0.8, 1.0, 1.2, 1.5, 2.0, np.inf]
+RATIO_LABELS = ["<0.5", "0.5-0.8", "0.8-1.0", "1.0-1.2", "1.2-1.5", "1.5-2.0", ">2.0"]
+PERCENTILES = (50, 90, 99)
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_records(conn) -> pd.DataFrame:
+    """按列加载任务记录（附带计划日期和任务优先级）"""
+    return pd.read_sql_query('''
+        SELECT
+            tr.id,
+            p.date,
+            tr.scheduled_minutes,
+            tr.actual_minutes,
+            tr.focus_level,
+            tr.completed,
+            pt.priority
+        FROM task_records tr
+        JOIN plans p ON tr.plan_id = p.id
+        LEFT JOIN plan_tasks pt ON pt.id = tr.plan_task_id
+    ''', conn)
+
+
+def _percentiles(values: np.ndarray) -> dict:
+    if values.size == 0:
+        return {f"p{q}": 0.0 for q in PERCENTILES}
+    return {f"p{q}": float(v) for q, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def _breakdown(df: pd.DataFrame, column: str) -> list:
+    """按某一列分组统计数量、平均超时比例、误差分位和完成率"""
+    valid = df.dropna(subset=[column])
+    if valid.empty:
+        return []
+    grouped = valid.groupby(column)
+    result = pd.DataFrame({
+        'count': grouped.size(),
+        'mean_ratio': grouped['ratio'].mean(),
+        'p50_error': grouped['error'].quantile(0.5),
+        'p90_error': grouped['error'].quantile(0.9),
+        'completion_rate': grouped['completed'].mean() * 100,
+    }).reset_index().rename(columns={column: 'group'})
+    return result.fillna(0).to_dict('records')
+
+
+def _streaks(dates: pd.Series) -> dict:
+    """连续有完成记录的天数：当前连续天数与历史最长"""
+    if dates.empty:
+        return {'current': 0, 'longest': 0, 'active_days': 0, 'last_day': None}
+    days = np.unique(pd.to_datetime(dates).values.astype('datetime64[D]').astype(np.int64))
+    # 相邻日期差不为 1 的位置开启新的连续段
+    breaks = np.concatenate(([True], np.diff(days) != 1))
+    run_ids = np.cumsum(breaks)
+    run_lengths = np.bincount(run_ids)[1:]
+    # 最后一天早于昨天时，当前连续记录已中断；日期是本地日期，today 也按本地时间取
+    today = np.datetime64(date.today(), 'D').astype(np.int64)
+    return {
+        'current': int(run_lengths[-1]) if today - days[-1] <= 1 else 0,
+        'longest': int(run_lengths.max()),
+        'active_days': int(days.size),
+        'last_day': str(np.datetime64(int(days[-1]), 'D')),
+    }
+
+
+def compute_report(df: pd.DataFrame) -> dict:
+    """根据任务记录计算预估精度报告"""
+    scheduled = df['scheduled_minutes'].to_numpy(dtype=float, na_value=np.nan)
+    actual = df['actual_minutes'].to_numpy(dtype=float, na_value=np.nan)
+    valid = (scheduled > 0) & ~np.isnan(actual)
+
+    df = df.assign(
+        ratio=np.where(valid, actual / np.where(scheduled > 0, scheduled, 1), np.nan),
+        error=np.where(valid, actual - scheduled, np.nan),
+        completed=df['completed'].fillna(0).astype(float),
+    )
+    measured = df[valid]
+    ratios = measured['ratio'].to_numpy()
+    errors = measured['error'].to_numpy()
+
+    counts, _ = np.histogram(ratios, bins=RATIO_BINS)
+
+    return {
+        'record_count': int(len(df)),
+        'measured_count': int(valid.sum()),
+        'mean_ratio': float(ratios.mean()) if ratios.size else 0.0,
+        'overrun_share': float((ratios > 1.0).mean() * 100) if ratios.size else 0.0,
+        'ratio_distribution': dict(zip(RATIO_LABELS, counts.tolist())),
+        'error_percentiles': _percentiles(errors),
+        'abs_error_percentiles': _percentiles(np.abs(errors)),
+        'by_priority': _breakdown(measured, 'priority'),
+        'by_focus': _breakdown(measured, 'focus_level'),
+        'streaks': _streaks(df.loc[df['completed'] > 0, 'date']),
+    }
+
+
+def get_report(conn, cache_key) -> dict:
+    """获取预估精度报告；cache_key（数据库 + 数据版本）不变时直接返回缓存"""
+    db_key, version = cache_key
+    with _cache_lock:
+        cached = _cache.get(db_key)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    report = compute_report(load_records(conn))
+    with _cache_lock:
+        _cache[db_key] = (version, report)
+    return report
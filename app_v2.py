@@ -11,15 +11,20 @@ import plotly.graph_objects as go
 import plotly.express as px
 import json
 import os
+import tempfile
 from datetime import datetime, timedelta
 import time
 import math
-from data_manager import (
-    init_database, save_plan, save_task_record, get_latest_plan,
-    get_today_plan, get_all_plans, get_plan_records, update_plan_status,
-    get_statistics, export_to_csv
-)
+from storage import get_storage
+from profile_manager import DEFAULT_PROFILE
+from exporter import EXPORT_TABLES, FORMATS, default_filename
 from config_manager import ConfigManager
+import llm_cache
+import llm_worker
+import llm_resilience
+import offline_planner
+import stream_json
+import chat_context
 
 # ============================================
 # 页面配置
@@ -153,14 +158,58 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ============================================
-# 初始化数据库和 Session State
+# 初始化存储和 Session State
 # ============================================
-init_database()
-
 # 初始化配置管理器
 if 'config_manager' not in st.session_state:
     st.session_state.config_manager = ConfigManager()
 
+# 存储后端（config.json 中的 storage_backend: sqlite / memory，默认 sqlite）
+store = get_storage(st.session_state.config_manager.get('storage_backend'))
+
+# SQL 耗时记录（query_profiling 默认开启；slow_query_ms 为慢查询阈值，超过的连同查询计划写入日志）
+store.set_query_profiling(
+    st.session_state.config_manager.get('query_profiling', True),
+    st.session_state.config_manager.get('slow_query_ms', 100)
+)
+# 本次 rerun 开始时的 SQL 累计值，页面末尾相减得到这次 rerun 花在数据库上的时间
+sql_totals_at_start = store.get_query_totals()
+
+# AI 响应缓存（llm_cache_ttl_hours 默认 168 小时，llm_cache_max_entries 默认 200；内存后端不落盘）
+response_cache = llm_cache.get_cache(':memory:' if store.name == 'memory' else llm_cache.CACHE_FILE)
+response_cache.configure(
+    ttl_seconds=st.session_state.config_manager.get('llm_cache_ttl_hours', 168) * 3600,
+    max_entries=st.session_state.config_manager.get('llm_cache_max_entries', 200)
+)
+
+# AI 调用容错（llm_deadlines 按调用类型覆盖总时限秒数；llm_max_retries、llm_hedging、
+# llm_breaker_threshold、llm_breaker_reset_seconds 分别控制重试次数、对冲请求和熔断）
+resilient_llm = llm_resilience.get_resilient()
+resilient_llm.configure(
+    deadlines=st.session_state.config_manager.get('llm_deadlines'),
+    max_retries=st.session_state.config_manager.get('llm_max_retries', llm_resilience.DEFAULT_MAX_RETRIES),
+    hedge=st.session_state.config_manager.get('llm_hedging', True),
+    failure_threshold=st.session_state.config_manager.get('llm_breaker_threshold', llm_resilience.BREAKER_FAILURE_THRESHOLD),
+    reset_seconds=st.session_state.config_manager.get('llm_breaker_reset_seconds', llm_resilience.BREAKER_RESET_SECONDS)
+)
+
+# 用户档案：每个用户使用独立的数据库（可通过 ?user=名字 直接指定）
+if 'profile' not in st.session_state:
+    st.session_state.profile = st.query_params.get('user', DEFAULT_PROFILE)
+try:
+    st.session_state.profile = store.use_profile(st.session_state.profile)
+except ValueError:
+    st.session_state.profile = store.use_profile(DEFAULT_PROFILE)
+
+# 历史保留天数（config.json 中的 retention_days，未设置则不归档）
+store.set_retention(st.session_state.config_manager.get('retention_days'))
+
+# 定时热备份（backup_interval_hours 默认 24 小时，设为 0 关闭；backup_keep 为保留份数）
+store.schedule_backups(
+    st.session_state.config_manager.get('backup_interval_hours', 24),
+    st.session_state.config_manager.get('backup_keep', 7)
+)
+
 def init_session_state():
     if 'client' not in st.session_state:
         st.session_state.client = None
@@ -178,6 +227,9 @@ def init_session_state():
         st.session_state.current_task_idx = 0
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
+    # 对话滚动摘要：text 为摘要，covered 为已并入摘要的 chat_history 条数
+    if 'chat_summary' not in st.session_state:
+        st.session_state.chat_summary = {'text': "", 'covered': 0}
     if 'start_time' not in st.session_state:
         st.session_state.start_time = None
     if 'total_seconds' not in st.session_state:
@@ -191,26 +243,63 @@ def init_session_state():
         st.session_state.task_start_times = {}  # {task_idx: start_time}
     if 'task_times' not in st.session_state:
         st.session_state.task_times = {}  # {task_idx: actual_time}
+    # AI 调用耗时（首字延迟 / 总耗时），最近 50 次
+    if 'llm_timings' not in st.session_state:
+        st.session_state.llm_timings = []
+    # 本会话进行中的后台 AI 任务 {类型: 任务 id} 和失败信息 {类型: 错误}
+    if 'llm_jobs' not in st.session_state:
+        st.session_state.llm_jobs = {}
+    if 'llm_errors' not in st.session_state:
+        st.session_state.llm_errors = {}
 
 init_session_state()
 
+def switch_profile():
+    """切换用户档案，并清空上一个用户的计划和执行状态"""
+    try:
+        name = store.use_profile(st.session_state.profile_input)
+    except ValueError as e:
+        st.session_state.profile_error = str(e)
+        return
+    st.session_state.profile_error = None
+    if name == st.session_state.profile:
+        return
+    st.session_state.profile = name
+    st.query_params['user'] = name
+    cancel_llm_jobs()
+    export_file = st.session_state.get('export_file')
+    if export_file and os.path.exists(export_file[0]):
+        os.remove(export_file[0])
+    for key in ('plan', 'optimized_plan', 'executing', 'current_task_idx', 'chat_history', 'chat_summary',
+                'start_time', 'total_seconds', 'plan_data', 'current_plan_id',
+                'task_start_times', 'task_times', 'export_file', 'history_cursors',
+                'history_filters', 'plan_source', 'llm_errors'):
+        st.session_state.pop(key, None)
+
 # ============================================
 # DeepSeek API 配置
 # ============================================
 # ============================================
 # DeepSeek API 配置
 # ============================================
+DEEPSEEK_MODEL = "deepseek-chat"
+
+# 计划优化提示词版本：修改输出格式等不兼容的改动时递增，旧的缓存结果随之失效
+OPTIMIZE_PROMPT_VERSION = "v1"
+
 def configure_deepseek(api_key: str) -> bool:
     """配置 DeepSeek API 并保存到本地"""
     try:
         client = OpenAI(
             api_key=api_key,
-            base_url="https://api.deepseek.com"
+            base_url="https://api.deepseek.com",
+            max_retries=0  # 重试由 llm_resilience 统一处理
         )
         response = client.chat.completions.create(
             model="deepseek-chat",
             messages=[{"role": "user", "content": "Hi"}],
-            max_tokens=10
+            max_tokens=10,
+            timeout=15
         )
         st.session_state.client = client
         st.session_state.api_configured = True
@@ -231,7 +320,8 @@ def auto_configure_deepseek():
         try:
             client = OpenAI(
                 api_key=api_key,
-                base_url="https://api.deepseek.com"
+                base_url="https://api.deepseek.com",
+                max_retries=0  # 重试由 llm_resilience 统一处理
             )
             st.session_state.client = client
             st.session_state.api_configured = True
@@ -241,30 +331,289 @@ def auto_configure_deepseek():
             return False
     return False
 
-def call_deepseek(messages: list, temperature=0.7) -> str:
-    """调用 DeepSeek API"""
+# 页面下载导出文件的大小上限（MB）：st.download_button 会把文件整个读入内存
+EXPORT_DOWNLOAD_MAX_MB = 50
+
+# 后台 AI 任务进行中时，页面轮询进度的间隔（秒）
+LLM_POLL_INTERVAL = 0.5
+
+def record_llm_timing(kind: str, timing: dict):
+    """记录一次 AI 调用的首字延迟和总耗时"""
+    timings = st.session_state.llm_timings
+    timings.append(dict(timing, kind=kind, at=datetime.now().strftime('%H:%M:%S')))
+    del timings[:-50]
+
+def last_llm_timing(kind: str):
+    """某类调用最近一次的耗时记录"""
+    for timing in reversed(st.session_state.get('llm_timings', [])):
+        if timing['kind'] == kind:
+            return timing
+    return None
+
+def format_llm_timing(timing: dict) -> str:
+    if timing is None:
+        return ""
+    if timing.get('fallback'):
+        return f"⚠️ AI 暂不可用，已使用备用方案（{timing['fallback']}）"
+    if timing.get('stream'):
+        text = f"⏱️ 首字 {timing['ttft']:.2f}s · 完成 {timing['total']:.1f}s · {timing['chars']} 字"
+    else:
+        text = f"⏱️ 耗时 {timing['total']:.1f}s"
+    if timing.get('retries'):
+        text += f" · 重试 {timing['retries']} 次"
+    if timing.get('hedges'):
+        text += " · 对冲请求"
+    if timing.get('context_tokens'):
+        text += f" · 上下文约 {timing['context_tokens']} tokens"
+    if timing.get('context_truncated'):
+        text += " · 消息过长已截断"
+    return text
+
+def stream_deepseek(client, messages: list, temperature: float, timing: dict, kind: str = "chat"):
+    """
+    流式调用 DeepSeek，逐段产出文本；timing 中记录首字延迟 ttft 和总耗时 total（秒）
+    
+    经 llm_resilience 按 kind 的时限、重试、对冲和熔断策略执行，不可用时抛出 LLMUnavailable
+    """
+    started = time.perf_counter()
+    response = resilient_llm.stream(
+        client, kind, info=timing,
+        model=DEEPSEEK_MODEL,
+        messages=messages,
+        temperature=temperature
+    )
+    chars = 0
+    for chunk in response:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            if 'ttft' not in timing:
+                timing['ttft'] = time.perf_counter() - started
+            chars += len(delta)
+            yield delta
+    timing['total'] = time.perf_counter() - started
+    timing.setdefault('ttft', timing['total'])
+    timing['chars'] = chars
+
+def call_deepseek(messages: list, temperature=0.7, kind="chat") -> str:
+    """调用 DeepSeek API（同步，等待完整回复）；耗时按 kind 记录到 llm_timings"""
     if not st.session_state.api_configured:
         raise Exception("API 未配置")
     
     try:
-        response = st.session_state.client.chat.completions.create(
-            model="deepseek-chat",
+        started = time.perf_counter()
+        timing = {'stream': False}
+        response = resilient_llm.complete(
+            st.session_state.client, kind, info=timing,
+            model=DEEPSEEK_MODEL,
             messages=messages,
             temperature=temperature,
             stream=False
         )
+        timing['total'] = time.perf_counter() - started
+        record_llm_timing(kind, timing)
         return response.choices[0].message.content
     except Exception as e:
         raise Exception(f"API 调用失败: {str(e)}")
 
 # ============================================
-# 核心功能：激进的计划优化
+# 后台 AI 任务
+# 任务在进程共用的线程池中执行（不能调用 st），页面只提交任务并在之后的 rerun 中取结果，
+# 等待 API 期间计时器和按钮照常响应
 # ============================================
-def optimize_plan_aggressive(user_plan: str) -> dict:
+def run_llm_job(job, client, messages: list, temperature: float, on_delta=None) -> str:
+    """后台任务：流式调用 DeepSeek，生成的文本实时写入 job.text；on_delta(片段) 用于边收边解析"""
+    job.timing = {'stream': True}
+    try:
+        for delta in stream_deepseek(client, messages, temperature, job.timing, kind=job.kind):
+            if job.cancelled:
+                break
+            job.append(delta)
+            if on_delta is not None:
+                on_delta(delta)
+    except llm_resilience.LLMUnavailable:
+        raise
+    except Exception as e:
+        raise Exception(f"API 调用失败: {str(e)}")
+    return job.text
+
+# AI 不可用（超时或熔断）时对话的备用回复
+CHAT_FALLBACK_REPLY = "AI 暂时无法响应。不要停下：先按当前任务的方法推进，稍后再来调整方案。"
+
+def run_chat_job(job, client, system_prompt: str, history: list, summary: dict,
+                 budget: int, keep_turns: int, temperature: float) -> dict:
     """
-    激进优化计划 - 极限压榨时间
+    后台任务：实时对话，返回 {'reply': 回复, 'fallback': AI 是否不可用}
+    
+    请求只带摘要和最近 keep_turns 轮原文（不超过 budget tokens）；摘要还没覆盖到的更早对话也带原文。
+    回复生成完就返回，滑出窗口的对话由取回回复后单独提交的 summary 任务并入摘要。AI 不可用时返回已生成的部分或备用回复
+    """
+    messages, context = chat_context.build_messages(system_prompt, history, summary['text'], budget, keep_turns,
+                                                    covered=summary['covered'])
+    fallback = False
+    try:
+        reply = run_llm_job(job, client, messages, temperature)
+    except llm_resilience.LLMUnavailable as e:
+        job.timing = {'fallback': str(e)}
+        fallback = True
+        reply = job.text + "\n\n（回复超时，已截断）" if job.text else CHAT_FALLBACK_REPLY
+    job.timing['context_tokens'] = context['tokens']
+    if context['truncated']:
+        job.timing['context_truncated'] = True
+    return {'reply': reply, 'fallback': fallback}
+
+def run_summary_job(job, client, summary: dict, pending: list, covered: int, max_tokens: int) -> dict:
+    """后台任务：把滑出窗口的对话并入滚动摘要，返回新的 {'text', 'covered'}；AI 失败时按句截取"""
+    def summarize(summary_messages):
+        response = resilient_llm.complete(
+            client, "summary",
+            model=DEEPSEEK_MODEL,
+            messages=summary_messages,
+            temperature=0.3
+        )
+        return response.choices[0].message.content
+    
+    text, _ = chat_context.update_summary(summary['text'], pending, max_tokens, summarize)
+    return {'text': text, 'covered': covered}
+
+def chat_context_settings() -> tuple:
+    """对话上下文预算（chat_context_tokens，默认 1500）和原文保留轮数（chat_keep_turns，默认 3）"""
+    config = st.session_state.config_manager
+    return (config.get('chat_context_tokens', chat_context.DEFAULT_TOKEN_BUDGET),
+            config.get('chat_keep_turns', chat_context.DEFAULT_KEEP_TURNS))
+
+def update_chat_summary(use_ai: bool = True):
     """
-    system_prompt = """你是一个极端的时间优化大师,代号'时间杀手'。你的目标是将用户的计划疯狂优化,让他们的每一秒都用于学习和成长。
+    把下次请求时将滑出最近 N 轮的对话并入摘要
+    
+    AI 压缩在后台 summary 任务中进行，同一时间只有一个；已有摘要任务在进行时先不提交，
+    它完成后再接着压缩期间新滑出的对话。AI 不可用时当场按句截取
+    """
+    if 'summary' in st.session_state.llm_jobs:
+        return
+    budget, keep_turns = chat_context_settings()
+    summary = st.session_state.chat_summary
+    pending, covered = chat_context.pending_for_summary(st.session_state.chat_history, summary['covered'], keep_turns)
+    if not pending:
+        return
+    if use_ai:
+        try:
+            submit_llm_job("summary", run_summary_job, dict(summary), pending, covered, budget // 4)
+            return
+        except Exception:
+            pass
+    st.session_state.chat_summary = {
+        'text': chat_context.extractive_summary(summary['text'], pending, budget // 4),
+        'covered': covered,
+    }
+
+def submit_llm_job(kind: str, func, *args):
+    """提交后台 AI 任务；同类任务每个会话只保留一个，未完成的旧任务会被取消"""
+    if not st.session_state.api_configured:
+        raise Exception("API 未配置")
+    worker = llm_worker.get_worker()
+    previous = st.session_state.llm_jobs.get(kind)
+    if previous:
+        worker.cancel(previous)
+    job = worker.submit(kind, func, st.session_state.client, *args)
+    st.session_state.llm_jobs[kind] = job.id
+    st.session_state.llm_errors.pop(kind, None)
+    return job
+
+def cancel_llm_jobs():
+    """取消本会话所有未完成的后台任务"""
+    worker = llm_worker.get_worker()
+    for job_id in st.session_state.get('llm_jobs', {}).values():
+        worker.cancel(job_id)
+    st.session_state.llm_jobs = {}
+
+def collect_llm_jobs():
+    """取回本会话已完成的后台任务结果（每次 rerun 开始时调用）"""
+    worker = llm_worker.get_worker()
+    for kind, job_id in list(st.session_state.llm_jobs.items()):
+        job = worker.get(job_id)
+        if job is not None and not job.done:
+            continue
+        del st.session_state.llm_jobs[kind]
+        if job is None:
+            # 完成后太久没人取已被清理（或服务重启）
+            continue
+        worker.pop(job_id)
+        if job.status == llm_worker.FAILED:
+            st.session_state.llm_errors[kind] = job.error
+            continue
+        if job.status != llm_worker.DONE:
+            continue
+        if kind == "summary":
+            # 对话在等待期间被清空时摘要已失效
+            if job.result['covered'] <= len(st.session_state.chat_history):
+                st.session_state.chat_summary = job.result
+                update_chat_summary()
+            continue
+        record_llm_timing(kind, job.timing)
+        if kind == "optimize":
+            st.session_state.optimized_plan = job.result['tasks']
+            st.session_state.plan_data = job.result
+            # AI 不可用时任务返回的是离线规划结果
+            st.session_state.plan_source = "fallback" if job.timing.get('fallback') else "ai"
+        elif kind == "chat":
+            st.session_state.chat_history.append({
+                "role": "assistant",
+                "content": job.result['reply']
+            })
+            update_chat_summary(use_ai=not job.result['fallback'])
+
+def render_task_card(idx: int, task: dict):
+    """计划任务卡片"""
+    priority_colors = {"S": "🔴", "A": "🟠", "B": "🟡"}
+    priority_emoji = priority_colors.get(task.get('priority', 'B'), "⚪")
+    
+    st.markdown(f"""
+    <div class="task-card">
+        <div style="display: flex; justify-content: space-between; align-items: start;">
+            <div style="flex: 1;">
+                <h3 style="margin: 0; color: #00ff88;">
+                    任务 {idx + 1} | {priority_emoji} {task['name']}
+                </h3>
+                <p style="color: #888; margin: 5px 0; font-size: 0.9em;">
+                    ⏱️ {task['minutes']}分 | 💪 专注度: {task.get('focus', 5)}/10
+                </p>
+                <p style="color: #00ffaa; margin: 10px 0; font-size: 0.95em;">
+                    📍 {task.get('method', '集中完成')}
+                </p>
+                <p style="color: #ffaa00; margin: 0; font-size: 0.85em;">
+                    ⚠️ {task.get('warning', '保持专注')}
+                </p>
+            </div>
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+@st.fragment(run_every=LLM_POLL_INTERVAL)
+def show_llm_progress(kind: str, label: str):
+    """后台任务进行中时定时刷新已生成的内容（只重绘这一块），完成后整页刷新以取回结果"""
+    job_id = st.session_state.llm_jobs.get(kind)
+    job = llm_worker.get_worker().get(job_id) if job_id else None
+    if job is None or job.done:
+        st.rerun()
+    st.caption(f"{label}（{job.elapsed:.0f}s）")
+    if kind == "optimize":
+        # 任务对象一闭合就显示为卡片
+        tasks = list(job.items)
+        if tasks:
+            st.caption(f"已生成 {len(tasks)} 个任务，{sum(t['minutes'] for t in tasks)} 分钟 ▌")
+        elif job.text:
+            st.caption(f"已接收 {len(job.text)} 字 ▌")
+        for idx, task in enumerate(tasks):
+            render_task_card(idx, task)
+    elif job.text:
+        st.markdown(f"**AI:** {job.text} ▌")
+
+# ============================================
+# 核心功能：激进的计划优化
+# ============================================
+OPTIMIZE_SYSTEM_PROMPT = """你是一个极端的时间优化大师,代号'时间杀手'。你的目标是将用户的计划疯狂优化,让他们的每一秒都用于学习和成长。
 
 你必须:
 1. 将计划分解成具体的微任务(不超过25分钟)
@@ -290,28 +639,55 @@ def optimize_plan_aggressive(user_plan: str) -> dict:
   "motivation": "激励语句(刘慈欣风格,冷酷而振奋)",
   "tips": "极限执行建议"
 }"""
+OPTIMIZE_TEMPERATURE = 0.8
+
+def run_optimize_job(job, client, messages: list, temperature: float, cache_key: str,
+                     user_plan: str, history: list) -> dict:
+    """
+    后台任务：生成优化方案并写入缓存；AI 不可用时改用离线规划（不写入缓存）
     
+    边接收边解析，已闭合的任务实时放入 job.items；整体 JSON 损坏时用已解析出的任务组成方案
+    """
+    parser = stream_json.PlanStreamParser()
     try:
-        response = call_deepseek(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"我的今日计划: {user_plan}\n\n请激进优化，让我达到极限效率！"}
-            ],
-            temperature=0.8
-        )
-        
-        # 清理 JSON 响应
-        cleaned = response.strip()
-        if cleaned.startswith("```"):
-            cleaned = cleaned.split("\n", 1)[1]
-        if cleaned.endswith("```"):
-            cleaned = cleaned.rsplit("```", 1)[0]
-        cleaned = cleaned.strip()
-        
-        plan_data = json.loads(cleaned)
-        return plan_data
+        run_llm_job(job, client, messages, temperature,
+                    on_delta=lambda delta: job.items.extend(parser.feed(delta)))
+    except llm_resilience.LLMUnavailable as e:
+        job.timing = {'fallback': str(e)}
+        return offline_planner.build_plan(user_plan, history)
+    try:
+        plan_data = parser.result()
     except Exception as e:
         raise Exception(f"计划优化失败: {str(e)}")
+    if not job.cancelled:
+        response_cache.put(cache_key, plan_data)
+    return plan_data
+
+def optimize_plan_aggressive(user_plan: str, force_refresh: bool = False):
+    """
+    激进优化计划 - 极限压榨时间
+    
+    相同的计划（忽略空白和全半角差异）优先从本地缓存返回计划数据；未命中时提交后台任务并返回 None，
+    结果在之后的 rerun 中由 collect_llm_jobs 取回
+    """
+    cache_key = llm_cache.make_key(user_plan, OPTIMIZE_PROMPT_VERSION, DEEPSEEK_MODEL,
+                                   OPTIMIZE_TEMPERATURE, OPTIMIZE_SYSTEM_PROMPT)
+    if not force_refresh:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    messages = [
+        {"role": "system", "content": OPTIMIZE_SYSTEM_PROMPT},
+        {"role": "user", "content": f"我的今日计划: {user_plan}\n\n请激进优化，让我达到极限效率！"}
+    ]
+    submit_llm_job("optimize", run_optimize_job, messages, OPTIMIZE_TEMPERATURE, cache_key,
+                   user_plan, store.get_task_history())
+    return None
+
+def plan_offline(user_plan: str) -> dict:
+    """离线规划：不调用 AI，按历史记录估算，毫秒级返回"""
+    return offline_planner.build_plan(user_plan, store.get_task_history())
 
 def get_task_suggestion(task: dict, elapsed_seconds: int, total_seconds: int) -> str:
     """
@@ -335,12 +711,16 @@ def get_task_suggestion(task: dict, elapsed_seconds: int, total_seconds: int) ->
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": "给我一句激励语和建议"}
             ],
-            temperature=0.6
+            temperature=0.6,
+            kind="suggestion"
         )
         return response
     except:
         return "继续推进，时间在流逝。"
 
+# 取回上次刷新以来完成的后台 AI 任务
+collect_llm_jobs()
+
 # ============================================
 # 侧边栏 - API 配置 + 数据管理
 # ============================================
@@ -349,6 +729,21 @@ with st.sidebar:
     st.markdown("疯狂优化 | 极限效率 | 全力学习")
     st.markdown("---")
     
+    st.markdown("### 👤 用户")
+    st.text_input(
+        "用户名",
+        value=st.session_state.profile,
+        key="profile_input",
+        on_change=switch_profile,
+        help="每个用户的计划和记录保存在独立的数据库中"
+    )
+    if st.session_state.get('profile_error'):
+        st.error(st.session_state.profile_error)
+    other_profiles = [p for p in store.list_profiles() if p != st.session_state.profile]
+    if other_profiles:
+        st.caption("已有用户: " + "、".join(other_profiles))
+    st.markdown("---")
+    
     st.markdown("### 🔌 API 配置")
     
     # 尝试自动加载已保存的 API Key
@@ -394,27 +789,60 @@ with st.sidebar:
     st.markdown("### 📚 计划管理")
     
     # 继续上一次
-    latest_plan = get_latest_plan()
+    latest_plan = store.get_latest_plan()
     if latest_plan:
         st.markdown(f"**上次计划:** {latest_plan['date']}")
         if st.button("▶️ 继续上一次", use_container_width=True):
             st.session_state.plan_data = latest_plan
+            st.session_state.plan_source = None
             st.session_state.optimized_plan = latest_plan['tasks']
             st.session_state.current_plan_id = latest_plan['id']
             st.session_state.executing = False
             st.rerun()
     
     # 继续今天的
-    today_plan = get_today_plan()
+    today_plan = store.get_today_plan()
     if today_plan and today_plan != latest_plan:
         st.markdown(f"**今天计划:** {today_plan['date']}")
         if st.button("▶️ 继续今天", use_container_width=True):
             st.session_state.plan_data = today_plan
+            st.session_state.plan_source = None
             st.session_state.optimized_plan = today_plan['tasks']
             st.session_state.current_plan_id = today_plan['id']
             st.session_state.executing = False
             st.rerun()
     
+    st.markdown("---")
+    with st.expander("🐢 SQL 性能"):
+        last_rerun_sql = st.session_state.get('last_rerun_sql')
+        if last_rerun_sql:
+            st.caption(f"上次刷新: {last_rerun_sql['count']} 条语句，耗时 {last_rerun_sql['ms']:.1f} ms")
+        query_report = store.get_query_report()
+        if not query_report['enabled']:
+            st.caption("未记录（config.json 中 query_profiling 为 false，或当前存储后端不执行 SQL）")
+        elif query_report['queries']:
+            query_columns = {'total_ms': '总耗时ms', 'count': '次数', 'avg_ms': '平均ms',
+                             'max_ms': '最大ms', 'rows': '行数', 'sql': '语句'}
+            st.dataframe(
+                pd.DataFrame(query_report['queries'][:20])[list(query_columns)].rename(columns=query_columns),
+                use_container_width=True, hide_index=True
+            )
+            slow_queries = query_report['slow_queries']
+            st.caption(f"慢查询（≥ {query_report['slow_ms']} ms）: {len(slow_queries)} 条")
+            for item in slow_queries[:5]:
+                st.code(f"{item['ms']} ms · {item['rows']} 行 · {item['call_site']}\n{item['sql']}\n"
+                        + "\n".join(item['plan']), language=None)
+            st.download_button(
+                "📥 下载完整报告",
+                data=json.dumps(query_report, ensure_ascii=False, indent=2),
+                file_name=f"query_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                mime="application/json",
+                use_container_width=True
+            )
+            if st.button("🧹 清空统计", use_container_width=True):
+                store.reset_query_stats()
+                st.rerun()
+    
     st.markdown("---")
     st.markdown("### 💡 使用说明")
     st.markdown("""
@@ -442,6 +870,8 @@ st.markdown("""
 # ============================================
 if not st.session_state.api_configured:
     st.warning("⚠️ 系统未激活，请在左侧边栏配置 API Key 以启动系统")
+elif resilient_llm.breaker.state != llm_resilience.CircuitBreaker.CLOSED:
+    st.warning(f"⚠️ AI 服务连续失败，暂停调用（约 {resilient_llm.breaker.retry_in():.0f} 秒后重试），期间使用备用方案")
 
 # ============================================
 # Tab 分区
@@ -462,36 +892,85 @@ with tab1:
         key="plan_input"
     )
     
-    col1, col2 = st.columns([1, 1])
+    force_refresh = st.checkbox(
+        "🔁 强制刷新",
+        key="force_refresh",
+        help="忽略本地缓存，重新调用 AI 优化（相同的计划默认直接返回上次的结果）"
+    )
+    cache_stats = response_cache.stats()
+    st.caption(f"AI 缓存: 命中 {cache_stats['hits']} 次 · 未命中 {cache_stats['misses']} 次 · "
+               f"已缓存 {cache_stats['entries']} 个计划")
+    
+    col1, col2, col3 = st.columns([1, 1, 1])
+    # 优化过程中生成的内容实时显示在按钮下方
+    optimize_stream = st.container()
     
     with col1:
         if st.button("🔥 疯狂优化", use_container_width=True, type="primary"):
-            if not st.session_state.api_configured:
-                st.error("❌ 请先在侧边栏启动系统")
-            elif not user_plan.strip():
+            if not user_plan.strip():
                 st.warning("⚠️ 请输入计划")
             else:
-                with st.spinner("AI正在疯狂优化你的计划..."):
-                    try:
-                        plan_data = optimize_plan_aggressive(user_plan)
+                try:
+                    st.session_state.plan = user_plan
+                    if st.session_state.api_configured:
+                        plan_data = optimize_plan_aggressive(user_plan, force_refresh)
+                        plan_source = "cache"
+                    else:
+                        # 未配置 API 时直接离线规划
+                        plan_data = plan_offline(user_plan)
+                        plan_source = "offline"
+                    if plan_data is not None:
                         st.session_state.optimized_plan = plan_data['tasks']
                         st.session_state.plan_data = plan_data
-                        st.session_state.plan = user_plan
-                        st.success("✅ 计划优化完成！")
+                        st.session_state.plan_source = plan_source
                         st.rerun()
-                    except Exception as e:
-                        st.error(f"❌ 优化失败: {str(e)}")
+                except Exception as e:
+                    st.error(f"❌ 优化失败: {str(e)}")
     
     with col2:
+        if st.button("🧮 离线规划", use_container_width=True,
+                     help="不调用 AI，按历史实际用时估算并拆分任务，立即生成"):
+            if not user_plan.strip():
+                st.warning("⚠️ 请输入计划")
+            else:
+                cancel_llm_jobs()
+                plan_data = plan_offline(user_plan)
+                st.session_state.plan = user_plan
+                st.session_state.optimized_plan = plan_data['tasks']
+                st.session_state.plan_data = plan_data
+                st.session_state.plan_source = "offline"
+                st.rerun()
+    
+    with col3:
         if st.button("🔄 清空计划", use_container_width=True):
+            cancel_llm_jobs()
             st.session_state.optimized_plan = []
             st.session_state.plan_data = None
+            st.session_state.plan_source = None
             st.rerun()
     
+    # 后台优化进行中时显示生成中的内容，可以同时切换到其他页面
+    with optimize_stream:
+        if 'optimize' in st.session_state.llm_jobs:
+            show_llm_progress("optimize", "AI正在疯狂优化你的计划...")
+        optimize_error = st.session_state.llm_errors.pop('optimize', None)
+        if optimize_error:
+            st.error(f"❌ 优化失败: {optimize_error}")
+    
     # 显示优化结果
     if st.session_state.plan_data:
         st.markdown("---")
         st.markdown("## 📊 优化方案")
+        # 方案来源：cache / ai / offline / fallback（AI 不可用时的离线规划）；继续历史计划时为 None，不显示
+        plan_source = st.session_state.get('plan_source')
+        if plan_source == "cache":
+            st.caption("⚡ 来自本地缓存（未调用 API），需要新方案请勾选「强制刷新」后重新优化")
+        elif plan_source == "ai" and last_llm_timing('optimize'):
+            st.caption(format_llm_timing(last_llm_timing('optimize')))
+        elif plan_source in ("offline", "fallback"):
+            if plan_source == "fallback":
+                st.caption(format_llm_timing(last_llm_timing('optimize')))
+            st.caption("🧮 离线规划：按历史实际用时估算，未调用 AI")
         
         plan_data = st.session_state.plan_data
         
@@ -548,41 +1027,23 @@ with tab1:
         st.markdown("## 📋 任务明细")
         
         for idx, task in enumerate(plan_data['tasks']):
-            priority_colors = {"S": "🔴", "A": "🟠", "B": "🟡"}
-            priority_emoji = priority_colors.get(task.get('priority', 'B'), "⚪")
-            
-            st.markdown(f"""
-            <div class="task-card">
-                <div style="display: flex; justify-content: space-between; align-items: start;">
-                    <div style="flex: 1;">
-                        <h3 style="margin: 0; color: #00ff88;">
-                            任务 {idx + 1} | {priority_emoji} {task['name']}
-                        </h3>
-                        <p style="color: #888; margin: 5px 0; font-size: 0.9em;">
-                            ⏱️ {task['minutes']}分 | 💪 专注度: {task.get('focus', 5)}/10
-                        </p>
-                        <p style="color: #00ffaa; margin: 10px 0; font-size: 0.95em;">
-                            📍 {task.get('method', '集中完成')}
-                        </p>
-                        <p style="color: #ffaa00; margin: 0; font-size: 0.85em;">
-                            ⚠️ {task.get('warning', '保持专注')}
-                        </p>
-                    </div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            render_task_card(idx, task)
         
         st.markdown("---")
         
         if st.button("▶️ 开始执行计划", use_container_width=True, type="primary"):
             # 保存计划到数据库
-            plan_id = save_plan(plan_data, title=f"Daily Plan {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+            plan_id = store.save_plan(plan_data, title=f"Daily Plan {datetime.now().strftime('%Y-%m-%d %H:%M')}")
             st.session_state.current_plan_id = plan_id
             st.session_state.executing = True
             st.session_state.current_task_idx = 0
             st.session_state.start_time = time.time()
             st.session_state.total_seconds = plan_data['total_minutes'] * 60
             st.session_state.chat_history = []
+            st.session_state.chat_summary = {'text': "", 'covered': 0}
+            summary_job = st.session_state.llm_jobs.pop('summary', None)
+            if summary_job:
+                llm_worker.get_worker().cancel(summary_job)
             st.rerun()
 
 # ============================================
@@ -779,13 +1240,14 @@ with tab2:
                     
                     # 保存任务记录
                     if st.session_state.current_plan_id:
-                        save_task_record(
+                        store.save_task_record(
                             plan_id=st.session_state.current_plan_id,
                             task_name=current_task['name'],
                             scheduled_min=current_task['minutes'],
                             actual_min=int(task_elapsed // 60),
                             focus_level=current_task.get('focus', 5),
-                            completed=True
+                            completed=True,
+                            task_index=current_idx
                         )
                     
                     # 时间数据记录
@@ -799,7 +1261,7 @@ with tab2:
                     else:
                         # 标记计划完成
                         if st.session_state.current_plan_id:
-                            update_plan_status(st.session_state.current_plan_id, 'completed')
+                            store.update_plan_status(st.session_state.current_plan_id, 'completed')
                         st.session_state.executing = False
                         st.success(f"🎉 所有任务完成！总耗时: {int(elapsed_seconds // 60)} 分钟")
                         st.rerun()
@@ -821,14 +1283,20 @@ with tab2:
                 key="user_message"
             )
             
-            if user_message:
+            # 输入框保留上次的内容，只处理新提交的消息（否则每次刷新都会重复发送）；
+            # 上一条回复生成期间先不发送（不取消正在生成的回复），回复取回后的刷新中再处理
+            new_message = user_message and user_message != st.session_state.get('last_user_message')
+            if new_message and 'chat' in st.session_state.llm_jobs:
+                st.info("⏳ AI 还在回复上一条消息，回复完成后自动发送")
+            elif new_message:
+                st.session_state.last_user_message = user_message
                 # 添加用户消息到历史
                 st.session_state.chat_history.append({
                     "role": "user",
                     "content": user_message
                 })
                 
-                # 调用 AI
+                # 提交后台 AI 任务，回复在之后的刷新中显示
                 try:
                     system_prompt = f"""你是一个激进的时间教练和学习顾问。
 当前任务: {current_task['name']}
@@ -836,24 +1304,15 @@ with tab2:
 剩余时间: {int(task_remaining//60)}分{int(abs(task_remaining)%60)}秒
 专注度要求: {current_task.get('focus', 5)}/10
 
-用户的要求: {user_message}
-
 请以激励、冷酷但实用的风格回应。如果用户要求调整，给出具体方案。"""
                     
-                    response = call_deepseek(
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_message}
-                        ],
-                        temperature=0.7
+                    budget, keep_turns = chat_context_settings()
+                    submit_llm_job(
+                        "chat", run_chat_job, system_prompt,
+                        list(st.session_state.chat_history),
+                        dict(st.session_state.chat_summary),
+                        budget, keep_turns, 0.7
                     )
-                    
-                    st.session_state.chat_history.append({
-                        "role": "assistant",
-                        "content": response
-                    })
-                    
-                    st.rerun()
                 except Exception as e:
                     st.error(f"❌ AI 响应失败: {str(e)}")
             
@@ -865,6 +1324,15 @@ with tab2:
                         st.markdown(f"**你:** {msg['content']}")
                     else:
                         st.markdown(f"**AI:** {msg['content']}")
+                if 'chat' in st.session_state.llm_jobs:
+                    show_llm_progress("chat", "AI 思考中...")
+                else:
+                    chat_timing = last_llm_timing('chat')
+                    if chat_timing:
+                        st.caption(format_llm_timing(chat_timing))
+            chat_error = st.session_state.llm_errors.pop('chat', None)
+            if chat_error:
+                st.error(f"❌ AI 响应失败: {chat_error}")
         else:
             st.success("🎉 所有任务完成！")
             if st.button("🔄 返回计划页面"):
@@ -878,7 +1346,7 @@ with tab3:
     st.markdown("## 📊 数据分析面板")
     
     # 创建子 Tab
-    tab3_1, tab3_2, tab3_3 = st.tabs(["📈 今日统计", "📊 历史趋势", "📚 所有计划"])
+    tab3_1, tab3_2, tab3_4, tab3_3 = st.tabs(["📈 今日统计", "📊 历史趋势", "🎯 预估精度", "📚 所有计划"])
     
     with tab3_1:
         if st.session_state.plan_data:
@@ -953,11 +1421,26 @@ with tab3:
             st.info("💡 暂无计划数据")
     
     with tab3_2:
-        st.markdown("### 📊 30天历史趋势")
+        st.markdown("### 📊 历史趋势")
+        
+        granularity = st.radio(
+            "统计粒度",
+            ["按日（近30天）", "按周", "按月"],
+            horizontal=True,
+            key="trend_granularity"
+        )
+        
+        # 直接读取汇总表，开销只与桶数量有关
+        if granularity == "按周":
+            stats = store.get_rollups('week', limit=26)
+        elif granularity == "按月":
+            stats = store.get_rollups('month', limit=24)
+        else:
+            since = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+            stats = store.get_rollups('day', since=since)
         
-        stats = get_statistics()
         if stats:
-            df = pd.DataFrame(stats)
+            df = pd.DataFrame(stats).rename(columns={'bucket': 'date'})
             
             # 时间趋势
             fig_time = go.Figure()
@@ -1045,17 +1528,122 @@ with tab3:
         else:
             st.info("💡 暂无历史数据")
     
+    with tab3_4:
+        st.markdown("### 🎯 时间预估精度")
+        
+        report = store.get_estimation_report()
+        if report['measured_count'] > 0:
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("平均超时比例", f"{report['mean_ratio']:.2f}x")
+            with col2:
+                st.metric("超时任务占比", f"{report['overrun_share']:.0f}%")
+            with col3:
+                st.metric("当前连续天数", f"{report['streaks']['current']}天")
+            with col4:
+                st.metric("最长连续天数", f"{report['streaks']['longest']}天")
+            
+            # 误差分位数（实际 - 计划）
+            col1, col2, col3 = st.columns(3)
+            for col, (name, value) in zip((col1, col2, col3), report['error_percentiles'].items()):
+                with col:
+                    st.metric(f"误差 {name.upper()}", f"{value:+.0f}min")
+            
+            # 超时比例分布
+            distribution = report['ratio_distribution']
+            fig_ratio = go.Figure(data=[go.Bar(
+                x=list(distribution.keys()),
+                y=list(distribution.values()),
+                marker=dict(color='#00ff88')
+            )])
+            fig_ratio.update_layout(
+                template="plotly_dark",
+                paper_bgcolor='rgba(0,0,0,0)',
+                font=dict(color='#00ff88'),
+                height=350,
+                xaxis_title="实际 / 计划",
+                yaxis_title="任务数"
+            )
+            st.plotly_chart(fig_ratio, use_container_width=True)
+            
+            # 分组统计
+            breakdown_columns = {
+                'group': '分组', 'count': '任务数', 'mean_ratio': '平均超时比例',
+                'p50_error': '误差P50(分)', 'p90_error': '误差P90(分)', 'completion_rate': '完成率(%)'
+            }
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("#### 按优先级")
+                if report['by_priority']:
+                    st.dataframe(pd.DataFrame(report['by_priority']).rename(columns=breakdown_columns).round(2),
+                                 use_container_width=True, hide_index=True)
+                else:
+                    st.caption("暂无优先级数据")
+            with col2:
+                st.markdown("#### 按专注度")
+                if report['by_focus']:
+                    st.dataframe(pd.DataFrame(report['by_focus']).rename(columns=breakdown_columns).round(2),
+                                 use_container_width=True, hide_index=True)
+                else:
+                    st.caption("暂无专注度数据")
+        else:
+            st.info("💡 暂无可分析的执行记录")
+    
     with tab3_3:
         st.markdown("### 📚 所有计划记录")
         
-        all_plans = get_all_plans(limit=50)
+        # 全文搜索任务名、备注和方法
+        search_query = st.text_input("🔍 搜索任务", placeholder="例如：数学 复习、LeetCode", key="task_search")
+        if search_query.strip():
+            results = store.search_tasks(search_query, limit=20)
+            if results:
+                st.caption(f"找到 {len(results)} 条相关结果")
+                for item in results:
+                    kind = "记录" if item['kind'] == 'record' else "计划任务"
+                    if item.get('archived'):
+                        kind += "（已归档）"
+                    st.markdown(f"**{item['date'] or '-'}** · {kind} · {item['title']}")
+                    if item['snippet']:
+                        st.caption(item['snippet'])
+            else:
+                st.info("没有找到匹配的任务")
+            st.markdown("---")
+        
+        # 计划历史：键集分页，每次只查询当前页
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            history_range = st.date_input("计划日期", value=(), key="history_range")
+        with col2:
+            history_status = st.selectbox(
+                "状态",
+                ["", "in_progress", "completed"],
+                format_func=lambda s: {"": "全部", "in_progress": "进行中", "completed": "已完成"}[s],
+                key="history_status"
+            )
+        with col3:
+            page_size = st.selectbox("每页", [20, 50, 100], key="history_page_size")
+        
+        history_start, history_end = (list(history_range) + [None, None])[:2]
+        history_filters = (history_start, history_end, history_status, page_size)
+        # 筛选条件变化时回到第一页；history_cursors 依次保存已访问各页的起始游标
+        if st.session_state.get('history_filters') != history_filters:
+            st.session_state.history_filters = history_filters
+            st.session_state.history_cursors = [None]
+        cursors = st.session_state.history_cursors
+        
+        page = store.get_plans_page(
+            cursors[-1], page_size,
+            start=history_start.isoformat() if history_start else None,
+            end=history_end.isoformat() if history_end else None,
+            status=history_status or None
+        )
+        all_plans = page['plans']
         if all_plans:
             # 创建数据表
             plans_data = []
             for plan in all_plans:
-                records = get_plan_records(plan['id'])
-                completed = sum(1 for r in records if r['completed'])
-                total = len(records)
+                completed = plan['completed_count']
+                total = plan['task_count']
                 
                 plans_data.append({
                     '日期': plan['date'],
@@ -1063,24 +1651,90 @@ with tab3:
                     '任务数': total,
                     '完成数': completed,
                     '完成率': f"{(completed/total*100):.0f}%" if total > 0 else "0%",
+                    '计划分钟': plan['scheduled_minutes'],
+                    '实际分钟': plan['actual_minutes'],
                     '创建时间': plan['created_at']
                 })
             
             df_plans = pd.DataFrame(plans_data)
             st.dataframe(df_plans, use_container_width=True, hide_index=True)
             
-            # 导出功能
-            if st.button("📥 导出数据为 CSV"):
-                filename = export_to_csv()
-                with open(filename, 'rb') as f:
-                    st.download_button(
-                        label="下载 CSV 文件",
-                        data=f.read(),
-                        file_name=filename,
-                        mime="text/csv"
-                    )
+            col_prev, col_page, col_next = st.columns([1, 1, 1])
+            with col_prev:
+                if st.button("⬅️ 上一页", disabled=len(cursors) == 1, key="history_prev"):
+                    cursors.pop()
+                    st.rerun()
+            with col_page:
+                st.markdown(f"第 {len(cursors)} 页")
+            with col_next:
+                if st.button("下一页 ➡️", disabled=page['next_cursor'] is None, key="history_next"):
+                    cursors.append(page['next_cursor'])
+                    st.rerun()
         else:
             st.info("💡 暂无计划记录")
+        
+        # 导出功能（按块流式写出，不在内存中构建整张表）
+        st.markdown("### 📥 数据导出")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            export_table_name = st.selectbox(
+                "数据表",
+                list(EXPORT_TABLES.keys()),
+                format_func=lambda t: {
+                    'plans': '计划', 'tasks': '计划任务',
+                    'records': '执行记录', 'rollups': '统计汇总'
+                }.get(t, t)
+            )
+        with col2:
+            export_format = st.selectbox("格式", list(FORMATS.keys()))
+        with col3:
+            export_range = st.date_input(
+                "日期范围",
+                value=(datetime.now().date() - timedelta(days=30), datetime.now().date())
+            )
+        
+        if st.button("📥 生成导出文件"):
+            start_date, end_date = (list(export_range) + [None, None])[:2]
+            start = start_date.isoformat() if start_date else None
+            end = end_date.isoformat() if end_date else None
+            # 每次导出写到独立的临时文件，多个用户同时导出不会互相覆盖；上一次的文件随即删除
+            previous = st.session_state.pop('export_file', None)
+            if previous and os.path.exists(previous[0]):
+                os.remove(previous[0])
+            fd, export_path = tempfile.mkstemp(prefix="wallfacer_export_", suffix=FORMATS[export_format][0])
+            os.close(fd)
+            try:
+                filename, count = store.export_table(
+                    export_table_name, export_format, filename=export_path, start=start, end=end
+                )
+                st.session_state.export_file = (
+                    filename, FORMATS[export_format][1],
+                    default_filename(export_table_name, export_format, start, end)
+                )
+                st.success(f"✅ 已导出 {count} 行")
+            except Exception as e:
+                if os.path.exists(export_path):
+                    os.remove(export_path)
+                st.error(f"❌ 导出失败: {str(e)}")
+        
+        export_file, export_mime, export_name = st.session_state.get('export_file') or (None, None, None)
+        if export_file and os.path.exists(export_file):
+            # 导出文件本身是流式写出的，但 st.download_button 会把整个文件读入内存（每次刷新都读），
+            # 超过上限时不提供页面下载，改用命令行导出
+            export_mb = os.path.getsize(export_file) / (1024 * 1024)
+            if export_mb > EXPORT_DOWNLOAD_MAX_MB:
+                st.warning(
+                    f"⚠️ 导出文件 {export_mb:.0f} MB，超过页面下载上限 {EXPORT_DOWNLOAD_MAX_MB} MB，"
+                    f"请用命令行导出：python manage.py export {export_table_name} --format {export_format}"
+                )
+            else:
+                with open(export_file, 'rb') as f:
+                    st.download_button(
+                        label=f"下载 {export_name}",
+                        data=f,
+                        file_name=export_name,
+                        mime=export_mime
+                    )
 
 # ============================================
 # 页脚
@@ -1094,3 +1748,10 @@ st.markdown("""
     </p>
 </div>
 """, unsafe_allow_html=True)
+
+# 本次 rerun 在数据库上花费的时间（下次刷新时显示在侧边栏）
+sql_totals = store.get_query_totals()
+st.session_state.last_rerun_sql = {
+    'count': sql_totals['count'] - sql_totals_at_start['count'],
+    'ms': sql_totals['ms'] - sql_totals_at_start['ms']
+}
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 历史归档模块
+把超过保留期的计划及其任务、记录移入附加的归档库，汇总表保留在主库
+"""
+
+import sqlite3
+
+import search
+
+ARCHIVE_FILE = "wallfacer_archive.db"
+
+# 按依赖顺序排列：先归档子表再删除父表
+ARCHIVED_TABLES = ('plans', 'plan_tasks', 'task_records')
+
+# 子表与计划的关联条件
+_PLAN_FILTER = {
+    'plans': "date < :cutoff",
+    'plan_tasks': "plan_id IN (SELECT id FROM main.plans WHERE date < :cutoff)",
+    'task_records': "plan_id IN (SELECT id FROM main.plans WHERE date < :cutoff)",
+}
+
+
+def _columns(conn, schema: str, table: str) -> list:
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _sync_schema(conn, schema: str = 'archive'):
+    """让归档库的表结构跟上主库（建表或补列）"""
+    for table in ARCHIVED_TABLES:
+        main_columns = _columns(conn, 'main', table)
+        archive_columns = _columns(conn, schema, table)
+        if not archive_columns:
+            conn.execute(f"CREATE TABLE {schema}.{table} AS SELECT * FROM main.{table} WHERE 0")
+            conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {schema}.idx_{table}_id ON {table} (id)")
+            continue
+        for column in main_columns:
+            if column not in archive_columns:
+                conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {column}")
+
+
+def attach(conn, archive_file: str = ARCHIVE_FILE, schema: str = 'archive'):
+    """附加归档库（已附加时跳过）"""
+    attached = [row[1] for row in conn.execute("PRAGMA database_list")]
+    if schema not in attached:
+        conn.execute("ATTACH DATABASE ? AS " + schema, (archive_file,))
+    _sync_schema(conn, schema)
+
+
+def detach(conn, schema: str = 'archive'):
+    attached = [row[1] for row in conn.execute("PRAGMA database_list")]
+    if schema in attached:
+        conn.execute("DETACH DATABASE " + schema)
+
+
+def archive_before(conn: sqlite3.Connection, cutoff: str, archive_file: str = ARCHIVE_FILE) -> dict:
+    """
+    把日期早于 cutoff (YYYY-MM-DD) 的计划、任务和记录移入归档库
+
+    需在事务外调用（ATTACH 不能在事务内执行），返回各表移动的行数。
+    主库为 WAL 模式时跨库提交不保证原子性，归档使用 INSERT OR REPLACE，中断后重跑即可
+    """
+    attach(conn, archive_file)
+    moved = {}
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for table in ARCHIVED_TABLES:
+            columns = ", ".join(_columns(conn, 'main', table))
+            cursor = conn.execute(f'''
+                INSERT OR REPLACE INTO archive.{table} ({columns})
+                SELECT {columns} FROM main.{table} WHERE {_PLAN_FILTER[table]}
+            ''', {'cutoff': cutoff})
+            moved[table] = cursor.rowcount
+        # 先删子表，最后删计划（子表条件依赖 main.plans）
+        for table in reversed(ARCHIVED_TABLES):
+            conn.execute(f"DELETE FROM main.{table} WHERE {_PLAN_FILTER[table]}", {'cutoff': cutoff})
+        # 删除触发器去掉了移走行的索引，从归档库补回，归档后仍可搜到
+        search.index_archive(conn.cursor())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        detach(conn)
+    return moved
+
+
+def incremental_vacuum(conn: sqlite3.Connection, pages: int = 256) -> int:
+    """回收最多 pages 个空闲页，返回剩余空闲页数"""
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
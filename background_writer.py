@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 后台写入模块
+每个数据库一个写线程：串行化该库的写操作，并把排队的写入合并为一个事务提交
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class BackgroundWriter:
+    """后台单写线程 - 写操作排队执行，批量提交后再通知调用方"""
+
+    def __init__(self, get_connection, max_batch=256, idle_interval=None, on_idle=None,
+                 name="wallfacer-db-writer"):
+        # get_connection 在写线程内调用，拿到写线程自己的连接
+        self._get_connection = get_connection
+        self.max_batch = max_batch
+        # 队列空闲 idle_interval 秒后在写线程内调用 on_idle(conn)，用于维护任务
+        self.idle_interval = idle_interval
+        self._on_idle = on_idle
+        self.name = name
+        self._queue = queue.Queue()
+        # 已提交的写事务数（只在写线程内递增），读缓存可据此判断数据是否变化
+        self.commits = 0
+        self._thread = None
+        # stop() 之后仍可能有迟到的写操作把线程重新拉起，写完后空闲即退出
+        self._closing = False
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        """提交写操作 func(cursor, *args, **kwargs)，返回在提交落盘后完成的 Future"""
+        future = Future()
+        self._enqueue((future, func, args, kwargs, True))
+        return future
+
+    def submit_exclusive(self, func, *args, **kwargs) -> Future:
+        """提交需要在事务外单独执行的操作 func(conn, *args, **kwargs)（如 ATTACH、VACUUM）"""
+        future = Future()
+        self._enqueue((future, func, args, kwargs, False))
+        return future
+
+    def flush(self, timeout=None):
+        """等待此前提交的写操作全部落盘"""
+        return self.submit(lambda cursor: None).result(timeout)
+
+    def stop(self, timeout=None):
+        """写完队列中的操作后停止写线程"""
+        with self._lock:
+            self._closing = True
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def start(self):
+        """启动写线程（提交写操作时也会自动启动）"""
+        with self._lock:
+            self._start_locked()
+
+    def _enqueue(self, item):
+        # 入队和启动线程在同一把锁下完成，与 _exit_if_drained 互斥
+        with self._lock:
+            self._queue.put(item)
+            self._start_locked()
+
+    def _start_locked(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name=self.name, daemon=True
+            )
+            self._thread.start()
+
+    def _exit_if_drained(self) -> bool:
+        """队列已空时登记线程退出；否则继续处理停止后迟到的写操作"""
+        with self._lock:
+            if self._queue.empty():
+                self._thread = None
+                return True
+            return False
+
+    def _run(self):
+        pending = None
+        while True:
+            if pending is not None:
+                item, pending = pending, None
+            else:
+                try:
+                    item = self._queue.get(timeout=self._idle_timeout())
+                except queue.Empty:
+                    if self._closing and self._exit_if_drained():
+                        return
+                    self._run_idle()
+                    continue
+            if item is _STOP:
+                if self._exit_if_drained():
+                    return
+                continue
+
+            if not item[4]:
+                self._run_exclusive(item)
+                continue
+
+            # 把已经排队的写操作一起带上，合并为一个事务
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP or not item[4]:
+                    pending = item
+                    break
+                batch.append(item)
+
+            self._write_batch(batch)
+
+    def _idle_timeout(self):
+        if self._closing:
+            return self.idle_interval or 1.0
+        return self.idle_interval if self._on_idle else None
+
+    def _run_exclusive(self, item):
+        """在事务外单独执行一个操作"""
+        future, func, args, kwargs, _ = item
+        if not future.set_running_or_notify_cancel():
+            return
+        conn = None
+        try:
+            conn = self._get_connection()
+            result = func(conn, *args, **kwargs)
+            self.commits += 1
+            future.set_result(result)
+        except Exception as e:
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+            logger.error("写操作失败: %s", e)
+            future.set_exception(e)
+
+    def _run_idle(self):
+        """队列空闲时执行维护任务，失败只记录日志"""
+        try:
+            self._on_idle(self._get_connection())
+        except Exception:
+            logger.exception("空闲维护任务失败")
+
+    def _write_batch(self, batch):
+        """在一个事务中执行一批写操作，每个操作用 SAVEPOINT 隔离失败"""
+        outcomes = []
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            conn.execute("BEGIN IMMEDIATE")
+            for future, func, args, kwargs, _ in batch:
+                if not future.set_running_or_notify_cancel():
+                    outcomes.append(None)
+                    continue
+                cursor.execute("SAVEPOINT write_op")
+                try:
+                    result = func(cursor, *args, **kwargs)
+                    cursor.execute("RELEASE write_op")
+                    outcomes.append((True, result))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write_op")
+                    cursor.execute("RELEASE write_op")
+                    outcomes.append((False, e))
+            conn.commit()
+            self.commits += 1
+        except Exception as e:
+            logger.exception("批量写入失败，已回滚 %d 个操作", len(batch))
+            if conn is not None and conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+            for future, *_ in batch:
+                if future.done():
+                    continue
+                if future.running() or future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+            return
+
+        for (future, *_), outcome in zip(batch, outcomes):
+            if outcome is None:
+                continue
+            ok, value = outcome
+            if ok:
+                future.set_result(value)
+            else:
+                logger.error("写操作失败: %s", value)
+                future.set_exception(value)
+
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 在线热备份模块
+用 sqlite3 的 backup API 分步复制数据库（每步复制若干页后暂停），应用写入时也能得到一致的副本；
+每个数据库保留最近 N 份备份，并支持从备份恢复
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = "backups"
+DEFAULT_GENERATIONS = 7
+
+# 每步复制的页数与步间暂停（秒）：单步持锁时间短，不会卡住界面和写线程
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.01
+
+_TIME_FORMAT = "%Y%m%d-%H%M%S-%f"
+
+# 恢复前自动做的安全备份在文件名末尾带此标记，不作为默认恢复的"最新备份"
+SAFETY_SUFFIX = "-pre-restore"
+
+
+def _stem(db_file: str) -> str:
+    return os.path.splitext(os.path.basename(db_file))[0]
+
+
+def backup_folder(db_file: str, backup_dir: str) -> str:
+    """某个数据库的备份目录（每个库一个子目录）"""
+    return os.path.join(backup_dir, _stem(db_file))
+
+
+def list_backups(db_file: str, backup_dir: str) -> list:
+    """列出某个数据库的备份文件，最新的在前"""
+    folder = backup_folder(db_file, backup_dir)
+    if not os.path.isdir(folder):
+        return []
+    prefix = _stem(db_file) + "-"
+    names = [n for n in os.listdir(folder) if n.startswith(prefix) and n.endswith(".db")]
+    return [os.path.join(folder, n) for n in sorted(names, reverse=True)]
+
+
+def is_safety_backup(path: str) -> bool:
+    """是否为恢复前自动做的安全备份"""
+    return os.path.splitext(os.path.basename(path))[0].endswith(SAFETY_SUFFIX)
+
+
+def latest_backup(db_file: str, backup_dir: str):
+    """最新的一份常规备份（跳过安全备份），没有时返回 None"""
+    for path in list_backups(db_file, backup_dir):
+        if not is_safety_backup(path):
+            return path
+    return None
+
+
+def copy_database(source: sqlite3.Connection, dest_path: str,
+                  pages: int = PAGES_PER_STEP, sleep: float = STEP_SLEEP):
+    """把 source 的内容分步复制到 dest_path（先写临时文件，完成后再原子替换）"""
+    tmp_path = dest_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    dest = sqlite3.connect(tmp_path)
+    try:
+        source.backup(dest, pages=pages, sleep=sleep)
+        # 备份文件改为普通日志模式，单个文件即可完整拷走
+        dest.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        dest.close()
+    os.replace(tmp_path, dest_path)
+
+
+def rotate(db_file: str, backup_dir: str, keep: int = DEFAULT_GENERATIONS) -> list:
+    """常规备份和安全备份各只保留最近 keep 份，返回删除的文件"""
+    removed = []
+    backups = list_backups(db_file, backup_dir)
+    for safety in (False, True):
+        for path in [p for p in backups if is_safety_backup(p) == safety][keep:]:
+            os.remove(path)
+            removed.append(path)
+    return removed
+
+
+def create_backup(db_file: str, backup_dir: str, keep: int = DEFAULT_GENERATIONS,
+                  pages: int = PAGES_PER_STEP, sleep: float = STEP_SLEEP, safety: bool = False) -> str:
+    """
+    为 db_file 创建一份在线备份并轮换旧备份，返回备份文件路径
+
+    使用独立的连接在一个读事务内复制，得到开始时刻的一致快照，WAL 模式下不阻塞写入。
+    keep 为 None 时不轮换；safety 为 True 时作为恢复前的安全备份命名
+    """
+    folder = backup_folder(db_file, backup_dir)
+    os.makedirs(folder, exist_ok=True)
+    # 文件名带时间戳（精确到微秒），按名称排序即按时间排序
+    suffix = SAFETY_SUFFIX if safety else ""
+    dest_path = os.path.join(folder, f"{_stem(db_file)}-{datetime.now().strftime(_TIME_FORMAT)}{suffix}.db")
+
+    if not os.path.exists(db_file):
+        raise FileNotFoundError(f"数据库不存在: {db_file}")
+    source = sqlite3.connect(db_file)
+    try:
+        # 先在源连接上开启读事务固定 WAL 快照：其他连接的写入不会让分步复制反复重来
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        copy_database(source, dest_path, pages, sleep)
+        source.rollback()
+    finally:
+        source.close()
+
+    if keep is not None:
+        rotate(db_file, backup_dir, keep)
+    return dest_path
+
+
+def verify_backup(backup_path: str):
+    """检查备份文件完整性，不通过时报错"""
+    if not os.path.exists(backup_path):
+        raise FileNotFoundError(f"备份文件不存在: {backup_path}")
+    conn = sqlite3.connect(backup_path)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f"备份文件已损坏: {backup_path} ({e})")
+    finally:
+        conn.close()
+    if result != "ok":
+        raise ValueError(f"备份文件已损坏: {backup_path} ({result})")
+
+
+def restore(backup_path: str, target: sqlite3.Connection,
+            pages: int = PAGES_PER_STEP, sleep: float = STEP_SLEEP):
+    """用备份覆盖 target 连接所在的数据库（经由 SQLite 加锁写入，WAL 文件一并更新）"""
+    verify_backup(backup_path)
+    source = sqlite3.connect(backup_path)
+    try:
+        source.backup(target, pages=pages, sleep=sleep)
+    finally:
+        source.close()
+
+
+def needs_backup(db_file: str, backup_dir: str) -> bool:
+    """数据库（含 WAL）在最近一次备份之后有过修改时返回 True"""
+    if not os.path.exists(db_file):
+        return False
+    backups = list_backups(db_file, backup_dir)
+    if not backups:
+        return True
+    changed = max(os.path.getmtime(p) for p in (db_file, db_file + "-wal") if os.path.exists(p))
+    return changed > os.path.getmtime(backups[0])
+
+
+class BackupScheduler:
+    """定时备份线程 - 每隔 interval 秒为有改动的数据库各做一份备份"""
+
+    def __init__(self, get_targets, backup_dir: str, interval: float,
+                 keep: int = DEFAULT_GENERATIONS):
+        # get_targets() 返回需要备份的数据库文件列表（在备份线程内调用）
+        self._get_targets = get_targets
+        self.backup_dir = backup_dir
+        self.interval = interval
+        self.keep = keep
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._stopped = False
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="wallfacer-backup", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._lock:
+            self._stopped = True
+            thread = self._thread
+        self._wakeup.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def run_once(self) -> list:
+        """立即为有改动的数据库做一次备份，返回新备份文件"""
+        created = []
+        for db_file in self._get_targets():
+            try:
+                if needs_backup(db_file, self.backup_dir):
+                    created.append(create_backup(db_file, self.backup_dir, self.keep))
+            except Exception:
+                logger.exception("备份 %s 失败", db_file)
+        return created
+
+    def _run(self):
+        # 启动后先检查一次（有改动才会真正备份），之后按间隔执行
+        last_run = None
+        while True:
+            if last_run is not None:
+                self._wakeup.wait(max(0.0, self.interval - (time.monotonic() - last_run)))
+                self._wakeup.clear()
+            if self._stopped:
+                return
+            # 间隔可能被 configure 调整，醒来时重新判断是否到期
+            if last_run is None or time.monotonic() - last_run >= self.interval:
+                self.run_once()
+                last_run = time.monotonic()
+
+    def configure(self, interval: float = None, keep: int = None):
+        """调整备份间隔和保留份数（立即生效）"""
+        if interval is not None:
+            self.interval = interval
+        if keep is not None:
+            self.keep = keep
+        self._wakeup.set()
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 数据层基准测试
+用可复现的合成数据填充临时数据库，分别测量 data_manager 各公开函数的冷 / 热耗时，结果输出为 JSON
+
+冷启动指新建连接并清空进程内缓存后的首次调用（操作系统页缓存无法清除）
+"""
+
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import analytics
+import data_manager
+import rollups
+import search
+import sync
+from migrations import apply_migrations
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+# 合成数据的日期从这一天加上由种子决定的偏移开始，与运行日期无关，同一种子每次生成的数据完全相同
+ANCHOR_DATE = date(2020, 1, 1)
+
+# 导入类基准使用的文件行数（不随数据量变化，测的是导入到不同大小的库中的耗时）
+IMPORT_ROWS = 1_000
+
+_TASK_NAMES = [
+    "深度学习第{n}章", "LeetCode 第{n}题", "线性代数复习", "论文精读 {n}", "英语听力",
+    "数据结构作业", "项目代码重构", "概率论习题", "算法模板整理", "单词背诵 {n} 组",
+    "操作系统实验", "周报撰写", "阅读《三体》第{n}章", "机器学习笔记", "数学建模练习",
+]
+_METHODS = ["番茄钟", "费曼学习法", "先做后看", "主动回忆", "限时训练"]
+
+
+def generate_dataset(conn, n_records: int, seed: int = 42, days: int = None) -> dict:
+    """
+    向空库写入可复现的合成计划、任务和执行记录
+
+    每天一个计划、4-10 个任务；实际用时为计划用时乘以对数正态扰动，约 90% 完成。
+    日期从 ANCHOR_DATE 之后由 seed 决定的某天开始
+    """
+    rng = random.Random(seed)
+    avg_tasks = 7
+    days = days or max(1, n_records // avg_tasks)
+    start = ANCHOR_DATE + timedelta(days=seed % 366)
+
+    plans, tasks, records = [], [], []
+    plan_id = task_id = 0
+    while len(records) < n_records:
+        plan_id += 1
+        day = (start + timedelta(days=(plan_id - 1) % days)).isoformat()
+        n_tasks = min(rng.randint(4, 10), n_records - len(records))
+        total = 0
+        for position in range(n_tasks):
+            task_id += 1
+            minutes = rng.choice((15, 20, 25, 25, 25))
+            priority = rng.choices("SAB", weights=(2, 5, 3))[0]
+            focus = rng.randint(4, 10)
+            name = rng.choice(_TASK_NAMES).format(n=rng.randint(1, 30))
+            tasks.append((task_id, plan_id, position, position + 1, name, minutes,
+                          priority, focus, rng.choice(_METHODS), "保持专注"))
+            actual = max(1, round(minutes * rng.lognormvariate(0.1, 0.35)))
+            completed = rng.random() < 0.9
+            records.append((plan_id, task_id, name, minutes, actual, focus, int(completed),
+                            f"{day} 21:00:00" if completed else None, ""))
+            total += minutes
+        status = 'completed' if rng.random() < 0.8 else 'in_progress'
+        plans.append((plan_id, day, f"Daily Plan {day}", total, status, f"{day} 08:00:00"))
+
+    cursor = conn.cursor()
+    conn.execute("BEGIN IMMEDIATE")
+    cursor.executemany('''
+        INSERT INTO plans (id, date, title, total_minutes, status, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', plans)
+    cursor.executemany('''
+        INSERT INTO plan_tasks
+        (id, plan_id, position, task_no, name, minutes, priority, focus, method, warning)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', tasks)
+    cursor.executemany('''
+        INSERT INTO task_records
+        (plan_id, plan_task_id, task_name, scheduled_minutes, actual_minutes,
+         focus_level, completed, completed_at, notes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', records)
+    rollups.rebuild(cursor)
+    # 与应用空闲时一样先建好全文索引，search 基准不含首次分词
+    search.index_pending(cursor)
+    conn.commit()
+    return {'plans': len(plans), 'plan_tasks': len(tasks), 'task_records': len(records)}
+
+
+def _history_tab_n_plus_one():
+    """旧版“所有计划”页的访问方式：列表 + 每个计划单独查记录"""
+    for plan in data_manager.get_all_plans(limit=50):
+        data_manager.get_plan_records(plan['id'])
+
+
+def _save_task_record_durable():
+    data_manager.save_task_record(1, "基准测试任务", 25, 27, 7, True, task_index=0).result()
+
+
+def _update_plan_status_durable():
+    data_manager.update_plan_status(1, 'in_progress').result()
+
+
+def _export_records():
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        data_manager.export_table('records', 'csv', filename=path)
+    finally:
+        os.remove(path)
+
+
+# 导入、同步基准用到的文件和参数，由 _prepare_fixtures 在每个数据量下准备
+_fixtures = {}
+
+
+def _prepare_fixtures(workdir: str, seed: int):
+    """
+    准备导入文件：批量导入用的记录 JSONL，以及另一个节点（独立的小库）导出的全量变更文件
+
+    两者都只有 IMPORT_ROWS 行；变更文件必须来自另一个库，本库自己导出的文件会被拒绝
+    """
+    records_file = os.path.join(workdir, "import_records.jsonl")
+    rng = random.Random(seed + 1)
+    with open(records_file, 'w', encoding='utf-8') as f:
+        for i in range(IMPORT_ROWS):
+            minutes = rng.choice((15, 20, 25))
+            f.write(json.dumps({
+                'date': (ANCHOR_DATE - timedelta(days=1 + i % 30)).isoformat(),
+                'task_name': rng.choice(_TASK_NAMES).format(n=rng.randint(1, 30)),
+                'scheduled_minutes': minutes,
+                'actual_minutes': max(1, round(minutes * rng.lognormvariate(0.1, 0.35))),
+                'focus_level': rng.randint(4, 10),
+                'completed': 1,
+            }, ensure_ascii=False) + "\n")
+
+    changes_file = os.path.join(workdir, "peer_changes.jsonl.gz")
+    if not os.path.exists(changes_file):
+        peer_db = os.path.join(workdir, "peer.db")
+        conn = sqlite3.connect(peer_db)
+        try:
+            apply_migrations(conn)
+            generate_dataset(conn, IMPORT_ROWS, seed + 1)
+            with conn:
+                sync.export_changes(conn.cursor(), changes_file, full=True)
+        finally:
+            conn.close()
+    _fixtures.update(records=records_file, changes=changes_file)
+
+
+def _export_changes():
+    """导出给基准测试对象的增量变更：首次（冷）为全量，之后为无变化时的空增量"""
+    fd, path = tempfile.mkstemp(suffix=".jsonl.gz")
+    os.close(fd)
+    try:
+        data_manager.export_changes(path, peer="benchmark")
+    finally:
+        os.remove(path)
+
+
+def _backup_now():
+    os.remove(data_manager.backup_now(keep=1))
+
+
+# 名称 -> 调用；覆盖 data_manager 的公开读写函数。
+# 写入类基准会改变库的内容，排在只读基准之后；导入类中冷启动为首次导入，之后的重复导入测的是合并已有行。
+# 不测：restore_backup（会替换正在测量的库）、archive_old_data / vacuum_step（一次性维护，
+# 重复执行时没有可移动的数据）、use_profile（只切换线程局部变量，打开新库的开销已含在各函数的冷启动中）
+BENCHMARKS = {
+    'get_latest_plan': data_manager.get_latest_plan,
+    'get_today_plan': data_manager.get_today_plan,
+    'get_plan_tasks': lambda: data_manager.get_plan_tasks(1),
+    'get_all_plans': lambda: data_manager.get_all_plans(limit=50),
+    'get_plan_records': lambda: data_manager.get_plan_records(1),
+    'get_all_plans+get_plan_records': _history_tab_n_plus_one,
+    'get_plan_summaries': lambda: data_manager.get_plan_summaries(limit=50),
+    'get_plans_page': lambda: data_manager.get_plans_page(page_size=50),
+    'get_plans_page(status)': lambda: data_manager.get_plans_page(page_size=50, status='completed'),
+    'get_statistics': data_manager.get_statistics,
+    'get_rollups(day)': lambda: data_manager.get_rollups('day', since=_fixtures['since']),
+    'get_rollups(week)': lambda: data_manager.get_rollups('week', limit=26),
+    'get_rollups(month)': lambda: data_manager.get_rollups('month', limit=24),
+    'get_estimation_report': data_manager.get_estimation_report,
+    'search': lambda: data_manager.search("线性代数 复习"),
+    'export_table(records, csv)': _export_records,
+    'backup_now': _backup_now,
+    'save_plan': lambda: data_manager.save_plan(
+        {'total_minutes': 25, 'tasks': [{'id': 1, 'name': '基准测试任务', 'minutes': 25}]},
+        title="Benchmark Plan"),
+    'save_task_record': _save_task_record_durable,
+    'update_plan_status': _update_plan_status_durable,
+    'export_changes': _export_changes,
+    'bulk_import': lambda: data_manager.bulk_import(records_file=_fixtures['records']),
+    'import_changes': lambda: data_manager.import_changes(_fixtures['changes'], peer="benchmark-peer"),
+}
+
+# 耗时与数据量线性相关的函数在大数据量下只测少量次数
+_SLOW = {'get_estimation_report', 'export_table(records, csv)', 'backup_now', 'bulk_import', 'import_changes'}
+
+
+def _reset_caches():
+    """丢弃连接和进程内缓存，模拟冷启动"""
+    data_manager.close_connections()
+    analytics._cache.clear()
+
+
+def _time_call(func) -> float:
+    started = time.perf_counter()
+    func()
+    return (time.perf_counter() - started) * 1000
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat: int = 5, seed: int = 42,
+                   workdir: str = None, only=None) -> dict:
+    """在各数据量下测量每个函数的冷 / 热耗时（毫秒），返回可序列化为 JSON 的结果"""
+    workdir = workdir or tempfile.mkdtemp(prefix="wallfacer_bench_")
+    original_db = data_manager.DB_FILE
+    names = [name for name in BENCHMARKS if not only or name in only]
+
+    results = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'sizes': {},
+    }
+
+    try:
+        for size in sizes:
+            db_file = os.path.join(workdir, f"bench_{size}.db")
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(db_file + suffix):
+                    os.remove(db_file + suffix)
+            data_manager.use_database(db_file)
+
+            started = time.perf_counter()
+            counts = generate_dataset(data_manager.get_connection(), size, seed)
+            _prepare_fixtures(workdir, seed)
+            last_day = data_manager.get_connection().execute("SELECT MAX(date) FROM plans").fetchone()[0]
+            _fixtures['since'] = (date.fromisoformat(last_day) - timedelta(days=29)).isoformat()
+            size_result = {
+                'rows': counts,
+                'generate_seconds': round(time.perf_counter() - started, 3),
+                'db_bytes': os.path.getsize(db_file),
+                'functions': {},
+            }
+
+            for name in names:
+                func = BENCHMARKS[name]
+                _reset_caches()
+                cold = _time_call(func)
+                runs = 1 if (name in _SLOW and size >= 100_000) else repeat
+                warm = [_time_call(func) for _ in range(runs)]
+                size_result['functions'][name] = {
+                    'cold_ms': round(cold, 3),
+                    'warm_median_ms': round(statistics.median(warm), 3),
+                    'warm_min_ms': round(min(warm), 3),
+                    'warm_max_ms': round(max(warm), 3),
+                    'runs': runs,
+                }
+
+            results['sizes'][str(size)] = size_result
+    finally:
+        data_manager.use_database(original_db)
+
+    return results
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="执剑人系统 - 数据层基准测试")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="逗号分隔的任务记录数量，例如 10000,100000")
+    parser.add_argument("--repeat", type=int, default=5, help="热启动重复次数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="临时数据库目录（默认新建临时目录）")
+    parser.add_argument("--only", help="只测量指定函数（逗号分隔）")
+    parser.add_argument("-o", "--output", help="结果 JSON 文件（默认输出到标准输出）")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        sizes=[int(s) for s in args.sizes.split(",") if s],
+        repeat=args.repeat,
+        seed=args.seed,
+        workdir=args.workdir,
+        only=set(args.only.split(",")) if args.only else None,
+    )
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"✅ 基准测试结果已写入 {args.output}")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 对话上下文模块
+实时对话每次请求只带：系统提示 + 之前对话的滚动摘要 + 最近 N 轮原文 + 本条消息，
+总量控制在 token 预算内，长时间对话的请求大小和延迟保持不变
+
+滑出最近 N 轮的对话在回复完成后并入摘要（由 AI 压缩，失败时按句截取），摘要随会话缓存，
+每轮只需处理新滑出的一轮；摘要覆盖到之前，这些对话仍按原文发送
+"""
+
+import math
+import re
+
+DEFAULT_TOKEN_BUDGET = 1500
+DEFAULT_KEEP_TURNS = 3
+# 每条消息的格式开销（角色标记等）
+MESSAGE_OVERHEAD = 4
+
+# DeepSeek 官方估算：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+CJK_TOKENS = 0.6
+OTHER_TOKENS = 0.3
+
+_SENTENCE_RE = re.compile(r'[^。！？!?\n]+[。！？!?]?')
+
+SUMMARY_SYSTEM_PROMPT = """你负责压缩一段学习计划执行过程中的对话记录。
+把「已有摘要」和「新增对话」合并成一段新的摘要，保留：用户提出的调整和要求、AI 给出并被采纳的方案、
+尚未解决的问题、用户的状态（疲劳、卡住的任务等）。省略寒暄和激励语。
+只输出摘要正文，不超过 {max_chars} 个字。"""
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数（没有分词器时的近似值，偏保守）"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return math.ceil(cjk * CJK_TOKENS + (len(text) - cjk) * OTHER_TOKENS)
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message.get('content', '')) + MESSAGE_OVERHEAD
+
+
+def count_tokens(messages: list) -> int:
+    return sum(message_tokens(message) for message in messages)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = 'tail') -> str:
+    """截断到 max_tokens 以内；keep='tail' 保留末尾（较新的内容），'head' 保留开头"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    # 二分查找能放下的最长长度
+    while low < high:
+        mid = (low + high + 1) // 2
+        part = text[-mid:] if keep == 'tail' else text[:mid]
+        if estimate_tokens(part) + 1 <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    if low == 0:
+        return ""
+    return "…" + text[-low:] if keep == 'tail' else text[:low] + "…"
+
+
+def build_messages(system_prompt: str, history: list, summary: str = "",
+                   budget: int = DEFAULT_TOKEN_BUDGET, keep_turns: int = DEFAULT_KEEP_TURNS,
+                   covered: int = None) -> tuple:
+    """
+    组装请求消息
+
+    history 为截至本条用户消息（含）的对话记录，covered 为摘要已覆盖的消息数：
+    已滑出最近 N 轮、但摘要还没覆盖到的消息（摘要任务尚未完成）也按原文发送，只受 token 预算限制。
+    返回 (messages, info)，info 中有估算的 tokens、原文保留的消息数 verbatim、因超出预算丢弃的
+    消息数 dropped，以及系统提示加本条消息超出预算、被截断时的 truncated
+    """
+    current, earlier = history[-1:], history[:-1]
+    window_start = max(0, len(earlier) - keep_turns * 2) if keep_turns > 0 else len(earlier)
+    if covered is not None:
+        window_start = min(window_start, max(0, covered))
+    recent = earlier[window_start:]
+
+    head = [{"role": "system", "content": system_prompt}]
+    fixed = count_tokens(head) + count_tokens(current)
+    truncated = fixed > budget
+    if truncated:
+        # 先截断本条消息（至少给它留一半预算），剩下的预算给系统提示
+        message_budget = max(budget - count_tokens(head), budget // 2) - MESSAGE_OVERHEAD
+        current = [dict(m, content=truncate_to_tokens(m.get('content', ''), message_budget, keep='head'))
+                   for m in current]
+        system_budget = budget - count_tokens(current) - MESSAGE_OVERHEAD
+        head = [{"role": "system", "content": truncate_to_tokens(system_prompt, system_budget, keep='head')}]
+        fixed = count_tokens(head) + count_tokens(current)
+    summary_message = []
+    if summary:
+        # 摘要最多占预算的四分之一
+        summary_budget = max(0, min(budget - fixed, budget // 4) - MESSAGE_OVERHEAD)
+        summary = truncate_to_tokens(summary, summary_budget)
+        if summary:
+            summary_message = [{"role": "system", "content": f"此前对话摘要：{summary}"}]
+
+    # 从最新的一轮往前放，放不下时丢弃更早的原文
+    available = budget - fixed - count_tokens(summary_message)
+    kept = []
+    for message in reversed(recent):
+        cost = message_tokens(message)
+        if cost > available:
+            break
+        kept.insert(0, message)
+        available -= cost
+    # 保证以用户消息开头，避免孤立的助手回复
+    while kept and kept[0].get('role') != 'user':
+        kept.pop(0)
+
+    messages = head + summary_message + kept + current
+    return messages, {
+        'tokens': count_tokens(messages),
+        'verbatim': len(kept),
+        'dropped': len(recent) - len(kept),
+        'summarized': bool(summary_message),
+        'truncated': truncated,
+    }
+
+
+def pending_for_summary(history: list, covered: int, keep_turns: int = DEFAULT_KEEP_TURNS) -> tuple:
+    """
+    下一次请求时将滑出最近 N 轮、尚未并入摘要的消息
+
+    history 为包含最新回复的完整对话；返回 (待压缩的消息, 压缩后摘要覆盖到的位置)
+    """
+    window_start = max(0, len(history) - keep_turns * 2)
+    if window_start <= covered:
+        return [], covered
+    return history[covered:window_start], window_start
+
+
+def _transcript(messages: list) -> str:
+    names = {'user': '用户', 'assistant': 'AI'}
+    return "\n".join(f"{names.get(m['role'], m['role'])}: {m['content']}" for m in messages)
+
+
+def summary_request(summary: str, pending: list, max_tokens: int) -> list:
+    """让 AI 合并摘要的请求消息"""
+    max_chars = max(50, int(max_tokens / CJK_TOKENS))
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT.format(max_chars=max_chars)},
+        {"role": "user", "content": f"已有摘要：{summary or '（无）'}\n\n新增对话：\n{_transcript(pending)}"},
+    ]
+
+
+def extractive_summary(summary: str, pending: list, max_tokens: int) -> str:
+    """不调用 AI 的摘要：每条消息取第一句接在已有摘要后面，超出时保留较新的部分"""
+    names = {'user': '用户', 'assistant': 'AI'}
+    parts = [summary] if summary else []
+    # 每条消息最多占摘要预算的均分份额，避免一条长消息挤掉其他内容
+    share = max(10, max_tokens // max(1, len(pending)))
+    for message in pending:
+        match = _SENTENCE_RE.search(message.get('content', '').strip())
+        if match:
+            sentence = truncate_to_tokens(match.group(0).strip(), share, keep='head')
+            parts.append(f"{names.get(message['role'], message['role'])}: {sentence}")
+    return truncate_to_tokens(" ".join(parts), max_tokens)
+
+
+def update_summary(summary: str, pending: list, max_tokens: int, summarize=None) -> tuple:
+    """
+    把滑出窗口的消息并入摘要，返回 (新摘要, 是否由 AI 生成)
+
+    summarize(messages) -> str 调用 AI 压缩；未提供或失败时改用按句截取
+    """
+    if not pending:
+        return summary, False
+    if summarize is not None:
+        try:
+            text = (summarize(summary_request(summary, pending, max_tokens)) or "").strip()
+            if text:
+                return truncate_to_tokens(text, max_tokens), True
+        except Exception:
+            pass
+    return extractive_summary(summary, pending, max_tokens), False
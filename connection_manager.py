@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - SQLite 连接管理模块
+按线程复用长连接，并统一设置 WAL 等性能参数；多用户时按 LRU 缓存各自的数据库
+"""
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class ConnectionManager:
+    """SQLite 连接管理器 - 每个线程持有一条调优过的长连接"""
+
+    def __init__(self, db_file, cache_size_kb=16384, mmap_size=268435456,
+                 busy_timeout_ms=5000, on_connect=None, factory=sqlite3.Connection):
+        self.db_file = db_file
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+        # 新连接创建后的回调（例如注册自定义 SQL 函数）
+        self.on_connect = on_connect
+        # 连接类（例如记录查询耗时的 query_profiler.InstrumentedConnection）
+        self.factory = factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._owners = {}  # {thread: connection}
+        self._pid = os.getpid()
+
+    def get_connection(self) -> sqlite3.Connection:
+        """获取当前线程的连接（不存在则创建）"""
+        # fork 出的子进程不能复用父进程的连接
+        if os.getpid() != self._pid:
+            self._reset_after_fork()
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._acquire()
+            self._local.conn = conn
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        """为当前线程分配连接，优先接管已结束线程留下的连接"""
+        # Streamlit 每次 rerun 都可能换一个脚本线程，连接需要跨线程回收
+        thread = threading.current_thread()
+        with self._lock:
+            for owner, conn in list(self._owners.items()):
+                if not owner.is_alive():
+                    del self._owners[owner]
+                    if conn.in_transaction:
+                        conn.rollback()
+                    self._owners[thread] = conn
+                    return conn
+
+        conn = self._open()
+        with self._lock:
+            self._owners[thread] = conn
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        """创建新连接并设置 PRAGMA"""
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            factory=self.factory
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        return conn
+
+    def _reset_after_fork(self):
+        """丢弃从父进程继承的连接状态"""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._owners = {}
+        self._pid = os.getpid()
+
+    def close_all(self):
+        """关闭所有线程的连接"""
+        with self._lock:
+            connections = list(self._owners.values())
+            self._owners = {}
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+class DatabaseCache:
+    """
+    按数据库文件缓存已打开的数据库（连接、写线程等），超过容量时关闭最久未用的一个
+
+    线程通过 get 取得数据库后即登记为其使用者，直到该线程改用其他数据库或结束；
+    还有存活线程在使用的数据库不会被淘汰（都在使用时暂时超出容量，下次打开新库时再收回）
+    """
+
+    def __init__(self, factory, capacity=16, on_evict=None):
+        # factory(db_file) 打开数据库；on_evict(entry) 在淘汰或清空时关闭它
+        self._factory = factory
+        self.capacity = capacity
+        self._on_evict = on_evict
+        self._entries = OrderedDict()
+        self._users = {}  # {thread: 数据库路径}
+        self._lock = threading.Lock()
+
+    def get(self, db_file):
+        """获取数据库（不存在则打开），标记为最近使用，并登记当前线程在使用它"""
+        key = os.path.abspath(db_file)
+        with self._lock:
+            self._users[threading.current_thread()] = key
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            # 在锁内打开，避免两个线程同时为同一个库执行迁移
+            entry = self._factory(db_file)
+            self._entries[key] = entry
+            evicted = self._evict_locked()
+        # 关闭（等待写线程写完队列）放在锁外，不阻塞其他用户
+        for old in evicted:
+            self._close(old)
+        return entry
+
+    def _evict_locked(self) -> list:
+        """超出容量时按最久未用的顺序移除没有存活线程在使用的数据库"""
+        # 与 ConnectionManager 一样，Streamlit 脚本线程结束后即视为不再使用
+        for thread in [t for t in self._users if not t.is_alive()]:
+            del self._users[thread]
+        in_use = set(self._users.values())
+        evicted = []
+        for key in list(self._entries):
+            if len(self._entries) <= self.capacity:
+                break
+            if key not in in_use:
+                evicted.append(self._entries.pop(key))
+        return evicted
+
+    def discard(self, db_file):
+        """关闭并移除一个数据库"""
+        with self._lock:
+            entry = self._entries.pop(os.path.abspath(db_file), None)
+        if entry is not None:
+            self._close(entry)
+
+    def clear(self):
+        """关闭全部数据库"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._close(entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _close(self, entry):
+        if self._on_evict is not None:
+            self._on_evict(entry)
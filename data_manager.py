@@ -5,160 +5,303 @@
 """
 
 import sqlite3
-import json
-import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
+import atexit
+import threading
+from concurrent.futures import Future
+import analytics
+import archive
+import backup
+import exporter
+import importer
+import query_profiler
+import rollups
+import search as fulltext
+import sync
+from background_writer import BackgroundWriter
+from connection_manager import ConnectionManager, DatabaseCache
+from migrations import apply_migrations, plan_task_row
+from profile_manager import ARCHIVE_SUFFIX, normalize_profile, profile_db_file, list_profiles
 
 DB_FILE = "wallfacer_data.db"
 
-def init_database():
-    """初始化数据库"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # 创建计划表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS plans (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            title TEXT,
-            total_minutes INTEGER,
-            tasks_json TEXT,
-            status TEXT DEFAULT 'in_progress',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+# 同时打开的用户数据库上限（每个库一组连接和一个写线程）
+MAX_OPEN_DATABASES = 16
+
+# 历史保留天数（None 表示不自动归档）与增量清理参数
+RETENTION_DAYS = None
+VACUUM_PAGES_PER_STEP = 256
+MAINTENANCE_IDLE_SECONDS = 60
+
+_last_retention_run = {}  # {数据库文件: 最近一次归档的日期}
+
+# 当前线程使用的数据库（Streamlit 每次 rerun 由 use_profile 设置，未设置时用 DB_FILE）
+_local = threading.local()
+
+class _Database:
+    """一个用户数据库：按线程复用的连接 + 专属写线程"""
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        directory = os.path.dirname(os.path.abspath(db_file))
+        os.makedirs(directory, exist_ok=True)
+        self.connections = ConnectionManager(
+            db_file,
+            factory=query_profiler.InstrumentedConnection,
         )
-    ''')
-    
-    # 创建任务执行记录表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS task_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            plan_id INTEGER,
-            task_name TEXT NOT NULL,
-            scheduled_minutes INTEGER,
-            actual_minutes INTEGER,
-            focus_level INTEGER,
-            completed BOOLEAN DEFAULT 0,
-            completed_at TIMESTAMP,
-            notes TEXT,
-            FOREIGN KEY (plan_id) REFERENCES plans(id)
+        apply_migrations(self.connections.get_connection())
+        # 每个库一个写线程，不同用户的写入互不排队
+        self.writer = BackgroundWriter(
+            self.connections.get_connection,
+            idle_interval=MAINTENANCE_IDLE_SECONDS,
+            on_idle=lambda conn: _run_maintenance(conn, db_file),
+            name=f"wallfacer-db-writer-{os.path.basename(db_file)}",
         )
-    ''')
-    
-    # 创建日志表
+        self.writer.start()
+        # 读缓存用的版本连接：其上的 data_version 在任何其他连接（写线程或其他进程）提交后变化
+        self._version_conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._version_lock = threading.Lock()
+
+    def data_version(self) -> tuple:
+        """数据版本（写线程提交计数 + 版本连接的 data_version），所有线程和会话之间可比"""
+        with self._version_lock:
+            changes = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+        return (self.writer.commits, changes)
+
+    def close(self):
+        """写完队列后停止写线程并关闭连接"""
+        self.writer.stop()
+        self.connections.close_all()
+        with self._version_lock:
+            self._version_conn.close()
+
+_databases = DatabaseCache(_Database, capacity=MAX_OPEN_DATABASES, on_evict=_Database.close)
+atexit.register(_databases.clear)
+
+def _current_db_file() -> str:
+    return getattr(_local, 'db_file', None) or DB_FILE
+
+def _database() -> _Database:
+    """当前线程所用的数据库（不在缓存中则打开并迁移）"""
+    return _databases.get(_current_db_file())
+
+def use_profile(name: str = None) -> str:
+    """让当前线程使用指定用户档案的数据库，返回规范化后的档案名"""
+    name = normalize_profile(name)
+    _local.db_file = profile_db_file(name, DB_FILE)
+    return name
+
+def list_user_profiles() -> list:
+    """列出已有的用户档案"""
+    return list_profiles(DB_FILE)
+
+def get_connection() -> sqlite3.Connection:
+    """获取当前线程的数据库连接"""
+    return _database().connections.get_connection()
+
+def close_connections():
+    """关闭所有已打开的数据库（写线程会先写完队列）"""
+    _databases.clear()
+
+def set_retention(days: int = None):
+    """设置历史保留天数，超过的计划和记录会在空闲时移入归档库"""
+    global RETENTION_DAYS
+    RETENTION_DAYS = days if days and days > 0 else None
+
+def _run_maintenance(conn, db_file: str):
+    """写线程空闲时执行：按保留期归档（每个库每天一次）、补全全文索引并回收少量空闲页"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    if RETENTION_DAYS and _last_retention_run.get(db_file) != today:
+        _last_retention_run[db_file] = today
+        cutoff = (datetime.now() - timedelta(days=RETENTION_DAYS)).strftime("%Y-%m-%d")
+        archive.archive_before(conn, cutoff, _archive_file(db_file))
+    if fulltext.has_pending(conn):
+        with conn:
+            fulltext.index_pending(conn.cursor())
+    archive.incremental_vacuum(conn, VACUUM_PAGES_PER_STEP)
+
+def set_query_profiling(enabled: bool = True, slow_ms: float = None):
+    """开关 SQL 耗时记录，并设置慢查询阈值（毫秒）"""
+    query_profiler.profiler.configure(enabled, slow_ms)
+
+def get_query_report(limit: int = None) -> dict:
+    """SQL 执行汇总（按总耗时降序）和最近的慢查询"""
+    profiler = query_profiler.profiler
+    return {
+        'enabled': profiler.enabled,
+        'slow_ms': profiler.slow_ms,
+        'queries': profiler.report(limit),
+        'slow_queries': profiler.slow_queries(),
+    }
+
+def get_query_totals() -> dict:
+    """当前线程累计执行的 SQL 语句数与耗时（毫秒），两次调用相减即一段代码的数据库开销"""
+    return query_profiler.profiler.thread_totals()
+
+def reset_query_stats():
+    """清空 SQL 执行汇总和慢查询记录"""
+    query_profiler.profiler.reset()
+
+def flush_writes(timeout: float = None):
+    """等待当前数据库已提交的写操作全部落盘"""
+    _database().writer.flush(timeout)
+
+def use_database(db_file: str):
+    """切换默认数据库文件（基准测试、临时库等），并执行结构迁移"""
+    global DB_FILE
+    _databases.discard(DB_FILE)
+    _local.db_file = None
+    DB_FILE = db_file
+    init_database()
+
+def init_database():
+    """初始化数据库（打开当前数据库并执行未应用的结构迁移）"""
+    _database()
+
+def _insert_plan(cursor, date: str, title: str, total_minutes: int, tasks: list) -> int:
+    """写入计划及其任务（在写线程的事务内执行）"""
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS daily_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL UNIQUE,
-            total_scheduled_minutes INTEGER,
-            total_actual_minutes INTEGER,
-            completion_rate REAL,
-            avg_focus_level REAL,
-            notes TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+        INSERT INTO plans (date, title, total_minutes)
+        VALUES (?, ?, ?)
+    ''', (date, title, total_minutes))
+    plan_id = cursor.lastrowid
     
-    conn.commit()
-    conn.close()
+    cursor.executemany('''
+        INSERT INTO plan_tasks
+        (plan_id, position, task_no, name, minutes, priority, focus, method, warning)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [plan_task_row(plan_id, position, task) for position, task in enumerate(tasks)])
+    
+    rollups.add_plan(cursor, date)
+    return plan_id
 
 def save_plan(plan_data: dict, title: str = None) -> int:
-    """保存计划到数据库"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
+    """保存计划到数据库（任务逐条写入 plan_tasks），等待写入完成后返回计划 id"""
     today = datetime.now().strftime("%Y-%m-%d")
-    tasks_json = json.dumps(plan_data.get('tasks', []))
+    tasks = list(plan_data.get('tasks', []))
     
+    future = _database().writer.submit(_insert_plan, today, title or "Daily Plan",
+                            plan_data.get('total_minutes', 0), tasks)
+    return future.result()
+
+def _insert_task_record(cursor, plan_id, task_index, task_name, scheduled_min, actual_min,
+                        focus_level, completed, completed_at, notes):
+    """写入任务记录并更新汇总（在写线程的事务内执行）"""
     cursor.execute('''
-        INSERT INTO plans (date, title, total_minutes, tasks_json)
-        VALUES (?, ?, ?, ?)
-    ''', (today, title or "Daily Plan", plan_data.get('total_minutes', 0), tasks_json))
-    
-    conn.commit()
-    plan_id = cursor.lastrowid
-    conn.close()
-    
-    return plan_id
+        INSERT INTO task_records 
+        (plan_id, plan_task_id, task_name, scheduled_minutes, actual_minutes,
+         focus_level, completed, completed_at, notes)
+        VALUES (?, (SELECT id FROM plan_tasks WHERE plan_id = ? AND position = ?),
+                ?, ?, ?, ?, ?, ?, ?)
+    ''', (plan_id, plan_id, task_index, task_name, scheduled_min, actual_min,
+          focus_level, completed, completed_at, notes))
+    record_id = cursor.lastrowid
+    
+    # 增量更新汇总（按计划日期归档）
+    row = cursor.execute("SELECT date FROM plans WHERE id = ?", (plan_id,)).fetchone()
+    if row:
+        rollups.add_record(cursor, row[0], scheduled_min, actual_min, focus_level, completed)
+    return record_id
 
 def save_task_record(plan_id: int, task_name: str, scheduled_min: int, 
-                     actual_min: int, focus_level: int, completed: bool, notes: str = ""):
-    """保存单个任务的执行记录"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+                     actual_min: int, focus_level: int, completed: bool, notes: str = "",
+                     task_index: int = None) -> Future:
+    """
+    保存单个任务的执行记录（task_index 为任务在计划中的序号，用于关联 plan_tasks）
     
+    写入在后台线程完成，返回的 Future 在落盘后给出记录 id
+    """
     completed_at = datetime.now() if completed else None
     
+    return _database().writer.submit(_insert_task_record, plan_id, task_index, task_name,
+                          scheduled_min, actual_min, focus_level, completed,
+                          completed_at, notes)
+
+def get_plan_tasks(plan_id: int):
+    """获取计划的任务列表"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
     cursor.execute('''
-        INSERT INTO task_records 
-        (plan_id, task_name, scheduled_minutes, actual_minutes, focus_level, completed, completed_at, notes)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (plan_id, task_name, scheduled_min, actual_min, focus_level, completed, completed_at, notes))
+        SELECT task_no, name, minutes, priority, focus, method, warning
+        FROM plan_tasks
+        WHERE plan_id = ?
+        ORDER BY position ASC
+    ''', (plan_id,))
     
-    conn.commit()
-    conn.close()
+    tasks = []
+    for task_no, name, minutes, priority, focus, method, warning in cursor.fetchall():
+        task = {
+            'id': task_no,
+            'name': name,
+            'minutes': minutes,
+            'priority': priority,
+            'focus': focus,
+            'method': method,
+            'warning': warning
+        }
+        # 缺失字段不返回，界面侧按默认值显示
+        tasks.append({k: v for k, v in task.items() if v is not None})
+    
+    return tasks
 
 def get_latest_plan():
     """获取最新的计划"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT id, date, total_minutes, tasks_json, status
+        SELECT id, date, total_minutes, status
         FROM plans
-        ORDER BY created_at DESC
+        ORDER BY created_at DESC, id DESC
         LIMIT 1
     ''')
     
     result = cursor.fetchone()
-    conn.close()
     
     if result:
-        plan_id, date, total_minutes, tasks_json, status = result
-        tasks = json.loads(tasks_json)
+        plan_id, date, total_minutes, status = result
         return {
             'id': plan_id,
             'date': date,
             'total_minutes': total_minutes,
-            'tasks': tasks,
+            'tasks': get_plan_tasks(plan_id),
             'status': status
         }
     return None
 
 def get_today_plan():
     """获取今天的计划"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     cursor = conn.cursor()
     
     today = datetime.now().strftime("%Y-%m-%d")
     
     cursor.execute('''
-        SELECT id, date, total_minutes, tasks_json, status
+        SELECT id, date, total_minutes, status
         FROM plans
         WHERE date = ?
-        ORDER BY created_at DESC
+        ORDER BY created_at DESC, id DESC
         LIMIT 1
     ''', (today,))
     
     result = cursor.fetchone()
-    conn.close()
     
     if result:
-        plan_id, date, total_minutes, tasks_json, status = result
-        tasks = json.loads(tasks_json)
+        plan_id, date, total_minutes, status = result
         return {
             'id': plan_id,
             'date': date,
             'total_minutes': total_minutes,
-            'tasks': tasks,
+            'tasks': get_plan_tasks(plan_id),
             'status': status
         }
     return None
 
 def get_all_plans(limit: int = 30):
     """获取所有计划"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -169,7 +312,6 @@ def get_all_plans(limit: int = 30):
     ''', (limit,))
     
     results = cursor.fetchall()
-    conn.close()
     
     plans = []
     for plan_id, date, total_minutes, status, created_at in results:
@@ -185,7 +327,7 @@ def get_all_plans(limit: int = 30):
 
 def get_plan_records(plan_id: int):
     """获取计划的所有任务记录"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -196,7 +338,6 @@ def get_plan_records(plan_id: int):
     ''', (plan_id,))
     
     results = cursor.fetchall()
-    conn.close()
     
     records = []
     for task_name, scheduled_min, actual_min, focus_level, completed, notes in results:
@@ -211,67 +352,370 @@ def get_plan_records(plan_id: int):
     
     return records
 
-def update_plan_status(plan_id: int, status: str):
-    """更新计划状态"""
-    conn = sqlite3.connect(DB_FILE)
+def get_task_history(limit: int = 500):
+    """最近的任务记录（新的在前），供离线规划按历史实际用时估算"""
+    conn = get_connection()
+    rows = conn.execute('''
+        SELECT tr.plan_id, tr.task_name, tr.scheduled_minutes, tr.actual_minutes,
+               tr.focus_level, tr.completed, pt.priority
+        FROM task_records tr
+        LEFT JOIN plan_tasks pt ON pt.id = tr.plan_task_id
+        ORDER BY tr.id DESC
+        LIMIT ?
+    ''', (limit,)).fetchall()
+    
+    return [
+        {
+            'plan_id': plan_id,
+            'task_name': task_name,
+            'scheduled_minutes': scheduled_min,
+            'actual_minutes': actual_min,
+            'focus_level': focus_level,
+            'completed': completed,
+            'priority': priority
+        }
+        for plan_id, task_name, scheduled_min, actual_min, focus_level, completed, priority in rows
+    ]
+
+def _plan_summaries(where: str = "1 = 1", params=(), limit: int = 30):
+    """按条件取最新的 limit 个计划并汇总其任务记录（单次聚合查询）"""
+    conn = get_connection()
     cursor = conn.cursor()
     
+    cursor.execute(f'''
+        SELECT 
+            p.id, p.date, p.total_minutes, p.status, p.created_at,
+            COUNT(tr.id) as task_count,
+            COALESCE(SUM(CASE WHEN tr.completed = 1 THEN 1 ELSE 0 END), 0) as completed_count,
+            COALESCE(SUM(tr.scheduled_minutes), 0) as scheduled,
+            COALESCE(SUM(tr.actual_minutes), 0) as actual
+        FROM (
+            SELECT id, date, total_minutes, status, created_at
+            FROM plans
+            WHERE {where}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        ) p
+        LEFT JOIN task_records tr ON tr.plan_id = p.id
+        GROUP BY p.id
+        ORDER BY p.created_at DESC, p.id DESC
+    ''', (*params, limit))
+    
+    results = cursor.fetchall()
+    
+    summaries = []
+    for (plan_id, date, total_minutes, status, created_at,
+         task_count, completed_count, scheduled, actual) in results:
+        summaries.append({
+            'id': plan_id,
+            'date': date,
+            'total_minutes': total_minutes,
+            'status': status,
+            'created_at': created_at,
+            'task_count': task_count,
+            'completed_count': completed_count,
+            'scheduled_minutes': scheduled,
+            'actual_minutes': actual
+        })
+    
+    return summaries
+
+def get_plan_summaries(limit: int = 30):
+    """获取计划列表及其任务汇总（单次聚合查询）"""
+    return _plan_summaries(limit=limit)
+
+def get_plans_page(cursor: tuple = None, page_size: int = 20, start: str = None,
+                   end: str = None, status: str = None) -> dict:
+    """
+    按创建时间倒序分页获取计划汇总（键集分页）
+    
+    cursor 为上一页返回的 next_cursor，即 (created_at, id)；按 (created_at, id) 定位下一页，
+    翻到多深都只扫描一页的行。start、end 为含两端的日期范围，status 为计划状态
+    返回 {'plans': [...], 'next_cursor': 下一页游标或 None}
+    """
+    clauses, params = [], []
+    if cursor:
+        clauses.append("(created_at, id) < (?, ?)")
+        params.extend(cursor)
+    if start:
+        clauses.append("date >= ?")
+        params.append(start)
+    if end:
+        clauses.append("date <= ?")
+        params.append(end)
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    
+    # 多取一行判断是否还有下一页
+    plans = _plan_summaries(" AND ".join(clauses) or "1 = 1", params, page_size + 1)
+    next_cursor = None
+    if len(plans) > page_size:
+        plans = plans[:page_size]
+        next_cursor = (plans[-1]['created_at'], plans[-1]['id'])
+    return {'plans': plans, 'next_cursor': next_cursor}
+
+def _update_plan_status(cursor, plan_id: int, status: str):
+    """更新计划状态并调整汇总（在写线程的事务内执行）"""
+    row = cursor.execute("SELECT date, status FROM plans WHERE id = ?", (plan_id,)).fetchone()
     cursor.execute('''
         UPDATE plans
         SET status = ?
         WHERE id = ?
     ''', (status, plan_id))
     
-    conn.commit()
-    conn.close()
+    if row:
+        rollups.change_plan_status(cursor, row[0], row[1], status)
 
-def get_statistics():
-    """获取统计数据"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+def update_plan_status(plan_id: int, status: str) -> Future:
+    """更新计划状态（后台写入，返回落盘后完成的 Future）"""
+    return _database().writer.submit(_update_plan_status, plan_id, status)
+
+def get_rollups(granularity: str = 'day', since: str = None, limit: int = None):
+    """读取日 / 周 / 月汇总（since 为日期，按所属桶过滤）"""
+    if granularity not in rollups.GRANULARITIES:
+        raise ValueError(f"未知的汇总粒度: {granularity}")
     
-    # 获取最近 30 天的数据
-    cursor.execute('''
-        SELECT 
-            date,
-            SUM(scheduled_minutes) as scheduled,
-            SUM(actual_minutes) as actual,
-            AVG(focus_level) as avg_focus,
-            COUNT(*) as task_count,
-            SUM(CASE WHEN completed = 1 THEN 1 ELSE 0 END) as completed_count
-        FROM task_records tr
-        JOIN plans p ON tr.plan_id = p.id
-        WHERE date >= date('now', '-30 days')
-        GROUP BY date
-        ORDER BY date DESC
-    ''')
+    conn = get_connection()
+    cursor = conn.cursor()
     
+    sql = '''
+        SELECT bucket, scheduled_minutes, actual_minutes, focus_sum, focus_count,
+               task_count, completed_count, plan_count, completed_plan_count
+        FROM rollups
+        WHERE granularity = ? AND task_count > 0
+    '''
+    params = [granularity]
+    if since:
+        sql += " AND bucket >= ?"
+        params.append(rollups.bucket_keys(since)[granularity])
+    sql += " ORDER BY bucket DESC"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    
+    cursor.execute(sql, params)
     results = cursor.fetchall()
-    conn.close()
     
     data = []
-    for date, scheduled, actual, avg_focus, task_count, completed_count in results:
+    for (bucket, scheduled, actual, focus_sum, focus_count, task_count,
+         completed_count, plan_count, completed_plan_count) in results:
         data.append({
-            'date': date,
-            'scheduled_minutes': scheduled or 0,
-            'actual_minutes': actual or 0,
-            'avg_focus_level': avg_focus or 0,
+            'bucket': bucket,
+            'scheduled_minutes': scheduled,
+            'actual_minutes': actual,
+            'avg_focus_level': (focus_sum / focus_count) if focus_count > 0 else 0,
             'task_count': task_count,
-            'completion_rate': (completed_count / task_count * 100) if task_count > 0 else 0
+            'completion_rate': (completed_count / task_count * 100) if task_count > 0 else 0,
+            'plan_count': plan_count,
+            'completed_plan_count': completed_plan_count
+        })
+    
+    return data
+
+def _archive_file(db_file: str = None) -> str:
+    """归档库与主库放在同一目录；默认库沿用 wallfacer_archive.db，用户库为 <档案名>_archive.db"""
+    db_file = db_file or _current_db_file()
+    if os.path.abspath(db_file) == os.path.abspath(DB_FILE):
+        return os.path.join(os.path.dirname(os.path.abspath(db_file)), archive.ARCHIVE_FILE)
+    return os.path.splitext(os.path.abspath(db_file))[0] + ARCHIVE_SUFFIX + ".db"
+
+def _attach_archive(conn, archive_file: str) -> tuple:
+    """存在归档库时附加它，返回汇总需要统计的库"""
+    if os.path.exists(archive_file):
+        archive.attach(conn, archive_file)
+        return ('main', 'archive')
+    return ('main',)
+
+def _rebuild_rollups(conn, archive_file: str) -> int:
+    """重建汇总，存在归档库时一并计入（在写线程的事务外执行）"""
+    schemas = _attach_archive(conn, archive_file)
+    try:
+        with conn:
+            return rollups.rebuild(conn.cursor(), schemas)
+    finally:
+        archive.detach(conn)
+
+def rebuild_rollups() -> int:
+    """从原始记录（含归档）重建全部汇总，返回汇总桶数量"""
+    return _database().writer.submit_exclusive(_rebuild_rollups, _archive_file()).result()
+
+def _bulk_import(conn, archive_file, plans, records, batch_size) -> dict:
+    """批量导入并重建汇总（在写线程的事务外执行）"""
+    schemas = _attach_archive(conn, archive_file)
+    try:
+        return importer.bulk_import(
+            conn, plans, records, batch_size,
+            rebuild_rollups=lambda cursor: rollups.rebuild(cursor, schemas)
+        )
+    finally:
+        archive.detach(conn)
+
+def bulk_import(plans_file: str = None, records_file: str = None, batch_size: int = 5000) -> dict:
+    """从 CSV / JSONL 文件批量导入计划和任务记录，返回行数与每秒行数"""
+    plans = importer.read_rows(plans_file) if plans_file else None
+    records = importer.read_rows(records_file) if records_file else None
+    return _database().writer.submit_exclusive(
+        _bulk_import, _archive_file(), plans, records, batch_size
+    ).result()
+
+def export_changes(filename: str = None, peer: str = sync.DEFAULT_PEER, full: bool = False) -> tuple:
+    """
+    导出上次同步给 peer 之后的变更（full 为 True 时导出全部），返回 (文件名, 统计)
+    
+    变更文件很小，可以放进网盘 / Git 仓库，在另一台机器上用 import_changes 合并
+    """
+    if filename is None:
+        filename = f"wallfacer_sync_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl.gz"
+    stats = _database().writer.submit(sync.export_changes, filename, peer, full).result()
+    return filename, stats
+
+def _import_changes(conn, archive_file, filename, peer) -> dict:
+    """合并变更文件并重建汇总（在写线程的事务外执行）"""
+    schemas = _attach_archive(conn, archive_file)
+    try:
+        return sync.import_changes(
+            conn, filename, peer, schemas,
+            rebuild_rollups=lambda cursor: rollups.rebuild(cursor, schemas)
+        )
+    finally:
+        archive.detach(conn)
+
+def import_changes(filename: str, peer: str = sync.DEFAULT_PEER) -> dict:
+    """合并另一台机器导出的变更文件（同一行以较新的修改为准），返回新增 / 更新 / 跳过的行数"""
+    return _database().writer.submit_exclusive(
+        _import_changes, _archive_file(), filename, peer
+    ).result()
+
+def list_sync_peers() -> list:
+    """各同步对象的导出 / 导入进度"""
+    return sync.list_peers(get_connection())
+
+def archive_old_data(days: int) -> dict:
+    """把 days 天之前的计划、任务和记录移入归档库（汇总保留），返回各表移动行数"""
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    writer = _database().writer
+    moved = writer.submit_exclusive(archive.archive_before, cutoff, _archive_file()).result()
+    writer.submit_exclusive(archive.incremental_vacuum, VACUUM_PAGES_PER_STEP)
+    return moved
+
+def vacuum_step(pages: int = VACUUM_PAGES_PER_STEP) -> int:
+    """执行一步增量清理，返回剩余空闲页数"""
+    return _database().writer.submit_exclusive(archive.incremental_vacuum, pages).result()
+
+# 定时热备份（由 schedule_backups 启动）
+_backup_scheduler = None
+_backup_lock = threading.Lock()
+
+def _backup_dir() -> str:
+    """备份目录与默认数据库放在同一目录，每个数据库一个子目录"""
+    return os.path.join(os.path.dirname(os.path.abspath(DB_FILE)), backup.BACKUP_DIR)
+
+def _backup_targets() -> list:
+    """需要定时备份的数据库：全部用户档案"""
+    return [profile_db_file(name, DB_FILE) for name in list_profiles(DB_FILE)]
+
+def backup_now(keep: int = backup.DEFAULT_GENERATIONS) -> str:
+    """立即在线备份当前数据库并轮换旧备份，返回备份文件路径"""
+    return backup.create_backup(_current_db_file(), _backup_dir(), keep)
+
+def list_backups() -> list:
+    """当前数据库的备份文件，最新的在前"""
+    return backup.list_backups(_current_db_file(), _backup_dir())
+
+def restore_backup(backup_path: str = None, keep: int = backup.DEFAULT_GENERATIONS) -> str:
+    """
+    用备份覆盖当前数据库（默认最新一份常规备份），返回恢复前自动做的安全备份路径
+    
+    恢复前先写完排队的写入并关闭连接，恢复后重新执行结构迁移（兼容旧版本的备份）；
+    安全备份不会被当作"最新备份"，连续两次默认恢复不会恢复成刚被替换掉的数据
+    """
+    db_file = _current_db_file()
+    if backup_path is None:
+        backup_path = backup.latest_backup(db_file, _backup_dir())
+        if backup_path is None:
+            raise FileNotFoundError("没有可用的备份")
+    backup.verify_backup(backup_path)
+    
+    # 安全备份不参与本次轮换，避免恢复前把要恢复的那份删掉
+    safety = (backup.create_backup(db_file, _backup_dir(), keep=None, safety=True)
+              if os.path.exists(db_file) else None)
+    _databases.discard(db_file)
+    conn = sqlite3.connect(db_file)
+    try:
+        backup.restore(backup_path, conn)
+    finally:
+        conn.close()
+    init_database()
+    backup.rotate(db_file, _backup_dir(), keep)
+    return safety
+
+def schedule_backups(interval_hours: float = 24, keep: int = backup.DEFAULT_GENERATIONS):
+    """启动或调整定时热备份（只备份有改动的库）；interval_hours 为 0 或 None 时停止"""
+    global _backup_scheduler
+    with _backup_lock:
+        if not interval_hours or interval_hours <= 0:
+            if _backup_scheduler is not None:
+                _backup_scheduler.stop()
+                _backup_scheduler = None
+            return
+        
+        interval = interval_hours * 3600
+        if _backup_scheduler is None:
+            _backup_scheduler = backup.BackupScheduler(_backup_targets, _backup_dir(), interval, keep)
+            _backup_scheduler.start()
+        elif (_backup_scheduler.interval, _backup_scheduler.keep) != (interval, keep):
+            _backup_scheduler.configure(interval, keep)
+
+def get_statistics():
+    """获取统计数据（最近 30 天，读取日汇总）"""
+    since = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+    
+    data = []
+    for row in get_rollups('day', since=since):
+        data.append({
+            'date': row['bucket'],
+            'scheduled_minutes': row['scheduled_minutes'],
+            'actual_minutes': row['actual_minutes'],
+            'avg_focus_level': row['avg_focus_level'],
+            'task_count': row['task_count'],
+            'completion_rate': row['completion_rate']
         })
     
     return data
 
-def export_to_csv(filename: str = None):
-    """导出数据为 CSV"""
-    stats = get_statistics()
-    df = pd.DataFrame(stats)
+def get_estimation_report():
+    """获取预估精度分析报告（数据库没有新的提交时直接用缓存）"""
+    database = _database()
+    return analytics.get_report(database.connections.get_connection(),
+                                (os.path.abspath(database.db_file), database.data_version()))
+
+def search(query: str, limit: int = 20) -> list:
+    """全文搜索任务记录（任务名、备注）和计划任务（名称、方法），按相关度排序（包括已归档的）"""
+    conn = get_connection()
+    # 新写入的行先由写线程分词写入索引
+    if fulltext.has_pending(conn):
+        _database().writer.submit(fulltext.index_pending).result()
+    # 附加归档库以取得已归档结果的计划日期
+    schemas = _attach_archive(conn, _archive_file())
+    try:
+        return fulltext.search(conn, query, limit)
+    finally:
+        if 'archive' in schemas:
+            archive.detach(conn)
+
+def export_table(table: str, fmt: str = 'csv', filename: str = None,
+                 start: str = None, end: str = None):
+    """
+    流式导出数据表（plans / tasks / records / rollups）
     
+    支持 csv / jsonl / parquet，start、end 为含两端的日期范围，返回 (文件名, 行数)
+    """
     if filename is None:
-        filename = f"wallfacer_stats_{datetime.now().strftime('%Y%m%d')}.csv"
+        filename = exporter.default_filename(table, fmt, start, end)
     
-    df.to_csv(filename, index=False, encoding='utf-8-sig')
-    return filename
+    count = exporter.export(get_connection(), table, fmt, filename, start, end)
+    return filename, count
 
 # 初始化数据库
 init_database()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 数据导出模块
+按固定大小分块遍历游标，流式写出 CSV / JSON Lines / Parquet，内存占用与数据量无关
+"""
+
+import csv
+import json
+
+import rollups
+
+FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'jsonl': ('.jsonl', 'application/x-ndjson'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+
+# 表名 -> (查询, 列及类型)；查询中的 {where} 由日期范围填充
+EXPORT_TABLES = {
+    'plans': ('''
+        SELECT id, date, title, total_minutes, status, created_at
+        FROM plans
+        WHERE {where}
+        ORDER BY id
+    ''', [('id', 'int'), ('date', 'str'), ('title', 'str'), ('total_minutes', 'int'),
+          ('status', 'str'), ('created_at', 'str')]),
+    'tasks': ('''
+        SELECT pt.id, pt.plan_id, p.date, pt.position, pt.task_no, pt.name, pt.minutes,
+               pt.priority, pt.focus, pt.method, pt.warning
+        FROM plan_tasks pt
+        JOIN plans p ON pt.plan_id = p.id
+        WHERE {where}
+        ORDER BY pt.id
+    ''', [('id', 'int'), ('plan_id', 'int'), ('date', 'str'), ('position', 'int'),
+          ('task_no', 'int'), ('name', 'str'), ('minutes', 'int'), ('priority', 'str'),
+          ('focus', 'int'), ('method', 'str'), ('warning', 'str')]),
+    'records': ('''
+        SELECT tr.id, tr.plan_id, tr.plan_task_id, p.date, tr.task_name,
+               tr.scheduled_minutes, tr.actual_minutes, tr.focus_level, tr.completed,
+               tr.completed_at, tr.notes
+        FROM task_records tr
+        JOIN plans p ON tr.plan_id = p.id
+        WHERE {where}
+        ORDER BY tr.id
+    ''', [('id', 'int'), ('plan_id', 'int'), ('plan_task_id', 'int'), ('date', 'str'),
+          ('task_name', 'str'), ('scheduled_minutes', 'int'), ('actual_minutes', 'int'),
+          ('focus_level', 'int'), ('completed', 'int'), ('completed_at', 'str'),
+          ('notes', 'str')]),
+    'rollups': ('''
+        SELECT granularity, bucket, scheduled_minutes, actual_minutes, focus_sum,
+               focus_count, task_count, completed_count, plan_count, completed_plan_count
+        FROM rollups
+        WHERE {where}
+        ORDER BY granularity, bucket
+    ''', [('granularity', 'str'), ('bucket', 'str'), ('scheduled_minutes', 'int'),
+          ('actual_minutes', 'int'), ('focus_sum', 'int'), ('focus_count', 'int'),
+          ('task_count', 'int'), ('completed_count', 'int'), ('plan_count', 'int'),
+          ('completed_plan_count', 'int')]),
+}
+
+
+def _date_filter(table: str, start: str = None, end: str = None):
+    """根据日期范围 (YYYY-MM-DD，含两端) 生成 WHERE 条件"""
+    if table == 'rollups':
+        # 汇总按各粒度的桶过滤
+        clauses, params = [], []
+        for granularity in rollups.GRANULARITIES:
+            clause = "(granularity = ?"
+            params.append(granularity)
+            if start:
+                clause += " AND bucket >= ?"
+                params.append(rollups.bucket_keys(start)[granularity])
+            if end:
+                clause += " AND bucket <= ?"
+                params.append(rollups.bucket_keys(end)[granularity])
+            clauses.append(clause + ")")
+        return " OR ".join(clauses), params
+
+    column = "date" if table == 'plans' else "p.date"
+    clauses, params = ["1 = 1"], []
+    if start:
+        clauses.append(f"{column} >= ?")
+        params.append(start)
+    if end:
+        clauses.append(f"{column} <= ?")
+        params.append(end)
+    return " AND ".join(clauses), params
+
+
+def iter_chunks(conn, table: str, start: str = None, end: str = None, chunk_size: int = 1000):
+    """按块遍历导出行，每次产出一个行列表"""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"未知的导出表: {table}")
+
+    sql, _columns = EXPORT_TABLES[table]
+    where, params = _date_filter(table, start, end)
+    cursor = conn.cursor()
+    cursor.execute(sql.format(where=where), params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def _write_csv(path, columns, chunks):
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+def _write_jsonl(path, columns, chunks):
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for rows in chunks:
+            f.writelines(
+                json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows
+            )
+            count += len(rows)
+    return count
+
+
+def _write_parquet(path, column_types, chunks):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("导出 Parquet 需要安装 pyarrow: pip install pyarrow")
+
+    arrow_types = {'int': pa.int64(), 'str': pa.string(), 'float': pa.float64()}
+    schema = pa.schema([(name, arrow_types[kind]) for name, kind in column_types])
+    columns = [name for name, _ in column_types]
+
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in chunks:
+            batch = {name: [row[i] for row in rows] for i, name in enumerate(columns)}
+            writer.write_table(pa.Table.from_pydict(batch, schema=schema))
+            count += len(rows)
+    return count
+
+
+def export(conn, table: str, fmt: str, path: str, start: str = None, end: str = None,
+           chunk_size: int = 1000) -> int:
+    """把指定表导出到文件，返回导出行数"""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"未知的导出表: {table}")
+    if fmt not in FORMATS:
+        raise ValueError(f"未知的导出格式: {fmt}")
+
+    chunks = iter_chunks(conn, table, start, end, chunk_size)
+    return write_rows(fmt, path, EXPORT_TABLES[table][1], chunks)
+
+
+def write_rows(fmt: str, path: str, column_types, chunks) -> int:
+    """把按块产出的行（元组，列顺序同 column_types）写成指定格式，返回行数"""
+    if fmt not in FORMATS:
+        raise ValueError(f"未知的导出格式: {fmt}")
+    if fmt == 'parquet':
+        return _write_parquet(path, column_types, chunks)
+
+    columns = [name for name, _ in column_types]
+    if fmt == 'jsonl':
+        return _write_jsonl(path, columns, chunks)
+    return _write_csv(path, columns, chunks)
+
+
+def default_filename(table: str, fmt: str, start: str = None, end: str = None) -> str:
+    """生成默认导出文件名"""
+    span = "_".join(part.replace("-", "") for part in (start, end) if part) or "all"
+    return f"wallfacer_{table}_{span}{FORMATS[fmt][0]}"
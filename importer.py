@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 批量导入模块
+从 CSV / JSON Lines 批量导入计划和任务记录：大事务 + executemany，
+索引和汇总在导入结束后统一重建
+"""
+
+import csv
+import json
+import os
+import time
+from datetime import datetime
+
+import rollups
+
+# 导入期间暂时删除的二级索引所在的表
+_INDEXED_TABLES = ('plans', 'plan_tasks', 'task_records')
+
+_TRUE_VALUES = {'1', 'true', 'yes', 'y', 't', '是', '完成'}
+
+
+def read_rows(path: str):
+    """按行读取 CSV 或 JSON Lines 文件（按扩展名判断），产出字典"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.jsonl', '.ndjson', '.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    elif ext == '.csv':
+        with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+            yield from csv.DictReader(f)
+    else:
+        raise ValueError(f"不支持的导入格式: {ext}（仅支持 .csv / .jsonl）")
+
+
+def _int(value, default=None):
+    if value is None or value == '':
+        return default
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def _bool(value) -> int:
+    if isinstance(value, bool):
+        return int(value)
+    return 1 if str(value).strip().lower() in _TRUE_VALUES else 0
+
+
+def _date(value) -> str:
+    """规范化为 YYYY-MM-DD，无法解析时报错"""
+    text = str(value or '').strip()[:10].replace('/', '-')
+    return datetime.strptime(text, "%Y-%m-%d").strftime("%Y-%m-%d")
+
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _drop_indexes(cursor) -> list:
+    """删除二级索引并返回其建表语句，导入完成后重建"""
+    placeholders = ", ".join("?" for _ in _INDEXED_TABLES)
+    indexes = cursor.execute(f'''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+    ''', _INDEXED_TABLES).fetchall()
+    for name, _sql in indexes:
+        cursor.execute(f'DROP INDEX "{name}"')
+    return [sql for _name, sql in indexes]
+
+
+def _next_plan_id(cursor) -> int:
+    """
+    导入计划的起始 id：大于主库、已附加的归档库和自增序列中用过的所有 id
+
+    只看主库的 MAX(id) 会与已移入归档库的计划重号，重建汇总时重复统计，下次归档时还会覆盖归档中的计划
+    """
+    used = [
+        cursor.execute("SELECT MAX(id) FROM main.plans").fetchone()[0],
+        (cursor.execute("SELECT seq FROM main.sqlite_sequence WHERE name = 'plans'").fetchone() or [None])[0],
+    ]
+    if 'archive' in [row[1] for row in cursor.execute("PRAGMA database_list")]:
+        used.append(cursor.execute("SELECT MAX(id) FROM archive.plans").fetchone()[0])
+    return max(value or 0 for value in used) + 1
+
+
+def bulk_import(conn, plans=None, records=None, batch_size=5000, rebuild_rollups=None) -> dict:
+    """
+    批量导入计划和任务记录（需在事务外调用）
+
+    plans: 可迭代的计划字典（id 可选、date 必填，title / total_minutes / status / created_at 可选）
+    records: 可迭代的记录字典；通过 plan_id 关联导入文件中的计划 id 或库中已有计划，
+             没有 plan_id 时按 date 自动为每天生成一个导入计划
+    rebuild_rollups: 重建汇总的函数 rebuild(cursor)，默认只统计主库
+    返回各表导入行数、耗时和每秒行数
+    """
+    started = time.perf_counter()
+    stats = {'plans': 0, 'task_records': 0}
+    cursor = conn.cursor()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        index_sql = _drop_indexes(cursor)
+
+        # 导入计划显式分配 id，便于 executemany 的同时把源 id 映射到新 id
+        next_id = _next_plan_id(cursor)
+        plan_ids = {}       # 源文件中的计划 id -> 新 id
+        date_plans = {}     # 按日期自动生成的计划 -> 新 id
+        imported_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        for batch in _batched(plans or (), batch_size):
+            rows = []
+            for plan in batch:
+                source_id = plan.get('id')
+                if source_id not in (None, ''):
+                    plan_ids[str(source_id)] = next_id
+                rows.append((
+                    next_id,
+                    _date(plan.get('date')),
+                    plan.get('title') or "Imported Plan",
+                    _int(plan.get('total_minutes'), 0),
+                    plan.get('status') or 'completed',
+                    plan.get('created_at') or imported_at,
+                ))
+                next_id += 1
+            cursor.executemany('''
+                INSERT INTO plans (id, date, title, total_minutes, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            stats['plans'] += len(rows)
+
+        for batch in _batched(records or (), batch_size):
+            rows = []
+            for record in batch:
+                source_plan = record.get('plan_id')
+                if source_plan not in (None, ''):
+                    plan_id = plan_ids.get(str(source_plan), _int(source_plan))
+                else:
+                    day = _date(record.get('date'))
+                    if day not in date_plans:
+                        cursor.execute('''
+                            INSERT INTO plans (id, date, title, total_minutes, status, created_at)
+                            VALUES (?, ?, ?, 0, 'completed', ?)
+                        ''', (next_id, day, f"导入 {day}", imported_at))
+                        date_plans[day] = next_id
+                        next_id += 1
+                        stats['plans'] += 1
+                    plan_id = date_plans[day]
+
+                completed = _bool(record.get('completed', 1))
+                rows.append((
+                    plan_id,
+                    record.get('task_name') or record.get('name') or "未命名任务",
+                    _int(record.get('scheduled_minutes')),
+                    _int(record.get('actual_minutes')),
+                    _int(record.get('focus_level')),
+                    completed,
+                    record.get('completed_at') or None,
+                    record.get('notes') or "",
+                ))
+            cursor.executemany('''
+                INSERT INTO task_records
+                (plan_id, task_name, scheduled_minutes, actual_minutes, focus_level,
+                 completed, completed_at, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            stats['task_records'] += len(rows)
+
+        # 导入完成后统一重建索引和汇总
+        for sql in index_sql:
+            cursor.execute(sql)
+        (rebuild_rollups or rollups.rebuild)(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    elapsed = time.perf_counter() - started
+    total = stats['plans'] + stats['task_records']
+    stats['seconds'] = round(elapsed, 3)
+    stats['rows_per_second'] = round(total / elapsed) if elapsed > 0 else total
+    return stats
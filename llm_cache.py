@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - AI 响应缓存模块
+把计划优化结果按（规范化的计划文本、提示词版本、模型、温度）缓存到本地 SQLite 文件，
+带过期时间（TTL）和按最近使用淘汰（LRU），相同的日常计划再次优化时直接返回
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+CACHE_FILE = "llm_cache.db"
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 200
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """规范化计划文本：全角转半角、统一大小写、压缩空白，只差空格或标点宽度的输入视为相同"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return _WHITESPACE_RE.sub(' ', text).strip().lower()
+
+
+def make_key(text: str, prompt_version: str, model: str, temperature: float, system_prompt: str = '') -> str:
+    """缓存键；system_prompt 一并参与哈希，修改提示词后旧结果自动失效"""
+    payload = json.dumps(
+        [prompt_version, model, round(float(temperature), 3), system_prompt, normalize_text(text)],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """磁盘上的 AI 响应缓存（线程安全）"""
+
+    def __init__(self, path: str = CACHE_FILE, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    def configure(self, ttl_seconds: float = None, max_entries: int = None):
+        if ttl_seconds is not None:
+            self.ttl_seconds = ttl_seconds
+        if max_entries is not None:
+            self.max_entries = max_entries
+
+    def get(self, key: str):
+        """读取缓存（过期的条目删除后视为未命中），命中时刷新最近使用时间"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_used = ?, hit_count = hit_count + 1 WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute('''
+                INSERT OR REPLACE INTO responses (key, value, created_at, last_used)
+                VALUES (?, ?, ?, ?)
+            ''', (key, json.dumps(value, ensure_ascii=False), now, now))
+            self._evict(now)
+
+    def _evict(self, now: float):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        if self.max_entries is not None:
+            self._conn.execute('''
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            ''', (max(0, int(self.max_entries)),))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+        self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        """命中 / 未命中次数（本进程）和当前条目数"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path: str = CACHE_FILE) -> ResponseCache:
+    """获取进程内共用的缓存实例（每个文件一个）"""
+    key = os.path.abspath(path)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ResponseCache(path)
+        return _caches[key]
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - AI 调用容错模块
+包装 OpenAI 兼容客户端的 chat.completions.create：
+- 按调用类型设定总时限（含重试），超时即放弃，尾延迟有上界
+- 瞬时错误（超时、连接失败、限流、5xx）按带随机抖动的指数退避重试
+- 请求超过该类型历史 p95 延迟仍未响应时，再发一个相同的请求，取先返回的一个（对冲请求）
+- 熔断器：连续失败达到阈值后一段时间内直接失败，由调用方走备用方案，之后放行一个探测请求
+
+流式请求的延迟以收到第一段数据计；开始输出后不再重试（已显示的内容无法撤回）
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    import openai
+    _TRANSIENT_ERRORS = (openai.APITimeoutError, openai.APIConnectionError,
+                         openai.RateLimitError, openai.InternalServerError)
+except ImportError:  # openai 未安装时只按状态码和内置异常判断
+    _TRANSIENT_ERRORS = ()
+
+logger = logging.getLogger(__name__)
+
+# 各类调用的总时限（秒），包含重试和退避等待
+DEFAULT_DEADLINES = {
+    'optimize': 90.0,
+    'chat': 45.0,
+    'suggestion': 15.0,
+    'summary': 20.0,
+}
+DEFAULT_DEADLINE = 60.0
+DEFAULT_MAX_RETRIES = 2
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+# 对冲：至少积累这么多次延迟样本后才按 p95 发起
+HEDGE_MIN_SAMPLES = 10
+HEDGE_PERCENTILE = 0.95
+LATENCY_WINDOW = 100
+
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+
+
+class LLMUnavailable(Exception):
+    """AI 服务当前不可用（超时或熔断），调用方应走备用方案"""
+
+
+class DeadlineExceeded(LLMUnavailable):
+    """超过该类调用的总时限"""
+
+
+class CircuitOpenError(LLMUnavailable):
+    """熔断中，请求未发出"""
+
+
+def is_transient(error: Exception) -> bool:
+    """是否为值得重试的瞬时错误；认证失败、参数错误等重试也不会成功"""
+    if isinstance(error, _TRANSIENT_ERRORS) or isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, 'status_code', None)
+    return status in (408, 409, 429) or (isinstance(status, int) and status >= 500)
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """第 attempt 次重试前的等待时间（full jitter：0 到指数上限之间均匀随机）"""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+class CircuitBreaker:
+    """连续失败计数熔断器（closed → open → half-open → closed）"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否放行请求；熔断到期后只放行一个探测请求"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+                return True
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("AI 服务恢复，熔断关闭")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                logger.warning("AI 服务连续失败 %d 次，熔断 %.0f 秒", self.failures, self.reset_seconds)
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def retry_in(self) -> float:
+        """熔断中时距离放行探测请求的秒数"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+
+class LatencyTracker:
+    """按调用类型保留最近的成功延迟，用于计算对冲阈值"""
+
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(kind, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, kind: str, q: float = HEDGE_PERCENTILE):
+        """样本不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._samples.get(kind, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def _close(response):
+    close = getattr(response, 'close', None)
+    if close is not None:
+        try:
+            close()
+        except Exception:
+            pass
+
+
+class ResilientLLM:
+    """带时限、重试、对冲和熔断的 AI 调用（进程内共用，熔断状态对所有会话生效）"""
+
+    def __init__(self, deadlines: dict = None, max_retries: int = DEFAULT_MAX_RETRIES, hedge: bool = True,
+                 breaker: CircuitBreaker = None, latency: LatencyTracker = None, max_workers: int = 8):
+        self.deadlines = dict(DEFAULT_DEADLINES, **(deadlines or {}))
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = latency or LatencyTracker()
+        self.counters = {'calls': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0,
+                         'timeouts': 0, 'fast_fails': 0, 'failures': 0}
+        self._counter_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wallfacer-llm-call")
+
+    def configure(self, deadlines: dict = None, max_retries: int = None, hedge: bool = None,
+                  failure_threshold: int = None, reset_seconds: float = None):
+        if deadlines:
+            self.deadlines.update({kind: float(seconds) for kind, seconds in deadlines.items()})
+        if max_retries is not None:
+            self.max_retries = int(max_retries)
+        if hedge is not None:
+            self.hedge = bool(hedge)
+        if failure_threshold is not None:
+            self.breaker.failure_threshold = int(failure_threshold)
+        if reset_seconds is not None:
+            self.breaker.reset_seconds = float(reset_seconds)
+
+    def deadline_for(self, kind: str) -> float:
+        return self.deadlines.get(kind, DEFAULT_DEADLINE)
+
+    def _count(self, name: str, info: dict = None):
+        with self._counter_lock:
+            self.counters[name] += 1
+        if info is not None and name in ('retries', 'hedges'):
+            info[name] = info.get(name, 0) + 1
+
+    def complete(self, client, kind: str, info: dict = None, **kwargs):
+        """非流式调用，返回完整响应"""
+        def attempt(timeout):
+            return client.chat.completions.create(timeout=timeout, **kwargs), None
+        response, _ = self._call(kind, attempt, info)
+        return response
+
+    def stream(self, client, kind: str, info: dict = None, **kwargs):
+        """流式调用，逐个产出响应块；总时限在取数过程中同样生效"""
+        def attempt(timeout):
+            response = client.chat.completions.create(stream=True, timeout=timeout, **kwargs)
+            chunks = iter(response)
+            first = next(chunks, None)
+            return (first, chunks), response
+
+        deadline = time.monotonic() + self.deadline_for(kind)
+        (first, chunks), response = self._call(kind, attempt, info, deadline)
+        try:
+            if first is None:
+                return
+            yield first
+            for chunk in chunks:
+                if time.monotonic() > deadline:
+                    self._count('timeouts')
+                    self.breaker.record_failure()
+                    raise DeadlineExceeded(f"AI 响应超过 {self.deadline_for(kind):.0f} 秒时限")
+                yield chunk
+        except Exception as e:
+            if not isinstance(e, LLMUnavailable) and is_transient(e):
+                self.breaker.record_failure()
+            raise
+        finally:
+            _close(response)
+
+    def _call(self, kind: str, attempt, info: dict = None, deadline: float = None):
+        """执行 attempt(timeout) -> (结果, 需要关闭的响应)，带重试和熔断"""
+        self._count('calls')
+        if deadline is None:
+            deadline = time.monotonic() + self.deadline_for(kind)
+        if not self.breaker.allow():
+            self._count('fast_fails')
+            raise CircuitOpenError(f"AI 服务暂不可用（熔断中，{self.breaker.retry_in():.0f} 秒后重试）")
+
+        retries = 0
+        while True:
+            try:
+                result = self._hedged(kind, attempt, deadline, info)
+            except DeadlineExceeded:
+                self._count('timeouts')
+                self.breaker.record_failure()
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    # 服务有响应（如认证失败、参数错误），不计入熔断
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                retries += 1
+                delay = backoff_delay(retries)
+                if retries > self.max_retries or time.monotonic() + delay >= deadline or not self.breaker.allow():
+                    self._count('failures')
+                    raise
+                logger.info("AI 调用失败（%s），%.2f 秒后第 %d 次重试", e, delay, retries)
+                self._count('retries', info)
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _hedged(self, kind: str, attempt, deadline: float, info: dict = None):
+        """执行一次请求；超过 p95 延迟未返回时发出第二个相同请求，取先成功的一个"""
+        started = time.monotonic()
+        hedge_after = self.latency.percentile(kind) if self.hedge else None
+        primary = self._pool.submit(attempt, max(0.1, deadline - started))
+        pending = {primary}
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._abandon(pending)
+                raise DeadlineExceeded(f"AI 响应超过 {self.deadline_for(kind):.0f} 秒时限")
+            timeout = remaining
+            if hedge_after is not None:
+                timeout = min(remaining, max(0.0, started + hedge_after - time.monotonic()))
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                self.latency.add(kind, time.monotonic() - started)
+                if future is not primary:
+                    self._count('hedge_wins')
+                self._abandon(pending | (done - {future}))
+                return future.result()
+
+            if hedge_after is not None and not done:
+                # 超过 p95 仍未返回：发出对冲请求（每次尝试最多一个）
+                hedge_after = None
+                self._count('hedges', info)
+                pending.add(self._pool.submit(attempt, max(0.1, deadline - time.monotonic())))
+            elif done:
+                # 其中一个失败：不再对冲，等待剩下的请求
+                hedge_after = None
+        raise error
+
+    def _abandon(self, futures):
+        """放弃未完成的请求：完成后关闭其响应（流式请求会断开连接）"""
+        for future in futures:
+            future.add_done_callback(
+                lambda f: f.exception() is None and _close(f.result()[1])
+            )
+
+    def stats(self) -> dict:
+        with self._counter_lock:
+            counters = dict(self.counters)
+        return dict(
+            counters,
+            breaker=self.breaker.state,
+            retry_in=round(self.breaker.retry_in(), 1),
+            p95={kind: self.latency.percentile(kind) for kind in self.deadlines},
+        )
+
+
+_resilient = None
+_resilient_lock = threading.Lock()
+
+
+def get_resilient() -> ResilientLLM:
+    """获取进程内共用的容错调用器"""
+    global _resilient
+    with _resilient_lock:
+        if _resilient is None:
+            _resilient = ResilientLLM()
+        return _resilient
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 后台 AI 任务模块
+进程内共用的线程池在后台执行 AI 调用，页面脚本只提交任务、在之后的 rerun 中查询状态和取结果，
+等待 API 时计时器和按钮照常响应
+
+任务函数运行在线程池中，不能调用 streamlit（没有脚本上下文），所需的客户端、参数都要显式传入
+"""
+
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+# 完成后一直没人取的任务保留多久（秒），例如用户关掉了页面
+KEEP_FINISHED_SECONDS = 600
+
+PENDING, RUNNING, DONE, FAILED, CANCELLED = "pending", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    """一个后台 AI 任务：状态、流式输出的部分文本和条目、结果或错误、耗时"""
+
+    def __init__(self, job_id: str, kind: str):
+        self.id = job_id
+        self.kind = kind
+        self.status = PENDING
+        self.text = ""
+        self.items = []  # 流式输出中已解析出的条目（如已生成的任务）
+        self.result = None
+        self.error = None
+        self.timing = {}
+        self.created_at = time.time()
+        self.finished_at = None
+        self._cancelled = threading.Event()
+
+    def append(self, delta: str):
+        """追加流式输出的文本（在工作线程中调用）"""
+        self.text += delta
+
+    def cancel(self):
+        """请求取消，任务函数在下一段输出时检查 cancelled 后退出"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.created_at
+
+
+class LLMWorker:
+    """后台 AI 任务线程池 - 提交返回任务 id，按 id 查询"""
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, keep_seconds: float = KEEP_FINISHED_SECONDS):
+        self.keep_seconds = keep_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wallfacer-llm")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def submit(self, kind: str, func, *args, **kwargs) -> Job:
+        """提交任务 func(job, *args, **kwargs)，返回值作为 job.result"""
+        self._prune()
+        job = Job(f"{kind}-{next(self._ids)}", kind)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job: Job, func, args, kwargs):
+        if job.cancelled:
+            job.finished_at, job.status = time.time(), CANCELLED
+            return
+        job.status = RUNNING
+        try:
+            job.result = func(job, *args, **kwargs)
+            status = CANCELLED if job.cancelled else DONE
+        except Exception as e:
+            logger.exception("后台 AI 任务 %s 失败", job.id)
+            job.error = str(e)
+            status = FAILED
+        # 先记完成时间再改状态：其他线程看到 done 时 finished_at 一定已设置
+        job.finished_at = time.time()
+        job.status = status
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pop(self, job_id: str):
+        """取走已完成的任务（之后不再保留）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.done:
+                del self._jobs[job_id]
+            return job
+
+    def cancel(self, job_id: str):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def _prune(self):
+        """丢弃完成后长时间没人取的任务"""
+        cutoff = time.time() - self.keep_seconds
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values()
+                           if j.done and j.finished_at is not None and j.finished_at < cutoff]:
+                del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        """各状态的任务数"""
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in (PENDING, RUNNING, DONE, FAILED, CANCELLED)}
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        self._executor.shutdown(wait=wait)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker(max_workers: int = DEFAULT_WORKERS) -> LLMWorker:
+    """获取进程内共用的任务线程池（所有会话共享）"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = LLMWorker(max_workers)
+        return _worker
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 命令行维护工具
+
+用法:
+    python manage.py rebuild-rollups     # 从原始记录重建日/周/月汇总
+    python manage.py export records --format jsonl --start 2025-01-01
+    python manage.py archive --days 365  # 把一年前的数据移入归档库
+    python manage.py import --plans plans.csv --records records.jsonl
+    python manage.py generate --records 100000 --db scratch.db
+    python manage.py vacuum              # 增量回收空闲页
+    python manage.py backup              # 立即在线备份（保留最近 7 份）
+    python manage.py restore             # 从最新的备份恢复（不含恢复前的安全备份）
+    python manage.py sync-export -o changes.jsonl.gz   # 导出上次同步后的变更
+    python manage.py sync-import changes.jsonl.gz      # 合并另一台机器的变更
+    python manage.py --user alice export plans   # 指定用户档案（默认 default）
+"""
+
+import argparse
+import os
+import sys
+
+import backup
+import data_manager
+from exporter import EXPORT_TABLES, FORMATS
+
+
+def cmd_rebuild_rollups(args):
+    """重建汇总表"""
+    count = data_manager.rebuild_rollups()
+    print(f"✅ 汇总已重建，共 {count} 个汇总桶")
+
+
+def cmd_export(args):
+    """流式导出数据表"""
+    filename, count = data_manager.export_table(
+        args.table, args.format, filename=args.output, start=args.start, end=args.end
+    )
+    print(f"✅ 已导出 {count} 行到 {filename}")
+
+
+def cmd_archive(args):
+    """归档旧数据"""
+    moved = data_manager.archive_old_data(args.days)
+    detail = "，".join(f"{table} {count} 行" for table, count in moved.items())
+    print(f"✅ 已归档 {args.days} 天前的数据: {detail}")
+
+
+def cmd_vacuum(args):
+    """增量回收空闲页"""
+    remaining = data_manager.vacuum_step(args.pages)
+    while args.all and remaining > 0:
+        remaining = data_manager.vacuum_step(args.pages)
+    print(f"✅ 增量清理完成，剩余空闲页 {remaining}")
+
+
+def cmd_backup(args):
+    """在线备份或列出备份"""
+    if args.list:
+        backups = data_manager.list_backups()
+        for path in backups:
+            label = "  (恢复前的安全备份)" if backup.is_safety_backup(path) else ""
+            print(f"{path}  {os.path.getsize(path) / 1024:.0f} KB{label}")
+        if not backups:
+            print("暂无备份")
+        return 0
+    path = data_manager.backup_now(args.keep)
+    print(f"✅ 已备份到 {path}")
+    return 0
+
+
+def cmd_restore(args):
+    """从备份恢复当前数据库"""
+    try:
+        safety = data_manager.restore_backup(args.file, args.keep)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ 已从 {args.file or '最新备份'} 恢复")
+    if safety:
+        print(f"   恢复前的数据已备份到 {safety}")
+    return 0
+
+
+def cmd_sync_export(args):
+    """导出增量变更"""
+    filename, stats = data_manager.export_changes(args.output, args.peer, args.full)
+    print(f"✅ 已导出到 {filename}（{stats['bytes'] / 1024:.1f} KB）: 计划 {stats['plans']} 行，"
+          f"任务 {stats['plan_tasks']} 行，记录 {stats['task_records']} 行")
+    return 0
+
+
+def cmd_sync_import(args):
+    """合并增量变更"""
+    try:
+        stats = data_manager.import_changes(args.file, args.peer)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ 同步完成: 新增 {stats['inserted']} 行，更新 {stats['updated']} 行，"
+          f"跳过 {stats['skipped']} 行（本地较新或相同）")
+    if stats['missing'] or stats['conflicts']:
+        print(f"   {stats['missing']} 行缺少所属计划或已归档，{stats['conflicts']} 行与本地数据冲突，未导入")
+    if stats['gap']:
+        print("⚠️ 对方的变更文件不连续（中间有文件没有导入），请让对方用 sync-export --full 重新导出")
+    return 0
+
+
+def cmd_sync_status(args):
+    """查看同步进度"""
+    peers = data_manager.list_sync_peers()
+    for peer in peers:
+        print(f"{peer['peer']}: 已导出到 #{peer['sent_seq']}（{peer['last_export'] or '从未'}），"
+              f"已导入对方 #{peer['received_seq']}（{peer['last_import'] or '从未'}）")
+    if not peers:
+        print("尚未同步过")
+    return 0
+
+
+def cmd_import(args):
+    """批量导入计划和任务记录"""
+    if not args.plans and not args.records:
+        print("❌ 请至少指定 --plans 或 --records")
+        return 1
+    stats = data_manager.bulk_import(args.plans, args.records, args.batch_size)
+    print(f"✅ 导入完成: 计划 {stats['plans']} 行，记录 {stats['task_records']} 行，"
+          f"耗时 {stats['seconds']}s（{stats['rows_per_second']} 行/秒）")
+    return 0
+
+
+def cmd_generate(args):
+    """生成合成数据到临时数据库"""
+    import benchmark
+
+    if os.path.exists(args.db):
+        print(f"❌ {args.db} 已存在，请指定新的临时数据库文件")
+        return 1
+    data_manager.use_database(args.db)
+    counts = benchmark.generate_dataset(data_manager.get_connection(), args.records, args.seed)
+    print(f"✅ 已生成 {counts['plans']} 个计划、{counts['task_records']} 条记录到 {args.db}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="执剑人系统 - 数据维护工具")
+    parser.add_argument("--user", help="用户档案名（默认 default，即 wallfacer_data.db）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("rebuild-rollups", help="从原始记录重建日/周/月汇总")
+    p.set_defaults(func=cmd_rebuild_rollups)
+
+    p = subparsers.add_parser("export", help="导出数据表 (CSV / JSONL / Parquet)")
+    p.add_argument("table", choices=list(EXPORT_TABLES))
+    p.add_argument("--format", choices=list(FORMATS), default="csv")
+    p.add_argument("--start", help="起始日期 YYYY-MM-DD（含）")
+    p.add_argument("--end", help="结束日期 YYYY-MM-DD（含）")
+    p.add_argument("-o", "--output", help="输出文件名（默认自动生成）")
+    p.set_defaults(func=cmd_export)
+
+    p = subparsers.add_parser("archive", help="把超过保留期的计划和记录移入归档库")
+    p.add_argument("--days", type=int, required=True, help="保留最近多少天的数据")
+    p.set_defaults(func=cmd_archive)
+
+    p = subparsers.add_parser("vacuum", help="增量回收空闲页")
+    p.add_argument("--pages", type=int, default=256, help="每步回收的页数")
+    p.add_argument("--all", action="store_true", help="重复执行直到没有空闲页")
+    p.set_defaults(func=cmd_vacuum)
+
+    p = subparsers.add_parser("backup", help="在线热备份当前数据库（不需要停止应用）")
+    p.add_argument("--keep", type=int, default=7, help="保留最近多少份备份")
+    p.add_argument("--list", action="store_true", help="只列出已有备份")
+    p.set_defaults(func=cmd_backup)
+
+    p = subparsers.add_parser("restore", help="从备份恢复当前数据库（恢复前自动备份现有数据）")
+    p.add_argument("file", nargs="?", help="备份文件（默认最新一份常规备份）")
+    p.add_argument("--keep", type=int, default=7, help="恢复后保留最近多少份备份")
+    p.set_defaults(func=cmd_restore)
+
+    p = subparsers.add_parser("sync-export", help="导出上次同步之后的增量变更")
+    p.add_argument("--peer", default="default", help="同步对象名称（多台机器时分别记录进度）")
+    p.add_argument("--full", action="store_true", help="导出全部数据（首次同步或漏了变更文件时）")
+    p.add_argument("-o", "--output", help="输出文件名（默认自动生成）")
+    p.set_defaults(func=cmd_sync_export)
+
+    p = subparsers.add_parser("sync-import", help="合并另一台机器导出的变更文件")
+    p.add_argument("file", help="变更文件（.jsonl.gz）")
+    p.add_argument("--peer", default="default", help="同步对象名称（与导出时对应）")
+    p.set_defaults(func=cmd_sync_import)
+
+    p = subparsers.add_parser("sync-status", help="查看各同步对象的进度")
+    p.set_defaults(func=cmd_sync_status)
+
+    p = subparsers.add_parser("import", help="从 CSV / JSONL 批量导入计划和任务记录")
+    p.add_argument("--plans", help="计划文件（id, date, title, total_minutes, status, created_at）")
+    p.add_argument("--records", help="记录文件（plan_id 或 date, task_name, scheduled_minutes, "
+                                     "actual_minutes, focus_level, completed, completed_at, notes）")
+    p.add_argument("--batch-size", type=int, default=5000, help="每次 executemany 的行数")
+    p.set_defaults(func=cmd_import)
+
+    p = subparsers.add_parser("generate", help="生成可复现的合成数据到临时数据库")
+    p.add_argument("--records", type=int, default=100_000, help="任务记录数量")
+    p.add_argument("--seed", type=int, default=42, help="随机种子")
+    p.add_argument("--db", required=True, help="临时数据库文件（必须不存在）")
+    p.set_defaults(func=cmd_generate)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.user:
+        data_manager.use_profile(args.user)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
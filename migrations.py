@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 数据库迁移模块
+通过 PRAGMA user_version 记录结构版本，按顺序执行迁移
+"""
+
+import json
+import sqlite3
+
+import rollups
+import search
+import sync
+
+
+def _to_int(value, default=None):
+    """宽松地把 AI 返回的数字字段（可能是字符串）转成整数"""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def plan_task_row(plan_id: int, position: int, task: dict) -> tuple:
+    """把计划中的单个任务转换为 plan_tasks 表的一行"""
+    return (
+        plan_id,
+        position,
+        _to_int(task.get('id')),
+        str(task.get('name', '')),
+        _to_int(task.get('minutes'), 0),
+        task.get('priority'),
+        _to_int(task.get('focus')),
+        task.get('method'),
+        task.get('warning'),
+    )
+
+
+def _m001_base_tables(cursor):
+    """基础表结构（计划、任务记录、日志）"""
+    # 创建计划表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS plans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            title TEXT,
+            total_minutes INTEGER,
+            tasks_json TEXT,
+            status TEXT DEFAULT 'in_progress',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # 创建任务执行记录表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plan_id INTEGER,
+            task_name TEXT NOT NULL,
+            scheduled_minutes INTEGER,
+            actual_minutes INTEGER,
+            focus_level INTEGER,
+            completed BOOLEAN DEFAULT 0,
+            completed_at TIMESTAMP,
+            notes TEXT,
+            FOREIGN KEY (plan_id) REFERENCES plans(id)
+        )
+    ''')
+
+    # 创建日志表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL UNIQUE,
+            total_scheduled_minutes INTEGER,
+            total_actual_minutes INTEGER,
+            completion_rate REAL,
+            avg_focus_level REAL,
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _m002_query_indexes(cursor):
+    """常用查询索引（按日期/创建时间查计划，按计划查记录）"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_plans_date_created
+        ON plans (date, created_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_plans_created
+        ON plans (created_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_task_records_plan
+        ON task_records (plan_id)
+    ''')
+
+
+def _m003_plan_tasks(cursor):
+    """把 tasks_json 拆分为 plan_tasks 表，任务记录按任务 id 关联"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS plan_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plan_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            task_no INTEGER,
+            name TEXT NOT NULL,
+            minutes INTEGER,
+            priority TEXT,
+            focus INTEGER,
+            method TEXT,
+            warning TEXT,
+            UNIQUE (plan_id, position),
+            FOREIGN KEY (plan_id) REFERENCES plans(id)
+        )
+    ''')
+    cursor.execute('''
+        ALTER TABLE task_records
+        ADD COLUMN plan_task_id INTEGER REFERENCES plan_tasks(id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_task_records_plan_task
+        ON task_records (plan_task_id)
+    ''')
+
+    # 迁移已有的 JSON 任务列表
+    rows = []
+    for plan_id, tasks_json in cursor.execute(
+            "SELECT id, tasks_json FROM plans WHERE tasks_json IS NOT NULL").fetchall():
+        try:
+            tasks = json.loads(tasks_json)
+        except ValueError:
+            continue
+        for position, task in enumerate(tasks if isinstance(tasks, list) else []):
+            if isinstance(task, dict):
+                rows.append(plan_task_row(plan_id, position, task))
+    cursor.executemany('''
+        INSERT INTO plan_tasks
+        (plan_id, position, task_no, name, minutes, priority, focus, method, warning)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+    # 旧记录没有任务序号，按同一计划内的任务名匹配
+    cursor.execute('''
+        UPDATE task_records
+        SET plan_task_id = (
+            SELECT pt.id FROM plan_tasks pt
+            WHERE pt.plan_id = task_records.plan_id AND pt.name = task_records.task_name
+            ORDER BY pt.position
+            LIMIT 1
+        )
+        WHERE plan_task_id IS NULL
+    ''')
+
+
+def _m004_rollups(cursor):
+    """日 / 周 / 月汇总表，并从已有数据回填"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rollups (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            scheduled_minutes INTEGER NOT NULL DEFAULT 0,
+            actual_minutes INTEGER NOT NULL DEFAULT 0,
+            focus_sum INTEGER NOT NULL DEFAULT 0,
+            focus_count INTEGER NOT NULL DEFAULT 0,
+            task_count INTEGER NOT NULL DEFAULT 0,
+            completed_count INTEGER NOT NULL DEFAULT 0,
+            plan_count INTEGER NOT NULL DEFAULT 0,
+            completed_plan_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket)
+        ) WITHOUT ROWID
+    ''')
+    rollups.rebuild(cursor)
+
+
+def _m005_incremental_vacuum(cursor):
+    """切换为增量清理模式，归档删除的数据可以逐步归还磁盘"""
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    # 已有表的数据库需要 VACUUM 一次才会生效，由 apply_migrations 在事务外执行
+    return True
+
+
+def _m006_search_index(cursor):
+    """任务名、备注和计划任务的全文搜索索引（FTS5，由触发器同步）"""
+    search.create_index(cursor)
+
+
+def _m007_plan_status_index(cursor):
+    """按状态筛选计划历史时的分页索引"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_plans_status_created
+        ON plans (status, created_at)
+    ''')
+
+
+def _m008_sync_changelog(cursor):
+    """增量同步：全局 uid、updated_at、变更日志与同步状态"""
+    sync.create_schema(cursor)
+
+
+def _m009_search_queue(cursor):
+    """全文索引触发器改为纯 SQL 记入待索引队列，不再依赖自定义函数"""
+    search.create_triggers(cursor)
+
+
+# (版本号, 说明, 迁移函数)；迁移函数返回 True 表示提交后需要执行 VACUUM，只能追加，不能修改已发布的迁移
+MIGRATIONS = [
+    (1, "基础表结构", _m001_base_tables),
+    (2, "常用查询索引", _m002_query_indexes),
+    (3, "计划任务拆表", _m003_plan_tasks),
+    (4, "日/周/月汇总表", _m004_rollups),
+    (5, "增量清理模式", _m005_incremental_vacuum),
+    (6, "全文搜索索引", _m006_search_index),
+    (7, "计划状态分页索引", _m007_plan_status_index),
+    (8, "增量同步变更日志", _m008_sync_changelog),
+    (9, "全文索引待处理队列", _m009_search_queue),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """读取当前数据库结构版本"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """按顺序执行尚未应用的迁移，返回迁移后的版本号"""
+    version = get_schema_version(conn)
+    if version >= LATEST_VERSION:
+        return version
+
+    if conn.in_transaction:
+        conn.commit()
+
+    # 加写锁后再确认版本，避免多个进程重复迁移
+    conn.execute("BEGIN IMMEDIATE")
+    needs_vacuum = False
+    try:
+        current = get_schema_version(conn)
+        cursor = conn.cursor()
+        for version, _description, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            needs_vacuum = bool(migrate(cursor)) or needs_vacuum
+            cursor.execute(f"PRAGMA user_version = {version}")
+            current = version
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if needs_vacuum:
+        conn.execute("VACUUM")
+
+    return current
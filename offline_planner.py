@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 离线计划优化模块
+不调用 AI，按规则把自由文本计划拆成事项，参考历史记录的实际用时估算时长，
+再拆成不超过 25 分钟的微任务并标注优先级和专注度；输出与 AI 优化结果相同的
+{"total_minutes", "tasks": [...], "motivation", "tips"} 结构，毫秒级返回，
+可作为未配置 API 时的快速通道和 AI 不可用时的备用方案
+"""
+
+import math
+import re
+import statistics
+import unicodedata
+import zlib
+
+MAX_TASK_MINUTES = 25
+MIN_TASK_MINUTES = 5
+MIN_ITEM_MINUTES = 10
+MAX_ITEM_MINUTES = 240
+DEFAULT_ITEM_MINUTES = 30
+
+# 历史任务名与事项的相似度（字符二元组 Dice 系数）达到该值才参考其用时
+HISTORY_MATCH_THRESHOLD = 0.5
+# 用历史整体超时比例校准默认估时时的上下限
+CALIBRATION_RANGE = (0.7, 1.6)
+
+# 事项类别：(关键词, 默认分钟, 优先级, 专注度, 方法)，按顺序匹配第一个
+CATEGORIES = [
+    ('exam', ('考试', '模拟', '真题', 'exam', 'deadline', '截止'), 60, 'S', 9,
+     "按考试条件限时完成，结束后立即对答案、标记错因"),
+    ('practice', ('题', '练习', '刷', 'leetcode', '习题', '练'), 30, 'A', 7,
+     "限时独立完成，卡住 5 分钟再看提示"),
+    ('learn', ('学习', '章', '课', '讲', '教程', '网课', 'course', 'lecture'), 50, 'S', 8,
+     "番茄钟专注，结束前用三句话复述本段要点"),
+    ('build', ('写', '作业', '报告', '代码', '项目', '实现', '开发', '论文写作', 'code', 'project'), 60, 'A', 8,
+     "先列提纲或接口，完成优先于完美，最后统一修改"),
+    ('read', ('阅读', '读', '论文', '文章', '书', 'paper', 'read'), 40, 'A', 7,
+     "先读摘要和结论，带着问题精读关键部分"),
+    ('review', ('复习', '回顾', '背', '记', '单词', '整理', '笔记', 'review'), 25, 'B', 6,
+     "主动回忆：先默写要点，再对照材料补漏"),
+    ('chore', ('运动', '跑步', '健身', '洗', '收拾', '购物', '邮件', '回复'), 20, 'B', 4,
+     "一次性做完，不在中途切换到其他事"),
+]
+GENERAL_CATEGORY = ('general', (), DEFAULT_ITEM_MINUTES, 'B', 6, "集中完成，不切换任务")
+
+# 按数量计时的单位（每单位分钟数）
+UNIT_MINUTES = {'题': 20, '道': 20, '篇': 40, '章': 50, '节': 30, '页': 3, '集': 45}
+# 带这些量词时数量只作为倍数，单位用时取后文出现的计时单位或类别默认值
+COUNT_WORDS = ('个', '套', '组', '次', '份', '项')
+
+URGENT_WORDS = ('重要', '紧急', '必须', '务必', '优先', '!', '！')
+
+MOTIVATIONS = [
+    "弱小和无知不是生存的障碍，傲慢才是。时间不会等你准备好。",
+    "给岁月以文明，而不是给文明以岁月。把每一分钟都变成成果。",
+    "在时间的尺度上，犹豫就是失败。开始执行。",
+    "宇宙很大，生活更大。但今天只有这些任务，完成它们。",
+]
+TIPS = "按顺序执行，S 级任务放在精力最好的时段；每个微任务结束立即记录实际用时，系统会据此校准下一次的估算。"
+
+_SPLIT_RE = re.compile(r'[\n\r,，、;；。]+|\s+(?=\d+[.)、．](?!\d))')
+_BULLET_RE = re.compile(r'^\s*(?:\d+\s*[.)、．](?!\d)|[-*•·])\s*')
+_DURATION_RE = re.compile(
+    r'(\d+(?:\.\d+)?)\s*(小时|个小时|h|hr|hours?|分钟|分|min|mins|minutes?)(?![a-z])', re.IGNORECASE)
+# "第5章"是序号而不是数量
+_QUANTITY_RE = re.compile(r'(?<![第\d])(\d+)\s*(' + '|'.join(list(UNIT_MINUTES) + list(COUNT_WORDS)) + ')')
+_SUFFIX_RE = re.compile(r'\s*[（(]\d+/\d+[)）]\s*$')
+_NOISE_RE = re.compile(r'[\W_]+')
+
+
+def split_items(text: str) -> list:
+    """把计划文本拆成事项（按换行、逗号、顿号、分号和编号分隔）"""
+    items = []
+    for part in _SPLIT_RE.split(text or ''):
+        part = _BULLET_RE.sub('', part).strip()
+        if part:
+            items.append(part)
+    return items
+
+
+def _normalize(name: str) -> str:
+    name = _SUFFIX_RE.sub('', name)
+    name = unicodedata.normalize('NFKC', name).lower()
+    return _NOISE_RE.sub('', name)
+
+
+def _bigrams(name: str) -> frozenset:
+    text = _normalize(name)
+    if len(text) < 2:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + 2] for i in range(len(text) - 1))
+
+
+def _similarity(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def _category(name: str) -> tuple:
+    folded = name.lower()
+    for category in CATEGORIES:
+        if any(word in folded for word in category[1]):
+            return category
+    return GENERAL_CATEGORY
+
+
+class HistoryIndex:
+    """按任务名索引历史记录，估算事项用时和整体超时比例"""
+
+    def __init__(self, history: list = None):
+        self._records = []
+        ratios = []
+        for record in history or []:
+            minutes = record.get('actual_minutes') or record.get('scheduled_minutes')
+            if not minutes or minutes <= 0:
+                continue
+            self._records.append((_bigrams(record['task_name']), record.get('plan_id'), minutes))
+            scheduled = record.get('scheduled_minutes')
+            if record.get('actual_minutes') and scheduled and scheduled > 0:
+                ratios.append(record['actual_minutes'] / scheduled)
+        # 历史实际 / 计划的中位数，用于校准没有相似记录的事项
+        ratio = statistics.median(ratios) if len(ratios) >= 5 else 1.0
+        self.calibration = min(max(ratio, CALIBRATION_RANGE[0]), CALIBRATION_RANGE[1])
+
+    def __len__(self):
+        return len(self._records)
+
+    def estimate(self, name: str):
+        """相似任务在历次计划中的实际总用时（同一计划内拆出的微任务合计）的中位数，没有相似记录时返回 None"""
+        grams = _bigrams(name)
+        per_plan = {}
+        for record_grams, plan_id, minutes in self._records:
+            if _similarity(grams, record_grams) >= HISTORY_MATCH_THRESHOLD:
+                per_plan[plan_id] = per_plan.get(plan_id, 0) + minutes
+        if not per_plan:
+            return None
+        return statistics.median(per_plan.values())
+
+
+def _explicit_minutes(item: str):
+    """事项中写明的时长（如"30分钟"、"1.5小时"）"""
+    match = _DURATION_RE.search(item)
+    if not match:
+        return None
+    value, unit = float(match.group(1)), match.group(2).lower()
+    return value * 60 if unit.startswith(('小', '个', 'h')) else value
+
+
+def estimate_item(item: str, history: HistoryIndex) -> dict:
+    """估算单个事项：时长、优先级、专注度和方法"""
+    category = _category(item)
+    _, _, default_minutes, priority, focus, method = category
+
+    minutes = _explicit_minutes(item)
+    source = 'explicit'
+    if minutes is None:
+        minutes = history.estimate(item)
+        source = 'history'
+    if minutes is None:
+        source = 'default'
+        quantity = _QUANTITY_RE.search(item)
+        if quantity:
+            count, unit = int(quantity.group(1)), quantity.group(2)
+            # "3个LeetCode题目"：量词后面出现的计时单位决定每个的用时
+            per_unit = UNIT_MINUTES.get(unit) or next(
+                (m for u, m in UNIT_MINUTES.items() if u in item[quantity.end():]), default_minutes)
+            minutes = count * per_unit
+        else:
+            minutes = default_minutes
+        minutes *= history.calibration
+    minutes = min(max(int(round(minutes)), MIN_ITEM_MINUTES), MAX_ITEM_MINUTES)
+
+    if any(word in item for word in URGENT_WORDS):
+        priority = 'S'
+    if priority == 'S':
+        focus = min(10, focus + 1)
+    return {'name': item.strip('!！ '), 'minutes': minutes, 'priority': priority,
+            'focus': focus, 'method': method, 'source': source}
+
+
+def split_minutes(minutes: int, limit: int = MAX_TASK_MINUTES) -> list:
+    """把时长平均拆成若干段，每段不超过 limit 分钟"""
+    parts = max(1, math.ceil(minutes / limit))
+    base, extra = divmod(minutes, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+def build_plan(text: str, history: list = None) -> dict:
+    """
+    离线生成优化计划
+
+    history 为 storage.get_task_history() 的结果（可为空）；S 级事项排在前面，同级保持输入顺序
+    """
+    index = history if isinstance(history, HistoryIndex) else HistoryIndex(history)
+    items = [estimate_item(item, index) for item in split_items(text)]
+    rank = {'S': 0, 'A': 1, 'B': 2}
+    items.sort(key=lambda item: rank[item['priority']])
+
+    tasks = []
+    for item in items:
+        chunks = split_minutes(item['minutes'])
+        for i, minutes in enumerate(chunks, 1):
+            name = item['name'] if len(chunks) == 1 else f"{item['name']}（{i}/{len(chunks)}）"
+            tasks.append({
+                'id': len(tasks) + 1,
+                'name': name,
+                'minutes': max(minutes, MIN_TASK_MINUTES),
+                'priority': item['priority'],
+                'focus': item['focus'],
+                'method': item['method'],
+                'warning': f"{minutes} 分钟内完成，超时立即进入下一项",
+            })
+
+    return {
+        'total_minutes': sum(task['minutes'] for task in tasks),
+        'tasks': tasks,
+        'motivation': MOTIVATIONS[zlib.crc32((text or '').encode('utf-8')) % len(MOTIVATIONS)],
+        'tips': TIPS,
+    }
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 用户档案管理模块
+每个本地用户（档案名）使用独立的 SQLite 数据库文件，互不可见，也不争用同一把写锁
+"""
+
+import os
+import re
+
+DEFAULT_PROFILE = "default"
+PROFILE_DIR = "profiles"
+
+# 档案名同时用作文件名：字母、数字、汉字、下划线和连字符
+_NAME_RE = re.compile(r'^[\w\-]{1,32}$')
+
+# 用户的归档库与档案库放在同一目录（<档案名>_archive.db），以此结尾的名字不能用作档案名
+ARCHIVE_SUFFIX = "_archive"
+
+
+def normalize_profile(name: str) -> str:
+    """规范化档案名（去空白、转小写），不合法时报错"""
+    name = (name or "").strip().lower() or DEFAULT_PROFILE
+    if not _NAME_RE.match(name):
+        raise ValueError("用户名只能包含字母、数字、汉字、下划线和连字符（最多 32 个字符）")
+    if name.endswith(ARCHIVE_SUFFIX):
+        raise ValueError(f"用户名不能以 {ARCHIVE_SUFFIX} 结尾（该后缀用于归档库）")
+    return name
+
+
+def profile_db_file(name: str, default_db_file: str) -> str:
+    """
+    档案对应的数据库文件
+
+    default 档案沿用原来的 default_db_file（兼容单用户时期的数据），
+    其他档案放在 default_db_file 同目录的 profiles/ 下
+    """
+    name = normalize_profile(name)
+    if name == DEFAULT_PROFILE:
+        return default_db_file
+    base_dir = os.path.dirname(os.path.abspath(default_db_file))
+    return os.path.join(base_dir, PROFILE_DIR, f"{name}.db")
+
+
+def list_profiles(default_db_file: str) -> list:
+    """列出已有数据库文件的档案（default 总在最前）"""
+    profile_dir = os.path.join(os.path.dirname(os.path.abspath(default_db_file)), PROFILE_DIR)
+    names = []
+    if os.path.isdir(profile_dir):
+        for filename in os.listdir(profile_dir):
+            stem, ext = os.path.splitext(filename)
+            if ext == ".db" and not stem.endswith(ARCHIVE_SUFFIX) and _NAME_RE.match(stem):
+                names.append(stem)
+    return [DEFAULT_PROFILE] + sorted(n for n in names if n != DEFAULT_PROFILE)
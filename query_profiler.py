@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - SQL 查询性能分析模块
+包装 sqlite3 的连接和游标，记录每条语句的耗时（含取数）、返回 / 影响行数和调用位置，
+超过阈值的慢查询连同 EXPLAIN QUERY PLAN 写入日志，并按语句汇总成报告
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOW_MS = 100
+MAX_SLOW_QUERIES = 50
+
+_HERE = os.path.abspath(__file__)
+_REPO_DIR = os.path.dirname(_HERE)
+
+# 只有这些语句能做 EXPLAIN QUERY PLAN
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+
+
+def normalize_sql(sql: str) -> str:
+    """把语句归一化为汇总用的键：压缩空白，字符串和数字字面量替换为 ?"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return _WHITESPACE_RE.sub(' ', sql).strip()
+
+
+def _call_site() -> str:
+    """发起查询的代码位置：优先取本项目内、本模块以外最近的一帧"""
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename != _HERE:
+            if fallback is None:
+                fallback = frame
+            if os.path.dirname(os.path.abspath(filename)) == _REPO_DIR:
+                break
+        frame = frame.f_back
+    frame = frame or fallback
+    if frame is None:
+        return '?'
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} ({frame.f_code.co_name})"
+
+
+def explain(conn: sqlite3.Connection, sql: str, params=()) -> list:
+    """返回语句的 EXPLAIN QUERY PLAN（每行一个步骤，按层级缩进）"""
+    if sql.lstrip().split(None, 1)[0].upper() not in _EXPLAINABLE:
+        return []
+    # 用原生游标执行，避免 EXPLAIN 本身被记录
+    try:
+        cursor = sqlite3.Cursor(conn)
+        try:
+            rows = cursor.execute("EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+        finally:
+            cursor.close()
+    except sqlite3.Error as e:
+        return [f"(无法获取查询计划: {e})"]
+
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+class QueryProfiler:
+    """按语句汇总执行次数、耗时和行数，并保留最近的慢查询"""
+
+    def __init__(self, enabled: bool = True, slow_ms: float = DEFAULT_SLOW_MS,
+                 max_slow: int = MAX_SLOW_QUERIES):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self._stats = {}  # {归一化语句: 汇总}
+        self._slow = deque(maxlen=max_slow)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def configure(self, enabled: bool = None, slow_ms: float = None):
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+
+    def record(self, conn, sql: str, params, elapsed_ms: float, rows: int, call_site: str):
+        """记录一次执行（游标取完数据或被丢弃时调用）"""
+        key = normalize_sql(sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'call_sites': Counter()
+                }
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['rows'] += rows
+            stats['call_sites'][call_site] += 1
+
+        # 当前线程的累计值，用于计算一次 rerun 在 SQLite 上花的时间
+        local = self._local
+        local.count = getattr(local, 'count', 0) + 1
+        local.ms = getattr(local, 'ms', 0.0) + elapsed_ms
+
+        if self.slow_ms is not None and elapsed_ms >= self.slow_ms:
+            plan = explain(conn, sql, params)
+            self._slow.append({
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'ms': round(elapsed_ms, 3),
+                'rows': rows,
+                'call_site': call_site,
+                'sql': _WHITESPACE_RE.sub(' ', sql).strip(),
+                'plan': plan,
+            })
+            logger.warning("慢查询 %.1f ms，%d 行，%s\n%s\n%s", elapsed_ms, rows, call_site,
+                           sql.strip(), "\n".join(plan))
+
+    def thread_totals(self) -> dict:
+        """当前线程累计执行的语句数与耗时（毫秒）"""
+        return {'count': getattr(self._local, 'count', 0), 'ms': getattr(self._local, 'ms', 0.0)}
+
+    def report(self, limit: int = None) -> list:
+        """按总耗时降序的语句汇总"""
+        with self._lock:
+            items = [(sql, dict(stats, call_sites=stats['call_sites'].copy()))
+                     for sql, stats in self._stats.items()]
+        items.sort(key=lambda item: item[1]['total_ms'], reverse=True)
+
+        result = []
+        for sql, stats in items[:limit]:
+            result.append({
+                'sql': sql,
+                'count': stats['count'],
+                'total_ms': round(stats['total_ms'], 3),
+                'avg_ms': round(stats['total_ms'] / stats['count'], 3),
+                'max_ms': round(stats['max_ms'], 3),
+                'rows': stats['rows'],
+                'call_sites': [site for site, _ in stats['call_sites'].most_common(3)],
+            })
+        return result
+
+    def slow_queries(self) -> list:
+        """最近的慢查询（最新的在前）"""
+        return list(reversed(self._slow))
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+
+
+# 进程内共用的分析器，data_manager 打开的连接都记录到这里；
+# 默认关闭（命令行维护和基准测试不受影响），应用启动时按配置开启
+profiler = QueryProfiler(enabled=False)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    记录耗时的游标
+
+    SQLite 在取数时才真正逐行执行，因此一条 SELECT 的耗时包含 execute 和后续的 fetch，
+    在数据取完、游标再次执行、关闭或被回收时才提交记录
+    """
+
+    def __init__(self, conn, profiler: QueryProfiler):
+        super().__init__(conn)
+        self._profiler = profiler
+        self._pending = None  # [sql, params, 耗时毫秒, 行数, 调用位置]
+
+    def _begin(self, sql, params, started, call_site):
+        elapsed = (time.perf_counter() - started) * 1000
+        self._pending = [sql, params, elapsed, 0, call_site]
+        # 没有结果集的语句（写入、DDL、PRAGMA 赋值）执行完即结束
+        if self.description is None:
+            if self.rowcount > 0:
+                self._pending[3] = self.rowcount
+            self._finish()
+
+    def _add(self, started, rows):
+        if self._pending is not None:
+            self._pending[2] += (time.perf_counter() - started) * 1000
+            self._pending[3] += rows
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            sql, params, elapsed, rows, call_site = pending
+            self._profiler.record(self.connection, sql, params, elapsed, rows, call_site)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        call_site = _call_site()
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._begin(sql, parameters, started, call_site)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        call_site = _call_site()
+        # 参数可能是生成器，只有列表 / 元组时才能取第一组用于 EXPLAIN
+        params = None
+        if isinstance(seq_of_parameters, (list, tuple)) and seq_of_parameters:
+            params = seq_of_parameters[0]
+        started = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            self._begin(sql, params, started, call_site)
+        return self
+
+    def executescript(self, sql_script):
+        self._finish()
+        call_site = _call_site()
+        started = time.perf_counter()
+        try:
+            super().executescript(sql_script)
+        finally:
+            self._begin(sql_script, None, started, call_site)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add(started, 0 if row is None else 1)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._add(started, len(rows))
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add(started, len(rows))
+        self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(started, 0)
+            self._finish()
+            raise
+        self._add(started, 1)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # 只取了部分结果（如 execute(...).fetchone()）的游标在回收时提交记录
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """分析器启用时，cursor()（以及 execute 等快捷方法）返回记录耗时的游标"""
+
+    profiler = profiler
+
+    def cursor(self, factory=None):
+        if factory is not None:
+            return super().cursor(factory)
+        if not self.profiler.enabled:
+            return super().cursor()
+        return InstrumentedCursor(self, self.profiler)
+
+    # 连接上的快捷方法在 C 层直接创建普通游标，需要显式改用 cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 统计汇总模块
+按日 / ISO 周 / 月维护增量汇总，历史趋势只读汇总表
+"""
+
+from datetime import date as _date
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def bucket_keys(day: str) -> dict:
+    """根据计划日期 (YYYY-MM-DD) 计算各粒度的汇总桶"""
+    d = _date.fromisoformat(day)
+    iso_year, iso_week, _ = d.isocalendar()
+    return {
+        'day': d.isoformat(),
+        'week': f"{iso_year}-W{iso_week:02d}",
+        'month': d.strftime("%Y-%m"),
+    }
+
+
+def _add(cursor, day: str, **deltas):
+    """把增量累加到该日期所属的全部汇总桶"""
+    columns = list(deltas)
+    values = [deltas[c] for c in columns]
+    updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in columns)
+    cursor.executemany(f'''
+        INSERT INTO rollups (granularity, bucket, {", ".join(columns)})
+        VALUES (?, ?, {", ".join("?" for _ in columns)})
+        ON CONFLICT (granularity, bucket) DO UPDATE SET {updates}
+    ''', [(g, key, *values) for g, key in bucket_keys(day).items()])
+
+
+def add_record(cursor, day: str, scheduled_min, actual_min, focus_level, completed):
+    """新增一条任务记录后更新汇总"""
+    _add(cursor, day,
+         scheduled_minutes=scheduled_min or 0,
+         actual_minutes=actual_min or 0,
+         focus_sum=focus_level or 0,
+         focus_count=0 if focus_level is None else 1,
+         task_count=1,
+         completed_count=1 if completed else 0)
+
+
+def add_plan(cursor, day: str):
+    """新增计划后更新汇总"""
+    _add(cursor, day, plan_count=1)
+
+
+def change_plan_status(cursor, day: str, old_status: str, new_status: str):
+    """计划状态变化时调整已完成计划数"""
+    delta = (new_status == 'completed') - (old_status == 'completed')
+    if delta:
+        _add(cursor, day, completed_plan_count=delta)
+
+
+def _union(table: str, schemas) -> str:
+    """拼接多个库中同名表的 UNION ALL 子查询"""
+    return " UNION ALL ".join(f"SELECT * FROM {schema}.{table}" for schema in schemas)
+
+
+def rebuild(cursor, schemas=('main',)):
+    """从原始数据重建全部汇总（用于回填或修复；schemas 可包含已附加的归档库）"""
+    daily = {}
+
+    def bucket(day):
+        return daily.setdefault(day, {
+            'scheduled_minutes': 0, 'actual_minutes': 0,
+            'focus_sum': 0, 'focus_count': 0,
+            'task_count': 0, 'completed_count': 0,
+            'plan_count': 0, 'completed_plan_count': 0,
+        })
+
+    cursor.execute(f'''
+        SELECT
+            p.date,
+            COALESCE(SUM(tr.scheduled_minutes), 0),
+            COALESCE(SUM(tr.actual_minutes), 0),
+            COALESCE(SUM(tr.focus_level), 0),
+            COUNT(tr.focus_level),
+            COUNT(*),
+            SUM(CASE WHEN tr.completed = 1 THEN 1 ELSE 0 END)
+        FROM ({_union('task_records', schemas)}) tr
+        JOIN ({_union('plans', schemas)}) p ON tr.plan_id = p.id
+        GROUP BY p.date
+    ''')
+    for day, scheduled, actual, focus_sum, focus_count, task_count, completed_count in cursor.fetchall():
+        b = bucket(day)
+        b['scheduled_minutes'] = scheduled
+        b['actual_minutes'] = actual
+        b['focus_sum'] = focus_sum
+        b['focus_count'] = focus_count
+        b['task_count'] = task_count
+        b['completed_count'] = completed_count
+
+    cursor.execute(f'''
+        SELECT date, COUNT(*), SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END)
+        FROM ({_union('plans', schemas)})
+        GROUP BY date
+    ''')
+    for day, plan_count, completed_plan_count in cursor.fetchall():
+        b = bucket(day)
+        b['plan_count'] = plan_count
+        b['completed_plan_count'] = completed_plan_count
+
+    # 周、月汇总由日汇总折叠得到，只需遍历 O(天数)
+    totals = {}
+    for day, values in daily.items():
+        for granularity, key in bucket_keys(day).items():
+            target = totals.setdefault((granularity, key), dict.fromkeys(values, 0))
+            for column, value in values.items():
+                target[column] += value
+
+    cursor.execute("DELETE FROM rollups")
+    columns = ['scheduled_minutes', 'actual_minutes', 'focus_sum', 'focus_count',
+               'task_count', 'completed_count', 'plan_count', 'completed_plan_count']
+    cursor.executemany(f'''
+        INSERT INTO rollups (granularity, bucket, {", ".join(columns)})
+        VALUES (?, ?, {", ".join("?" for _ in columns)})
+    ''', [(g, key, *(values[c] for c in columns)) for (g, key), values in totals.items()])
+    return len(totals)
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 全文搜索模块
+基于 SQLite FTS5 索引任务记录（任务名、备注）和计划任务（名称、方法），由触发器保持同步
+
+unicode61 分词器会把连续的中文当成一个词，因此写入索引前在每个汉字两侧插入分隔符（segment），
+查询时中文词变成相邻汉字的短语查询，展示结果时再去掉分隔符
+
+触发器只用纯 SQL 把新增和修改的行记入 search_pending，分词在 Python 中由 index_pending 完成，
+任何连接（sqlite3 命令行、备份恢复、其他脚本）写入都不依赖自定义函数
+
+归档移走的行在主库触发删除，归档时再由 index_archive 从附加的归档库补回索引，归档后仍可搜到
+"""
+
+import re
+import sqlite3
+
+# 索引中 rowid = 源表 id * 2 + 类型，删除和更新时可以直接按 rowid 定位
+KIND_RECORD = 0
+KIND_TASK = 1
+KIND_NAMES = {KIND_RECORD: 'record', KIND_TASK: 'task'}
+
+# 归档库附加时使用的库名（与 archive.attach 一致）
+ARCHIVE_SCHEMA = 'archive'
+
+_CJK = r'\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_CJK_RE = re.compile(f'([{_CJK}])')
+
+# 分词用的分隔符：unicode61 把控制字符当作分隔符，且原文中不会出现，去掉后即可还原原文
+_SEPARATOR = '\x1f'
+
+# 高亮标记（先用控制字符，去掉分隔符后再替换）
+_MARK_OPEN, _MARK_CLOSE = '\x02', '\x03'
+
+
+def segment(text) -> str:
+    """在每个汉字两侧插入分隔符，使 unicode61 分词器按字切分中文"""
+    if text is None:
+        return None
+    return _CJK_RE.sub(_SEPARATOR + r'\1' + _SEPARATOR, str(text))
+
+
+def desegment(text: str) -> str:
+    """去掉 segment 插入的分隔符，并合并相邻的高亮片段"""
+    if not text:
+        return text or ''
+    return text.replace(_SEPARATOR, '').replace(_MARK_CLOSE + _MARK_OPEN, '')
+
+
+def build_match_query(query: str) -> str:
+    """把用户输入转成 FTS5 查询：按空白拆词，每个词作为短语，词之间为 AND"""
+    terms = []
+    for word in query.split():
+        tokens = segment(word)
+        if tokens:
+            terms.append('"' + tokens.replace('"', '""') + '"')
+    return " ".join(terms)
+
+
+# 旧版触发器在 SQL 中调用自定义函数 fts_segment，只有注册过该函数的连接才能写入，升级时删除
+_LEGACY_TRIGGERS = [
+    'trg_task_records_search_insert', 'trg_task_records_search_update', 'trg_task_records_search_delete',
+    'trg_plan_tasks_search_insert', 'trg_plan_tasks_search_update', 'trg_plan_tasks_search_delete',
+]
+
+# (源表, 类型, 标题列, 正文列)
+_SOURCES = [
+    ('task_records', KIND_RECORD, 'task_name', 'notes'),
+    ('plan_tasks', KIND_TASK, 'name', 'method'),
+]
+
+
+def _triggers(table: str, kind: int, title: str, body: str) -> list:
+    return [
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_queue_insert
+            AFTER INSERT ON {table} BEGIN
+                INSERT OR IGNORE INTO search_pending (doc_id) VALUES (new.id * 2 + {kind});
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_queue_update
+            AFTER UPDATE OF plan_id, {title}, {body} ON {table} BEGIN
+                INSERT OR IGNORE INTO search_pending (doc_id) VALUES (new.id * 2 + {kind});
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_queue_delete
+            AFTER DELETE ON {table} BEGIN
+                DELETE FROM search_index WHERE rowid = old.id * 2 + {kind};
+                DELETE FROM search_pending WHERE doc_id = old.id * 2 + {kind};
+            END
+        ''',
+    ]
+
+
+def create_triggers(cursor):
+    """创建待索引队列和同步触发器（替换依赖自定义函数的旧版触发器）"""
+    cursor.execute("CREATE TABLE IF NOT EXISTS search_pending (doc_id INTEGER PRIMARY KEY)")
+    for name in _LEGACY_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    # executescript 会提交当前事务，触发器逐条创建以保持迁移的原子性
+    for table, kind, title, body in _SOURCES:
+        for trigger_sql in _triggers(table, kind, title, body):
+            cursor.execute(trigger_sql)
+
+
+def create_index(cursor):
+    """创建 FTS5 索引和同步触发器，并回填已有数据"""
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            plan_id UNINDEXED,
+            title,
+            body,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    create_triggers(cursor)
+    for table, kind, _title, _body in _SOURCES:
+        cursor.execute(f"INSERT OR IGNORE INTO search_pending (doc_id) SELECT id * 2 + {kind} FROM {table}")
+    index_pending(cursor)
+
+
+def has_pending(conn) -> bool:
+    return conn.execute("SELECT EXISTS (SELECT 1 FROM search_pending)").fetchone()[0] == 1
+
+
+def _has_archive(cursor) -> bool:
+    return any(row[1] == ARCHIVE_SCHEMA for row in cursor.execute("PRAGMA database_list"))
+
+
+def index_pending(cursor) -> int:
+    """
+    把队列中的行分词后写入索引（需在写事务中执行），返回处理的行数
+
+    附加了归档库时也从归档库读取源行（主库优先）；两边都找不到的行从索引中删除
+    """
+    pending = cursor.execute("SELECT COUNT(*) FROM search_pending").fetchone()[0]
+    if not pending:
+        return 0
+    schemas = ['main', ARCHIVE_SCHEMA] if _has_archive(cursor) else ['main']
+    rows = {}
+    for table, kind, title, body in _SOURCES:
+        for schema in schemas:
+            for row_id, plan_id, title_text, body_text in cursor.execute(f'''
+                SELECT t.id, t.plan_id, t.{title}, t.{body}
+                FROM search_pending q
+                JOIN {schema}.{table} t ON t.id = q.doc_id / 2
+                WHERE q.doc_id % 2 = {kind}
+            ''').fetchall():
+                rows.setdefault(row_id * 2 + kind, (plan_id, segment(title_text), segment(body_text)))
+    # 先删除旧内容（修改过或源行已删除的），再写入最新内容
+    cursor.execute("DELETE FROM search_index WHERE rowid IN (SELECT doc_id FROM search_pending)")
+    cursor.executemany("INSERT INTO search_index (rowid, plan_id, title, body) VALUES (?, ?, ?, ?)",
+                       [(doc_id,) + row for doc_id, row in rows.items()])
+    cursor.execute("DELETE FROM search_pending")
+    return pending
+
+
+def index_archive(cursor) -> int:
+    """
+    把归档库中尚未索引的行写入索引（归档库需已附加，在写事务中执行），返回处理的行数
+
+    归档把行从主库删除时触发器会删掉其索引，移动之后调用一次即可补回；
+    也会补上本功能之前归档、已经从索引中删除的行
+    """
+    for table, kind, _title, _body in _SOURCES:
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO search_pending (doc_id)
+            SELECT id * 2 + {kind} FROM {ARCHIVE_SCHEMA}.{table}
+            WHERE id * 2 + {kind} NOT IN (SELECT rowid FROM search_index)
+        ''')
+    return index_pending(cursor)
+
+
+def search(conn: sqlite3.Connection, query: str, limit: int = 20, highlight=('**', '**')) -> list:
+    """
+    全文搜索任务记录和计划任务，按 BM25 相关度排序（任务名权重高于备注 / 方法）
+
+    尚未分词的行（search_pending）不会被搜到，调用前先用 index_pending 写入索引；返回结果包含类型、源表 id、计划 id 与日期、是否已归档、高亮后的标题和正文片段。
+    已归档的行也在索引中，附加了归档库时从归档库取其计划日期，否则日期为空
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    cursor = conn.cursor()
+    if _has_archive(cursor):
+        archive_date = "a.date"
+        archive_join = f"LEFT JOIN {ARCHIVE_SCHEMA}.plans a ON a.id = s.plan_id"
+    else:
+        archive_date, archive_join = "NULL", ""
+    cursor.execute(f'''
+        SELECT
+            s.rowid,
+            s.plan_id,
+            COALESCE(p.date, {archive_date}),
+            p.id IS NULL,
+            highlight(search_index, 1, '{_MARK_OPEN}', '{_MARK_CLOSE}'),
+            snippet(search_index, 2, '{_MARK_OPEN}', '{_MARK_CLOSE}', '…', 24),
+            bm25(search_index, 0.0, 5.0, 1.0) AS score
+        FROM search_index s
+        LEFT JOIN main.plans p ON p.id = s.plan_id
+        {archive_join}
+        WHERE search_index MATCH ?
+        ORDER BY score
+        LIMIT ?
+    ''', (match, limit))
+
+    mark_open, mark_close = highlight
+    results = []
+    for rowid, plan_id, date, archived, title, snippet, score in cursor.fetchall():
+        results.append({
+            'kind': KIND_NAMES[rowid % 2],
+            'id': rowid // 2,
+            'plan_id': plan_id,
+            'date': date,
+            'archived': bool(archived),
+            'title': desegment(title).replace(_MARK_OPEN, mark_open).replace(_MARK_CLOSE, mark_close),
+            'snippet': desegment(snippet).replace(_MARK_OPEN, mark_open).replace(_MARK_CLOSE, mark_close),
+            'score': -score,
+        })
+    return results
@@ -0,0 +1,650 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 存储后端模块
+界面通过 StorageBackend 读写计划、记录和统计，具体实现由 config.json 的 storage_backend 选择：
+sqlite（默认，data_manager）或 memory（纯内存，不读写磁盘，适合测试和基准对比）
+"""
+
+import re
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import analytics
+import backup
+import exporter
+import rollups
+from migrations import plan_task_row
+from profile_manager import DEFAULT_PROFILE, normalize_profile
+
+DEFAULT_BACKEND = "sqlite"
+
+
+class StorageBackend(ABC):
+    """存储后端接口 - 计划、任务记录、统计、搜索与导出"""
+
+    name = None
+
+    # ---------- 用户档案 ----------
+
+    @abstractmethod
+    def use_profile(self, name: str = None) -> str:
+        """让当前线程使用指定用户档案，返回规范化后的档案名"""
+
+    @abstractmethod
+    def list_profiles(self) -> list:
+        """列出已有的用户档案"""
+
+    # ---------- 计划 ----------
+
+    @abstractmethod
+    def save_plan(self, plan_data: dict, title: str = None) -> int:
+        """保存计划及其任务，返回计划 id"""
+
+    @abstractmethod
+    def update_plan_status(self, plan_id: int, status: str) -> Future:
+        """更新计划状态，返回写入完成后结束的 Future"""
+
+    @abstractmethod
+    def get_plan_tasks(self, plan_id: int) -> list:
+        """获取计划的任务列表"""
+
+    @abstractmethod
+    def get_latest_plan(self):
+        """获取最新的计划（含任务），没有时返回 None"""
+
+    @abstractmethod
+    def get_today_plan(self):
+        """获取今天最新的计划（含任务），没有时返回 None"""
+
+    @abstractmethod
+    def get_all_plans(self, limit: int = 30) -> list:
+        """按创建时间倒序获取计划"""
+
+    @abstractmethod
+    def get_plan_summaries(self, limit: int = 30) -> list:
+        """获取计划列表及其任务数、完成数和计划 / 实际分钟"""
+
+    @abstractmethod
+    def get_plans_page(self, cursor: tuple = None, page_size: int = 20, start: str = None,
+                       end: str = None, status: str = None) -> dict:
+        """按创建时间倒序分页获取计划汇总，返回 {'plans': [...], 'next_cursor': ...}"""
+
+    # ---------- 任务记录 ----------
+
+    @abstractmethod
+    def save_task_record(self, plan_id: int, task_name: str, scheduled_min: int,
+                         actual_min: int, focus_level: int, completed: bool, notes: str = "",
+                         task_index: int = None) -> Future:
+        """保存任务执行记录，返回给出记录 id 的 Future"""
+
+    @abstractmethod
+    def get_plan_records(self, plan_id: int) -> list:
+        """获取计划的所有任务记录"""
+
+    @abstractmethod
+    def get_task_history(self, limit: int = 500) -> list:
+        """最近的任务记录（新的在前），含所属计划 id 和任务优先级"""
+
+    # ---------- 统计、搜索与导出 ----------
+
+    @abstractmethod
+    def get_rollups(self, granularity: str = 'day', since: str = None, limit: int = None) -> list:
+        """读取日 / 周 / 月汇总（按桶倒序）"""
+
+    @abstractmethod
+    def get_estimation_report(self) -> dict:
+        """获取预估精度分析报告"""
+
+    @abstractmethod
+    def search_tasks(self, query: str, limit: int = 20) -> list:
+        """搜索任务记录和计划任务"""
+
+    @abstractmethod
+    def export_table(self, table: str, fmt: str = 'csv', filename: str = None,
+                     start: str = None, end: str = None) -> tuple:
+        """导出数据表，返回 (文件名, 行数)"""
+
+    def get_statistics(self) -> list:
+        """获取最近 30 天的每日统计"""
+        since = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+        return [
+            {
+                'date': row['bucket'],
+                'scheduled_minutes': row['scheduled_minutes'],
+                'actual_minutes': row['actual_minutes'],
+                'avg_focus_level': row['avg_focus_level'],
+                'task_count': row['task_count'],
+                'completion_rate': row['completion_rate'],
+            }
+            for row in self.get_rollups('day', since=since)
+        ]
+
+    def set_retention(self, days: int = None):
+        """设置历史保留天数（不支持归档的后端忽略）"""
+
+    def flush(self, timeout: float = None):
+        """等待已提交的写操作完成（同步写入的后端无需等待）"""
+
+    def schedule_backups(self, interval_hours: float = None, keep: int = None):
+        """启动或调整定时备份（没有持久化文件的后端忽略）"""
+
+    def set_query_profiling(self, enabled: bool = True, slow_ms: float = None):
+        """开关查询耗时记录并设置慢查询阈值（不执行 SQL 的后端忽略）"""
+
+    def get_query_report(self, limit: int = None) -> dict:
+        """查询耗时汇总和慢查询（不执行 SQL 的后端返回空报告）"""
+        return {'enabled': False, 'slow_ms': None, 'queries': [], 'slow_queries': []}
+
+    def get_query_totals(self) -> dict:
+        """当前线程累计执行的查询数与耗时（毫秒）"""
+        return {'count': 0, 'ms': 0.0}
+
+    def reset_query_stats(self):
+        """清空查询耗时汇总"""
+
+
+class SqliteStorage(StorageBackend):
+    """SQLite 后端 - 委托给 data_manager"""
+
+    name = "sqlite"
+
+    def __init__(self):
+        # 延迟导入：选择其他后端时不打开数据库文件
+        import data_manager
+        self._dm = data_manager
+
+    def use_profile(self, name: str = None) -> str:
+        name = self._dm.use_profile(name)
+        self._dm.init_database()
+        return name
+
+    def list_profiles(self) -> list:
+        return self._dm.list_user_profiles()
+
+    def save_plan(self, plan_data: dict, title: str = None) -> int:
+        return self._dm.save_plan(plan_data, title)
+
+    def update_plan_status(self, plan_id: int, status: str) -> Future:
+        return self._dm.update_plan_status(plan_id, status)
+
+    def get_plan_tasks(self, plan_id: int) -> list:
+        return self._dm.get_plan_tasks(plan_id)
+
+    def get_latest_plan(self):
+        return self._dm.get_latest_plan()
+
+    def get_today_plan(self):
+        return self._dm.get_today_plan()
+
+    def get_all_plans(self, limit: int = 30) -> list:
+        return self._dm.get_all_plans(limit)
+
+    def get_plan_summaries(self, limit: int = 30) -> list:
+        return self._dm.get_plan_summaries(limit)
+
+    def get_plans_page(self, cursor: tuple = None, page_size: int = 20, start: str = None,
+                       end: str = None, status: str = None) -> dict:
+        return self._dm.get_plans_page(cursor, page_size, start, end, status)
+
+    def save_task_record(self, plan_id: int, task_name: str, scheduled_min: int,
+                         actual_min: int, focus_level: int, completed: bool, notes: str = "",
+                         task_index: int = None) -> Future:
+        return self._dm.save_task_record(plan_id, task_name, scheduled_min, actual_min,
+                                         focus_level, completed, notes, task_index)
+
+    def get_plan_records(self, plan_id: int) -> list:
+        return self._dm.get_plan_records(plan_id)
+
+    def get_task_history(self, limit: int = 500) -> list:
+        return self._dm.get_task_history(limit)
+
+    def get_rollups(self, granularity: str = 'day', since: str = None, limit: int = None) -> list:
+        return self._dm.get_rollups(granularity, since, limit)
+
+    def get_estimation_report(self) -> dict:
+        return self._dm.get_estimation_report()
+
+    def search_tasks(self, query: str, limit: int = 20) -> list:
+        return self._dm.search(query, limit)
+
+    def export_table(self, table: str, fmt: str = 'csv', filename: str = None,
+                     start: str = None, end: str = None) -> tuple:
+        return self._dm.export_table(table, fmt, filename, start, end)
+
+    def set_retention(self, days: int = None):
+        self._dm.set_retention(days)
+
+    def flush(self, timeout: float = None):
+        self._dm.flush_writes(timeout)
+
+    def schedule_backups(self, interval_hours: float = None, keep: int = None):
+        self._dm.schedule_backups(interval_hours, keep or backup.DEFAULT_GENERATIONS)
+
+    def set_query_profiling(self, enabled: bool = True, slow_ms: float = None):
+        self._dm.set_query_profiling(enabled, slow_ms)
+
+    def get_query_report(self, limit: int = None) -> dict:
+        return self._dm.get_query_report(limit)
+
+    def get_query_totals(self) -> dict:
+        return self._dm.get_query_totals()
+
+    def reset_query_stats(self):
+        self._dm.reset_query_stats()
+
+
+def _completed_future(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class _MemoryData:
+    """一个用户档案的内存数据（字段与 SQLite 表一致）"""
+
+    def __init__(self):
+        self.plans = {}         # {id: plan}
+        self.plan_tasks = []    # 按 id 递增
+        self.task_records = []  # 按 id 递增
+        self.next_plan_id = 1
+        self.next_task_id = 1
+        self.next_record_id = 1
+
+
+class MemoryStorage(StorageBackend):
+    """纯内存后端 - 进程退出即丢失，读写都不经过磁盘"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._profiles = {DEFAULT_PROFILE: _MemoryData()}
+        self._local = threading.local()
+        self._lock = threading.RLock()
+
+    # ---------- 用户档案 ----------
+
+    def use_profile(self, name: str = None) -> str:
+        name = normalize_profile(name)
+        with self._lock:
+            self._profiles.setdefault(name, _MemoryData())
+        self._local.profile = name
+        return name
+
+    def list_profiles(self) -> list:
+        with self._lock:
+            names = sorted(n for n in self._profiles if n != DEFAULT_PROFILE)
+        return [DEFAULT_PROFILE] + names
+
+    def _data(self) -> _MemoryData:
+        return self._profiles[getattr(self._local, 'profile', DEFAULT_PROFILE)]
+
+    # ---------- 计划 ----------
+
+    def save_plan(self, plan_data: dict, title: str = None) -> int:
+        now = datetime.now()
+        with self._lock:
+            data = self._data()
+            plan_id = data.next_plan_id
+            data.next_plan_id += 1
+            data.plans[plan_id] = {
+                'id': plan_id,
+                'date': now.strftime("%Y-%m-%d"),
+                'title': title or "Daily Plan",
+                'total_minutes': plan_data.get('total_minutes', 0),
+                'status': 'in_progress',
+                'created_at': now.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            for position, task in enumerate(plan_data.get('tasks', [])):
+                (_, _, task_no, name, minutes, priority, focus, method,
+                 warning) = plan_task_row(plan_id, position, task)
+                data.plan_tasks.append({
+                    'id': data.next_task_id, 'plan_id': plan_id, 'position': position,
+                    'task_no': task_no, 'name': name, 'minutes': minutes,
+                    'priority': priority, 'focus': focus, 'method': method, 'warning': warning,
+                })
+                data.next_task_id += 1
+        return plan_id
+
+    def update_plan_status(self, plan_id: int, status: str) -> Future:
+        with self._lock:
+            plan = self._data().plans.get(plan_id)
+            if plan is not None:
+                plan['status'] = status
+        return _completed_future(None)
+
+    def get_plan_tasks(self, plan_id: int) -> list:
+        tasks = []
+        with self._lock:
+            rows = [t for t in self._data().plan_tasks if t['plan_id'] == plan_id]
+        for row in sorted(rows, key=lambda t: t['position']):
+            task = {
+                'id': row['task_no'],
+                'name': row['name'],
+                'minutes': row['minutes'],
+                'priority': row['priority'],
+                'focus': row['focus'],
+                'method': row['method'],
+                'warning': row['warning'],
+            }
+            tasks.append({k: v for k, v in task.items() if v is not None})
+        return tasks
+
+    def _plans_newest_first(self, date: str = None) -> list:
+        with self._lock:
+            plans = [p for p in self._data().plans.values() if date is None or p['date'] == date]
+        return sorted(plans, key=lambda p: (p['created_at'], p['id']), reverse=True)
+
+    def _with_tasks(self, plan):
+        if plan is None:
+            return None
+        return {
+            'id': plan['id'],
+            'date': plan['date'],
+            'total_minutes': plan['total_minutes'],
+            'tasks': self.get_plan_tasks(plan['id']),
+            'status': plan['status'],
+        }
+
+    def get_latest_plan(self):
+        plans = self._plans_newest_first()
+        return self._with_tasks(plans[0] if plans else None)
+
+    def get_today_plan(self):
+        plans = self._plans_newest_first(datetime.now().strftime("%Y-%m-%d"))
+        return self._with_tasks(plans[0] if plans else None)
+
+    def get_all_plans(self, limit: int = 30) -> list:
+        return [
+            {k: p[k] for k in ('id', 'date', 'total_minutes', 'status', 'created_at')}
+            for p in self._plans_newest_first()[:limit]
+        ]
+
+    def get_plan_summaries(self, limit: int = 30) -> list:
+        return self._summaries(self._plans_newest_first()[:limit])
+
+    def get_plans_page(self, cursor: tuple = None, page_size: int = 20, start: str = None,
+                       end: str = None, status: str = None) -> dict:
+        plans = [
+            p for p in self._plans_newest_first()
+            if (cursor is None or (p['created_at'], p['id']) < tuple(cursor))
+            and (start is None or p['date'] >= start)
+            and (end is None or p['date'] <= end)
+            and (status is None or p['status'] == status)
+        ]
+        next_cursor = None
+        if len(plans) > page_size:
+            next_cursor = (plans[page_size - 1]['created_at'], plans[page_size - 1]['id'])
+        return {'plans': self._summaries(plans[:page_size]), 'next_cursor': next_cursor}
+
+    def _summaries(self, plans: list) -> list:
+        totals = {p['id']: [0, 0, 0, 0] for p in plans}
+        with self._lock:
+            for record in self._data().task_records:
+                total = totals.get(record['plan_id'])
+                if total is not None:
+                    total[0] += 1
+                    total[1] += 1 if record['completed'] == 1 else 0
+                    total[2] += record['scheduled_minutes'] or 0
+                    total[3] += record['actual_minutes'] or 0
+        summaries = []
+        for plan in plans:
+            task_count, completed_count, scheduled, actual = totals[plan['id']]
+            summaries.append({
+                'id': plan['id'],
+                'date': plan['date'],
+                'total_minutes': plan['total_minutes'],
+                'status': plan['status'],
+                'created_at': plan['created_at'],
+                'task_count': task_count,
+                'completed_count': completed_count,
+                'scheduled_minutes': scheduled,
+                'actual_minutes': actual,
+            })
+        return summaries
+
+    # ---------- 任务记录 ----------
+
+    def save_task_record(self, plan_id: int, task_name: str, scheduled_min: int,
+                         actual_min: int, focus_level: int, completed: bool, notes: str = "",
+                         task_index: int = None) -> Future:
+        completed_at = str(datetime.now()) if completed else None
+        with self._lock:
+            data = self._data()
+            plan_task_id = next((t['id'] for t in data.plan_tasks
+                                 if t['plan_id'] == plan_id and t['position'] == task_index), None)
+            record_id = data.next_record_id
+            data.next_record_id += 1
+            data.task_records.append({
+                'id': record_id,
+                'plan_id': plan_id,
+                'plan_task_id': plan_task_id,
+                'task_name': task_name,
+                'scheduled_minutes': scheduled_min,
+                'actual_minutes': actual_min,
+                'focus_level': focus_level,
+                'completed': int(bool(completed)),
+                'completed_at': completed_at,
+                'notes': notes,
+            })
+        return _completed_future(record_id)
+
+    def get_plan_records(self, plan_id: int) -> list:
+        with self._lock:
+            records = [r for r in self._data().task_records if r['plan_id'] == plan_id]
+        return [
+            {
+                'task_name': r['task_name'],
+                'scheduled_minutes': r['scheduled_minutes'],
+                'actual_minutes': r['actual_minutes'],
+                'focus_level': r['focus_level'],
+                'completed': r['completed'],
+                'notes': r['notes'],
+            }
+            for r in records
+        ]
+
+    def get_task_history(self, limit: int = 500) -> list:
+        with self._lock:
+            data = self._data()
+            priorities = {t['id']: t['priority'] for t in data.plan_tasks}
+            records = data.task_records[::-1][:limit]
+            return [
+                {
+                    'plan_id': r['plan_id'],
+                    'task_name': r['task_name'],
+                    'scheduled_minutes': r['scheduled_minutes'],
+                    'actual_minutes': r['actual_minutes'],
+                    'focus_level': r['focus_level'],
+                    'completed': r['completed'],
+                    'priority': priorities.get(r['plan_task_id']),
+                }
+                for r in records
+            ]
+
+    # ---------- 统计、搜索与导出 ----------
+
+    def _rollup_totals(self) -> dict:
+        """按粒度和桶聚合全部计划和记录，字段与 rollups 表一致"""
+        totals = {}
+
+        def bucket(day):
+            for granularity, key in rollups.bucket_keys(day).items():
+                yield totals.setdefault((granularity, key), {
+                    'scheduled_minutes': 0, 'actual_minutes': 0,
+                    'focus_sum': 0, 'focus_count': 0,
+                    'task_count': 0, 'completed_count': 0,
+                    'plan_count': 0, 'completed_plan_count': 0,
+                })
+
+        with self._lock:
+            data = self._data()
+            for plan in data.plans.values():
+                for b in bucket(plan['date']):
+                    b['plan_count'] += 1
+                    b['completed_plan_count'] += 1 if plan['status'] == 'completed' else 0
+            for record in data.task_records:
+                plan = data.plans.get(record['plan_id'])
+                if plan is None:
+                    continue
+                for b in bucket(plan['date']):
+                    b['scheduled_minutes'] += record['scheduled_minutes'] or 0
+                    b['actual_minutes'] += record['actual_minutes'] or 0
+                    if record['focus_level'] is not None:
+                        b['focus_sum'] += record['focus_level']
+                        b['focus_count'] += 1
+                    b['task_count'] += 1
+                    b['completed_count'] += 1 if record['completed'] == 1 else 0
+        return totals
+
+    def get_rollups(self, granularity: str = 'day', since: str = None, limit: int = None) -> list:
+        if granularity not in rollups.GRANULARITIES:
+            raise ValueError(f"未知的汇总粒度: {granularity}")
+
+        start = rollups.bucket_keys(since)[granularity] if since else None
+        rows = sorted(
+            ((key, values) for (g, key), values in self._rollup_totals().items()
+             if g == granularity and values['task_count'] > 0 and (start is None or key >= start)),
+            key=lambda item: item[0], reverse=True,
+        )
+        data = []
+        for key, v in rows[:limit] if limit else rows:
+            data.append({
+                'bucket': key,
+                'scheduled_minutes': v['scheduled_minutes'],
+                'actual_minutes': v['actual_minutes'],
+                'avg_focus_level': (v['focus_sum'] / v['focus_count']) if v['focus_count'] > 0 else 0,
+                'task_count': v['task_count'],
+                'completion_rate': v['completed_count'] / v['task_count'] * 100,
+                'plan_count': v['plan_count'],
+                'completed_plan_count': v['completed_plan_count'],
+            })
+        return data
+
+    def get_estimation_report(self) -> dict:
+        with self._lock:
+            data = self._data()
+            priorities = {t['id']: t['priority'] for t in data.plan_tasks}
+            rows = [
+                {
+                    'id': r['id'],
+                    'date': data.plans[r['plan_id']]['date'],
+                    'scheduled_minutes': r['scheduled_minutes'],
+                    'actual_minutes': r['actual_minutes'],
+                    'focus_level': r['focus_level'],
+                    'completed': r['completed'],
+                    'priority': priorities.get(r['plan_task_id']),
+                }
+                for r in data.task_records if r['plan_id'] in data.plans
+            ]
+        columns = ['id', 'date', 'scheduled_minutes', 'actual_minutes', 'focus_level',
+                   'completed', 'priority']
+        return analytics.compute_report(pd.DataFrame(rows, columns=columns))
+
+    def search_tasks(self, query: str, limit: int = 20, highlight=('**', '**')) -> list:
+        """按子串匹配（不区分大小写，多个词需全部出现），任务名命中的权重高于备注 / 方法"""
+        terms = [t.casefold() for t in query.split()]
+        if not terms:
+            return []
+        pattern = re.compile("|".join(re.escape(t) for t in query.split()), re.IGNORECASE)
+
+        def mark(text):
+            return pattern.sub(lambda m: highlight[0] + m.group(0) + highlight[1], text)
+
+        with self._lock:
+            data = self._data()
+            sources = [('record', r['id'], r['plan_id'], r['task_name'], r['notes'])
+                       for r in data.task_records]
+            sources += [('task', t['id'], t['plan_id'], t['name'], t['method'])
+                        for t in data.plan_tasks]
+            dates = {plan_id: plan['date'] for plan_id, plan in data.plans.items()}
+
+        results = []
+        for kind, source_id, plan_id, title, body in sources:
+            title, body = title or "", body or ""
+            title_folded, body_folded = title.casefold(), body.casefold()
+            if not all(t in title_folded or t in body_folded for t in terms):
+                continue
+            score = sum(5 * title_folded.count(t) + body_folded.count(t) for t in terms)
+            results.append({
+                'kind': kind,
+                'id': source_id,
+                'plan_id': plan_id,
+                'date': dates.get(plan_id),
+                'archived': False,
+                'title': mark(title),
+                'snippet': mark(body),
+                'score': float(score),
+            })
+        results.sort(key=lambda r: r['score'], reverse=True)
+        return results[:limit]
+
+    def _export_rows(self, table: str, start: str = None, end: str = None) -> list:
+        """按 exporter.EXPORT_TABLES 的列顺序生成导出行"""
+        if table == 'rollups':
+            bounds = {g: (rollups.bucket_keys(start)[g] if start else None,
+                          rollups.bucket_keys(end)[g] if end else None)
+                      for g in rollups.GRANULARITIES}
+            rows = []
+            for (g, key), v in sorted(self._rollup_totals().items()):
+                low, high = bounds[g]
+                if (low is None or key >= low) and (high is None or key <= high):
+                    rows.append((g, key, v['scheduled_minutes'], v['actual_minutes'],
+                                 v['focus_sum'], v['focus_count'], v['task_count'],
+                                 v['completed_count'], v['plan_count'], v['completed_plan_count']))
+            return rows
+
+        def in_range(day):
+            return (start is None or day >= start) and (end is None or day <= end)
+
+        with self._lock:
+            data = self._data()
+            if table == 'plans':
+                return [(p['id'], p['date'], p['title'], p['total_minutes'], p['status'],
+                         p['created_at'])
+                        for p in sorted(data.plans.values(), key=lambda p: p['id'])
+                        if in_range(p['date'])]
+            if table == 'tasks':
+                return [(t['id'], t['plan_id'], data.plans[t['plan_id']]['date'], t['position'],
+                         t['task_no'], t['name'], t['minutes'], t['priority'], t['focus'],
+                         t['method'], t['warning'])
+                        for t in data.plan_tasks
+                        if t['plan_id'] in data.plans and in_range(data.plans[t['plan_id']]['date'])]
+            return [(r['id'], r['plan_id'], r['plan_task_id'], data.plans[r['plan_id']]['date'],
+                     r['task_name'], r['scheduled_minutes'], r['actual_minutes'],
+                     r['focus_level'], r['completed'], r['completed_at'], r['notes'])
+                    for r in data.task_records
+                    if r['plan_id'] in data.plans and in_range(data.plans[r['plan_id']]['date'])]
+
+    def export_table(self, table: str, fmt: str = 'csv', filename: str = None,
+                     start: str = None, end: str = None) -> tuple:
+        if table not in exporter.EXPORT_TABLES:
+            raise ValueError(f"未知的导出表: {table}")
+        if filename is None:
+            filename = exporter.default_filename(table, fmt, start, end)
+        rows = self._export_rows(table, start, end)
+        count = exporter.write_rows(fmt, filename, exporter.EXPORT_TABLES[table][1], [rows])
+        return filename, count
+
+
+BACKENDS = {
+    SqliteStorage.name: SqliteStorage,
+    MemoryStorage.name: MemoryStorage,
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_storage(name: str = None) -> StorageBackend:
+    """按名称获取存储后端（进程内单例，Streamlit 各会话和 rerun 共享同一份数据）"""
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"未知的存储后端: {name}（可选: {', '.join(BACKENDS)}）")
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = BACKENDS[name]()
+        return _instances[name]
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 流式计划解析模块
+逐段读取 AI 流式返回的计划 JSON，"tasks" 数组中的每个任务对象一闭合就解析出来，
+页面可以边生成边显示任务卡片；整体 JSON 损坏（截断、多余文字、个别任务格式错误）时
+仍能用已解析出的任务拼出可用的计划
+"""
+
+import json
+import re
+
+_TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+
+
+def strip_fences(text: str) -> str:
+    """去掉 AI 可能包裹的 ``` 代码块标记"""
+    cleaned = text.strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.split("\n", 1)[1] if "\n" in cleaned else ""
+    if cleaned.endswith("```"):
+        cleaned = cleaned.rsplit("```", 1)[0]
+    return cleaned.strip()
+
+
+def _loads_lenient(text: str):
+    """json.loads，失败时去掉多余的尾逗号再试一次"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json.loads(_TRAILING_COMMA_RE.sub(r'\1', text))
+
+
+def _valid_task(task) -> bool:
+    """任务至少要有名称和正的分钟数；分钟数统一转为整数（AI 有时返回字符串）"""
+    if not isinstance(task, dict) or not task.get('name'):
+        return False
+    try:
+        minutes = int(round(float(task.get('minutes'))))
+    except (TypeError, ValueError):
+        return False
+    task['minutes'] = minutes
+    return minutes > 0
+
+
+class PlanStreamParser:
+    """
+    增量解析计划 JSON
+
+    feed(文本片段) 返回本片段中新闭合的任务；全部输入后用 result() 得到完整计划
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.tasks = []
+        self.errors = 0
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None        # 根对象中最近读到的字符串（可能是键）
+        self._last_key_end = None
+        self._tasks_depth = None     # "tasks" 数组内部的层级
+        self._task_start = None
+        self._done = False           # 根对象已闭合
+
+    def feed(self, chunk: str) -> list:
+        """追加一段文本，返回其中新闭合的任务"""
+        self.text += chunk
+        new_tasks = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            if self._done:
+                break
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = text[self._string_start + 1:i]
+                        self._last_key_end = i + 1
+                continue
+            if self._depth == 0 and ch != '{':
+                # 根对象之前的 ``` 标记或说明文字
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in '{[':
+                if ch == '[' and self._depth == 1 and self._last_key == 'tasks' \
+                        and text[self._last_key_end:i].strip() == ':':
+                    self._tasks_depth = 2
+                elif ch == '{' and self._tasks_depth is not None and self._depth == self._tasks_depth:
+                    self._task_start = i
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if ch == '}' and self._task_start is not None and self._depth == self._tasks_depth:
+                    task = self._parse_task(text[self._task_start:i + 1])
+                    self._task_start = None
+                    if task is not None:
+                        self.tasks.append(task)
+                        new_tasks.append(task)
+                elif ch == ']' and self._tasks_depth is not None and self._depth == 1:
+                    self._tasks_depth = None
+                if self._depth <= 0:
+                    self._done = True
+        self._pos = len(text)
+        return new_tasks
+
+    def _parse_task(self, fragment: str):
+        try:
+            task = _loads_lenient(fragment)
+        except ValueError:
+            self.errors += 1
+            return None
+        if not _valid_task(task):
+            self.errors += 1
+            return None
+        return task
+
+    def _field(self, name: str):
+        """从损坏的 JSON 中尽量取出根对象的简单字段"""
+        match = re.search(r'"%s"\s*:\s*("(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?)' % re.escape(name), self.text)
+        if not match:
+            return None
+        try:
+            return json.loads(match.group(1))
+        except ValueError:
+            return None
+
+    def result(self) -> dict:
+        """
+        完整计划；整体 JSON 无法解析时用已闭合的任务拼出计划（总时长按任务求和）
+
+        一个有效任务都没有时抛出 ValueError
+        """
+        try:
+            plan = _loads_lenient(strip_fences(self.text))
+        except ValueError:
+            plan = None
+        if isinstance(plan, dict) and isinstance(plan.get('tasks'), list):
+            tasks = [task for task in plan['tasks'] if _valid_task(task)]
+            if tasks:
+                plan['tasks'] = tasks
+                plan.setdefault('total_minutes', sum(t['minutes'] for t in tasks))
+                return plan
+
+        if not self.tasks:
+            raise ValueError("AI 返回的内容中没有可用的任务")
+        plan = {
+            'total_minutes': sum(task['minutes'] for task in self.tasks),
+            'tasks': self.tasks,
+        }
+        for name in ('motivation', 'tips'):
+            value = self._field(name)
+            if isinstance(value, str):
+                plan[name] = value
+        return plan
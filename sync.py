@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+执剑人系统 - 增量同步模块
+触发器把 plans / plan_tasks / task_records 的新增和修改记入 changelog，
+导出时只打包上次同步之后变化的行（gzip 压缩的 JSON Lines），导入时按全局 uid 合并、按 updated_at 以后写为准
+
+各机器的自增 id 会冲突，行之间用随机 uid 对应，外键在变更文件中也换成 uid；
+删除（归档）不同步，每台机器各自按保留期归档
+"""
+
+import gzip
+import json
+import os
+import sqlite3
+import uuid
+from datetime import datetime
+
+FORMAT = "wallfacer-changeset"
+FORMAT_VERSION = 1
+DEFAULT_PEER = "default"
+
+# 按依赖顺序：父表在前，导入子表时父行已存在
+# columns 为原样同步的列；refs 为外键列 -> 被引用的表，变更文件中改为 <名称>_uid
+SYNC_TABLES = {
+    'plans': {
+        'columns': ('date', 'title', 'total_minutes', 'tasks_json', 'status', 'created_at'),
+        'refs': {},
+    },
+    'plan_tasks': {
+        'columns': ('position', 'task_no', 'name', 'minutes', 'priority', 'focus', 'method', 'warning'),
+        'refs': {'plan_id': 'plans'},
+    },
+    'task_records': {
+        'columns': ('task_name', 'scheduled_minutes', 'actual_minutes', 'focus_level',
+                    'completed', 'completed_at', 'notes'),
+        'refs': {'plan_id': 'plans', 'plan_task_id': 'plan_tasks'},
+    },
+}
+
+# 没有这些外键的行无法落库（任务记录的 plan_task_id 可以为空）
+_REQUIRED_REFS = {'plan_id'}
+
+# 旧数据回填 uid / updated_at 时使用的确定性来源：整库复制到多台机器的同一行会得到相同的 uid
+_LEGACY_KEYS = {
+    'plans': "SELECT id, created_at, date, created_at FROM plans",
+    'plan_tasks': '''
+        SELECT pt.id, p.created_at, pt.position || ':' || pt.name, p.created_at
+        FROM plan_tasks pt LEFT JOIN plans p ON p.id = pt.plan_id
+    ''',
+    'task_records': '''
+        SELECT tr.id, p.created_at, tr.task_name || ':' || COALESCE(tr.completed_at, ''), p.created_at
+        FROM task_records tr LEFT JOIN plans p ON p.id = tr.plan_id
+    ''',
+}
+
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+def _ref_key(column: str) -> str:
+    """外键列在变更文件中的名称：plan_id -> plan_uid"""
+    return column[:-3] + "_uid"
+
+
+def _triggers(table: str) -> list:
+    return [
+        # 新行补上 uid 和 updated_at（导入的行自带），并记入变更日志
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_sync_insert
+            AFTER INSERT ON {table} BEGIN
+                UPDATE {table}
+                SET uid = COALESCE(new.uid, lower(hex(randomblob(16)))),
+                    updated_at = COALESCE(new.updated_at, {_NOW})
+                WHERE id = new.id AND (new.uid IS NULL OR new.updated_at IS NULL);
+                INSERT OR REPLACE INTO changelog (tbl, uid)
+                SELECT '{table}', uid FROM {table} WHERE id = new.id;
+            END
+        ''',
+        # 修改时刷新 updated_at（导入时显式设置了新的 updated_at 则保留）；
+        # old.uid 为空说明是上面的插入触发器在补 uid，跳过
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_sync_update
+            AFTER UPDATE ON {table} WHEN old.uid IS NOT NULL BEGIN
+                UPDATE {table} SET updated_at = {_NOW}
+                WHERE id = new.id AND new.updated_at IS old.updated_at;
+                INSERT OR REPLACE INTO changelog (tbl, uid) VALUES ('{table}', new.uid);
+            END
+        ''',
+        # 删除（归档）不同步，只清理变更日志
+        f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_sync_delete
+            AFTER DELETE ON {table} BEGIN
+                DELETE FROM changelog WHERE tbl = '{table}' AND uid = old.uid;
+            END
+        ''',
+    ]
+
+
+def create_schema(cursor):
+    """添加 uid / updated_at 列、变更日志和同步状态表，回填已有数据并创建触发器"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS changelog (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            uid TEXT NOT NULL,
+            origin TEXT,
+            UNIQUE (tbl, uid)
+        )
+    ''')
+    # 增量导出按 (表, seq) 范围扫描
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_changelog_tbl_seq ON changelog (tbl, seq)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            peer TEXT PRIMARY KEY,
+            node_id TEXT,
+            sent_seq INTEGER NOT NULL DEFAULT 0,
+            received_seq INTEGER NOT NULL DEFAULT 0,
+            last_export TEXT,
+            last_import TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO sync_meta (key, value) VALUES ('node_id', ?)",
+                   (uuid.uuid4().hex[:16],))
+
+    for table, legacy_sql in _LEGACY_KEYS.items():
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN uid TEXT")
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN updated_at TEXT")
+        rows = [
+            (uuid.uuid5(uuid.NAMESPACE_URL, f"wallfacer:{table}:{row_id}:{created}:{key}").hex,
+             updated or '1970-01-01 00:00:00', row_id)
+            for row_id, created, key, updated in cursor.execute(legacy_sql).fetchall()
+        ]
+        cursor.executemany(f"UPDATE {table} SET uid = ?, updated_at = ? WHERE id = ?", rows)
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_uid ON {table} (uid)")
+        # 已有数据全部记入变更日志，第一次同步即完整导出
+        cursor.execute(f"INSERT INTO changelog (tbl, uid) SELECT '{table}', uid FROM {table} ORDER BY id")
+        for trigger_sql in _triggers(table):
+            cursor.execute(trigger_sql)
+
+
+def node_id(conn) -> str:
+    """本库的节点 id（写入变更文件，用于识别来源）"""
+    return conn.execute("SELECT value FROM sync_meta WHERE key = 'node_id'").fetchone()[0]
+
+
+def _peer_state(cursor, peer: str) -> dict:
+    row = cursor.execute('''
+        SELECT node_id, sent_seq, received_seq, last_export, last_import FROM sync_state WHERE peer = ?
+    ''', (peer,)).fetchone()
+    keys = ('node_id', 'sent_seq', 'received_seq', 'last_export', 'last_import')
+    return dict(zip(keys, row)) if row else dict(zip(keys, (None, 0, 0, None, None)))
+
+
+def list_peers(conn) -> list:
+    """各同步对象的状态"""
+    cursor = conn.execute('''
+        SELECT peer, node_id, sent_seq, received_seq, last_export, last_import
+        FROM sync_state ORDER BY peer
+    ''')
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _export_rows(cursor, table: str, since: int, exclude_origin: str):
+    """某张表自 since 之后变化的行（外键换成 uid）"""
+    spec = SYNC_TABLES[table]
+    select = ["t.uid", "t.updated_at"] + [f"t.{c}" for c in spec['columns']]
+    joins = []
+    for i, (column, parent) in enumerate(spec['refs'].items()):
+        select.append(f"r{i}.uid")
+        joins.append(f"LEFT JOIN {parent} r{i} ON r{i}.id = t.{column}")
+    keys = ['uid', 'updated_at'] + list(spec['columns']) + [_ref_key(c) for c in spec['refs']]
+
+    cursor.execute(f'''
+        SELECT {", ".join(select)}
+        FROM changelog c
+        JOIN {table} t ON t.uid = c.uid
+        {" ".join(joins)}
+        WHERE c.tbl = ? AND c.seq > ? AND (c.origin IS NULL OR c.origin != ?)
+        ORDER BY c.seq
+    ''', (table, since, exclude_origin or ''))
+    for row in cursor:
+        yield dict(zip(keys, row))
+
+
+def export_changes(cursor, path: str, peer: str = DEFAULT_PEER, full: bool = False) -> dict:
+    """
+    把上次导出给 peer 之后的变更写入 path（gzip JSON Lines），并记下导出位置（在写线程的事务内执行）
+
+    full 为 True 时导出全部数据；从 peer 导入的变更不会再发回给它。返回各表行数和文件大小
+    """
+    state = _peer_state(cursor, peer)
+    since = 0 if full else state['sent_seq']
+    until = cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM changelog").fetchone()[0]
+
+    stats = {table: 0 for table in SYNC_TABLES}
+    header = {
+        'format': FORMAT,
+        'version': FORMAT_VERSION,
+        'node_id': node_id(cursor.connection),
+        'since': since,
+        'until': until,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for table in SYNC_TABLES:
+            for row in _export_rows(cursor.connection.cursor(), table, since, state['node_id']):
+                f.write(json.dumps({'table': table, 'row': row}, ensure_ascii=False) + "\n")
+                stats[table] += 1
+    os.replace(tmp_path, path)
+
+    cursor.execute(f'''
+        INSERT INTO sync_state (peer, sent_seq, last_export) VALUES (?, ?, {_NOW})
+        ON CONFLICT (peer) DO UPDATE SET sent_seq = excluded.sent_seq, last_export = excluded.last_export
+    ''', (peer, until))
+    stats.update(since=since, until=until, bytes=os.path.getsize(path))
+    return stats
+
+
+def read_changeset(path: str):
+    """读取变更文件，返回 (文件头, 逐行产出 (表, 行) 的迭代器)"""
+    f = gzip.open(path, 'rt', encoding='utf-8')
+    try:
+        header = json.loads(f.readline() or 'null')
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get('format') != FORMAT:
+        f.close()
+        raise ValueError(f"不是有效的同步文件: {path}")
+    if header.get('version', 0) > FORMAT_VERSION:
+        f.close()
+        raise ValueError(f"同步文件版本 {header['version']} 过新，请先升级程序")
+
+    def entries():
+        with f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    if entry.get('table') in SYNC_TABLES:
+                        yield entry['table'], entry['row']
+
+    return header, entries()
+
+
+def _apply_row(cursor, table: str, row: dict, archived: set) -> str:
+    """
+    合并一行，返回结果：inserted / updated / skipped（本地较新或相同）/
+    missing（缺少父行或已归档）/ conflicts（与本地另一行的唯一约束冲突）
+    """
+    spec = SYNC_TABLES[table]
+    values = {c: row.get(c) for c in spec['columns']}
+    for column, parent in spec['refs'].items():
+        parent_uid = row.get(_ref_key(column))
+        found = cursor.execute(f"SELECT id FROM {parent} WHERE uid = ?", (parent_uid,)).fetchone()
+        if found is None and column in _REQUIRED_REFS:
+            return 'missing'
+        values[column] = found[0] if found else None
+
+    local = cursor.execute(f"SELECT id, updated_at FROM {table} WHERE uid = ?", (row['uid'],)).fetchone()
+    if local is None:
+        if row['uid'] in archived:
+            return 'missing'
+        columns = ['uid', 'updated_at'] + list(values)
+        try:
+            cursor.execute(f'''
+                INSERT INTO {table} ({", ".join(columns)})
+                VALUES ({", ".join("?" for _ in columns)})
+            ''', [row['uid'], row['updated_at']] + list(values.values()))
+        except sqlite3.IntegrityError:
+            return 'conflicts'
+        return 'inserted'
+
+    local_id, local_updated = local
+    if (row['updated_at'] or '') <= (local_updated or ''):
+        return 'skipped'
+    assignments = ", ".join(f"{c} = ?" for c in values)
+    cursor.execute(f"UPDATE {table} SET updated_at = ?, {assignments} WHERE id = ?",
+                   [row['updated_at']] + list(values.values()) + [local_id])
+    return 'updated'
+
+
+def import_changes(conn, path: str, peer: str = DEFAULT_PEER, schemas=('main',),
+                   rebuild_rollups=None) -> dict:
+    """
+    合并变更文件（需在事务外调用，整个文件在一个事务内导入）
+
+    同一行以 updated_at 较新的一方为准；schemas 含 'archive' 时已归档的行不会被重新导入；
+    有数据变化时调用 rebuild_rollups(cursor) 重建汇总。返回各结果的行数
+    """
+    header, entries = read_changeset(path)
+    cursor = conn.cursor()
+    if header['node_id'] == node_id(conn):
+        raise ValueError("这是本库自己导出的同步文件")
+
+    archived = {table: set() for table in SYNC_TABLES}
+    if 'archive' in schemas:
+        for table in SYNC_TABLES:
+            archived[table] = {uid for (uid,) in cursor.execute(f"SELECT uid FROM archive.{table}")}
+
+    stats = {'inserted': 0, 'updated': 0, 'skipped': 0, 'missing': 0, 'conflicts': 0}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        state = _peer_state(cursor, peer)
+        seq_before = cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM changelog").fetchone()[0]
+        for table, row in entries:
+            stats[_apply_row(cursor, table, row, archived[table])] += 1
+
+        # 刚导入的变更标记来源，导出给同一对象时不再发回
+        cursor.execute("UPDATE changelog SET origin = ? WHERE seq > ?", (header['node_id'], seq_before))
+        cursor.execute(f'''
+            INSERT INTO sync_state (peer, node_id, received_seq, last_import) VALUES (?, ?, ?, {_NOW})
+            ON CONFLICT (peer) DO UPDATE SET
+                node_id = excluded.node_id,
+                received_seq = MAX(received_seq, excluded.received_seq),
+                last_import = excluded.last_import
+        ''', (peer, header['node_id'], header['until']))
+        if (stats['inserted'] or stats['updated']) and rebuild_rollups is not None:
+            rebuild_rollups(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # 对方这次导出的起点晚于我们已收到的位置，说明中间漏导入了变更文件
+    received = state['received_seq'] if state['node_id'] == header['node_id'] else 0
+    stats['gap'] = header['since'] > received
+    stats.update(node_id=header['node_id'], since=header['since'], until=header['until'])
+    return stats